@@ -0,0 +1,236 @@
+"""
+Command line tool filling the local databases with the klines of a set of trading pairs over a date range:
+
+    cryptoprice-backfill --pairs BTC/USDT ETH/BTC --timeframes m1 h1 --start 2021-01-01 --end 2021-02-01
+
+The range of each trading pair is fetched page by page, each page being saved with its covered range. The covered
+ranges act as checkpoints: a run that crashed or was killed resumes at the first page not saved.
+"""
+import argparse
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple, Dict
+
+from CryptoPrice.common.trade import TradingPair
+from CryptoPrice.retrievers.BinanceRetriever import BinanceRetriever
+from CryptoPrice.retrievers.KlineRetriever import KlineRetriever
+from CryptoPrice.retrievers.KucoinRetriever import KucoinRetriever
+from CryptoPrice.utils.LoggerGenerator import LoggerGenerator
+from CryptoPrice.utils.RateLimiter import RateLimiter
+from CryptoPrice.utils.time import TIMEFRAME
+
+Page = Tuple[KlineRetriever, str, str, TIMEFRAME, int, int]  # retriever, asset, ref_asset, timeframe, start, end
+
+
+@dataclass
+class BackfillProgress:
+    """
+    Progress of a backfill
+    """
+    total_pages: int = 0
+    skipped_pages: int = 0  # pages already saved by a previous run
+    done_pages: int = 0
+    n_klines: int = 0
+    start_time: float = 0.
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start_time
+
+    @property
+    def klines_per_second(self) -> float:
+        return self.n_klines / max(self.elapsed, 1e-9)
+
+    @property
+    def api_calls_per_second(self) -> float:
+        return self.done_pages / max(self.elapsed, 1e-9)
+
+    @property
+    def eta(self) -> Optional[float]:
+        """
+        estimated time in seconds before the end of the backfill, None if unknown
+        """
+        if not self.done_pages:
+            return None
+        remaining_pages = self.total_pages - self.skipped_pages - self.done_pages
+        return remaining_pages / self.api_calls_per_second
+
+    def __str__(self) -> str:
+        eta = '?' if self.eta is None else str(datetime.timedelta(seconds=int(self.eta)))
+        return f"{self.skipped_pages + self.done_pages}/{self.total_pages} pages, {self.n_klines} klines, " \
+               f"{self.klines_per_second:.0f} klines/s, {self.api_calls_per_second:.1f} API calls/s, ETA {eta}"
+
+
+class Backfiller:
+    """
+    This class fetches the klines of a set of trading pairs and timeframes over a time range and saves them in the
+    databases of the retrievers. The API requests are made by parallel workers, under the rate limiters of the
+    retrievers, while the databases are written by the calling thread.
+    """
+
+    def __init__(self, retrievers: List[KlineRetriever], max_workers: int = 4, progress_interval: float = 10.,
+                 on_progress: Optional[Callable[[BackfillProgress], None]] = None):
+        """
+        Instantiate a backfiller
+
+        :param retrievers: retrievers to fetch the klines with, a pair is fetched on the first retriever supporting it
+        :type retrievers: List[KlineRetriever]
+        :param max_workers: number of API requests made in parallel
+        :type max_workers: int
+        :param progress_interval: time in seconds between two progress reports
+        :type progress_interval: float
+        :param on_progress: function called with the progress at each report, default to logging it
+        :type on_progress: Optional[Callable[[BackfillProgress], None]]
+        """
+        self.retrievers = retrievers
+        self.max_workers = max_workers
+        self.progress_interval = progress_interval
+        self.logger = LoggerGenerator.get_logger("backfill")
+        self.on_progress = on_progress or (lambda progress: self.logger.info("%s", progress))
+
+    def get_pages(self, pairs: List[Tuple[str, str]], timeframes: List[TIMEFRAME], start_time: int,
+                  end_time: int) -> Tuple[List[Page], int]:
+        """
+        Split the work into pages of one API request, and drop the pages already covered by the databases
+
+        :param pairs: trading pairs as (asset, ref_asset)
+        :type pairs: List[Tuple[str, str]]
+        :param timeframes: timeframes to fetch
+        :type timeframes: List[TIMEFRAME]
+        :param start_time: start of the time range (included)
+        :type start_time: int
+        :param end_time: end of the time range (excluded)
+        :type end_time: int
+        :return: the pages to fetch and the number of pages already covered
+        :rtype: Tuple[List[Tuple[KlineRetriever, str, str, TIMEFRAME, int, int]], int]
+        """
+        pages, n_covered = [], 0
+        for asset, ref_asset in pairs:
+            trading_pair = TradingPair('', asset, ref_asset, '')
+            try:
+                retriever = next(r for r in self.retrievers if trading_pair in r.supported_pairs)
+            except StopIteration:
+                self.logger.warning("no retriever supports the trading pair %s %s, it is skipped", asset, ref_asset)
+                continue
+            for timeframe in timeframes:
+                page_duration = retriever.max_klines_per_request * timeframe.value * 60
+                for page_start_time in range(start_time, end_time, page_duration):
+                    page_end_time = min(page_start_time + page_duration, end_time)
+                    if retriever.db.is_range_covered(asset, ref_asset, timeframe, page_start_time, page_end_time) \
+                            or retriever.is_outside_listing(asset, ref_asset, timeframe, page_start_time,
+                                                            page_end_time):
+                        n_covered += 1
+                    else:
+                        pages.append((retriever, asset, ref_asset, timeframe, page_start_time, page_end_time))
+        return pages, n_covered
+
+    def run(self, pairs: List[Tuple[str, str]], timeframes: List[TIMEFRAME], start_time: int,
+            end_time: int) -> BackfillProgress:
+        """
+        Fetch and save the klines of the trading pairs for each timeframe in the range [start_time, end_time)
+
+        :param pairs: trading pairs as (asset, ref_asset)
+        :type pairs: List[Tuple[str, str]]
+        :param timeframes: timeframes to fetch
+        :type timeframes: List[TIMEFRAME]
+        :param start_time: start of the time range (included)
+        :type start_time: int
+        :param end_time: end of the time range (excluded)
+        :type end_time: int
+        :return: the final progress
+        :rtype: BackfillProgress
+        """
+        pages, n_covered = self.get_pages(pairs, timeframes, start_time, end_time)
+        progress = BackfillProgress(total_pages=len(pages) + n_covered, skipped_pages=n_covered,
+                                    start_time=time.monotonic())
+        if n_covered:
+            self.logger.info("resuming: %s pages out of %s are already saved", n_covered, progress.total_pages)
+
+        def fetch(page: Page):
+            retriever, asset, ref_asset, timeframe, page_start_time, page_end_time = page
+            return retriever.get_klines_online(asset, ref_asset, timeframe, page_start_time, page_end_time - 1)
+
+        last_report = time.monotonic()
+        in_flight: Dict[int, Future] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            next_page = 0
+            # pages are saved in order, with a bounded number of requests in flight
+            for page_index, page in enumerate(pages):
+                while next_page < len(pages) and next_page < page_index + 2 * self.max_workers:
+                    in_flight[next_page] = executor.submit(fetch, pages[next_page])
+                    next_page += 1
+                klines = in_flight.pop(page_index).result()
+                retriever, asset, ref_asset, timeframe, page_start_time, page_end_time = page
+                retriever.save_fetched_klines(asset, ref_asset, timeframe, klines, page_start_time, page_end_time)
+                retriever.db.commit()
+                progress.done_pages += 1
+                progress.n_klines += len(klines)
+                if page_index + 1 < len(pages) and time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    self.on_progress(progress)
+        self.on_progress(progress)
+        return progress
+
+
+def parse_time(value: str) -> int:
+    """
+    Parse a date (YYYY-MM-DD), a datetime in iso format or a timestamp in seconds, the dates are in UTC
+
+    :param value: the value to parse
+    :type value: str
+    :return: the timestamp in seconds
+    :rtype: int
+    """
+    try:
+        return int(value)
+    except ValueError:
+        date = datetime.datetime.fromisoformat(value)
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return int(date.timestamp())
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Fill the local databases with the klines of trading pairs, "
+                                                 "an interrupted run resumes where it stopped")
+    parser.add_argument('--pairs', nargs='+', required=True, help="trading pairs as ASSET/REF_ASSET (ex BTC/USDT)")
+    parser.add_argument('--timeframes', nargs='+', default=['m1'], choices=[tf.name for tf in TIMEFRAME])
+    parser.add_argument('--start', required=True, help="start date (YYYY-MM-DD, iso datetime or timestamp)")
+    parser.add_argument('--end', default=None, help="end date (YYYY-MM-DD, iso datetime or timestamp), default now")
+    parser.add_argument('--sources', nargs='+', default=['binance'], choices=['binance', 'kucoin'],
+                        help="retrievers to use, a pair is fetched on the first one listing it")
+    parser.add_argument('--workers', type=int, default=4, help="number of API requests made in parallel")
+    parser.add_argument('--rate', type=float, default=10., help="maximum number of API requests per second")
+    parser.add_argument('--progress-interval', type=float, default=10., help="seconds between progress reports")
+    parser.add_argument('--api-url', default=None, help="url of the API to use instead of the exchanges ones, the "
+                                                         "klines are saved in a database named after this url")
+    args = parser.parse_args(args)
+
+    pairs = []
+    for pair in args.pairs:
+        try:
+            asset, ref_asset = pair.upper().split('/')
+        except ValueError:
+            parser.error(f"invalid trading pair {pair}, the format is ASSET/REF_ASSET")
+        pairs.append((asset, ref_asset))
+    timeframes = [TIMEFRAME[name] for name in args.timeframes]
+    start_time = parse_time(args.start)
+    end_time = int(time.time()) if args.end is None else parse_time(args.end)
+
+    retriever_classes = {'binance': BinanceRetriever, 'kucoin': KucoinRetriever}
+    rate_limiter = RateLimiter(args.rate, burst=args.workers)
+    retrievers = []
+    for source in args.sources:
+        retriever = retriever_classes[source](api_url=args.api_url)
+        retriever.rate_limiter = rate_limiter
+        retrievers.append(retriever)
+
+    backfiller = Backfiller(retrievers, args.workers, args.progress_interval,
+                            on_progress=lambda progress: print(progress, flush=True))
+    backfiller.run(pairs, timeframes, start_time, end_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import time
+from typing import Optional
+
+from CryptoPrice.exceptions import BudgetExceededException
+
+
+class LookupBudget:
+    """
+    Limits on the time and the number of API calls a lookup can spend. Once a limit is reached, the retrievers only
+    answer from their local data and the budget is marked as exhausted, so the result can be flagged as partial.
+    The deadline is checked before each API call and before waiting for a rate limit: an HTTP request already sent
+    is not interrupted, a lookup can exceed its timeout by the duration of one request.
+
+    .. code-block:: python
+
+        budget = LookupBudget(timeout=0.5, max_online_calls=4)
+        meta_price = retriever.get_mean_price('LTC', 'XRP', timestamp, budget=budget)
+        if meta_price is not None and meta_price.partial:
+            ...
+    """
+
+    def __init__(self, timeout: Optional[float] = None, max_online_calls: Optional[int] = None):
+        """
+        Instantiate a budget, the time starts to run immediately
+
+        :param timeout: maximum duration of the lookup in seconds, None for no time limit
+        :type timeout: Optional[float]
+        :param max_online_calls: maximum number of API calls, None for no limit
+        :type max_online_calls: Optional[int]
+        """
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.max_online_calls = max_online_calls
+        self.online_calls = 0
+        self.exhausted = False  # True once a request has been refused
+
+    def remaining_time(self) -> Optional[float]:
+        """
+        Return the time left before the deadline
+
+        :return: time left in seconds (can be negative), None if there is no deadline
+        :rtype: Optional[float]
+        """
+        if self.deadline is not None:
+            return self.deadline - time.monotonic()
+
+    def consume_online_call(self):
+        """
+        Record a new API call, raise an exception if the budget does not allow it
+
+        :return: None
+        :rtype: None
+        """
+        self.check_online_call()
+        self.record_online_call()
+
+    def record_online_call(self):
+        """
+        Record a new API call already allowed by check_online_call
+
+        :return: None
+        :rtype: None
+        """
+        self.online_calls += 1
+
+    def check_online_call(self):
+        """
+        Raise an exception if the budget does not allow a new API call, without recording it
+
+        :return: None
+        :rtype: None
+        """
+        if self.max_online_calls is not None and self.online_calls >= self.max_online_calls:
+            self.exhausted = True
+            raise BudgetExceededException(f"the maximum number of API calls ({self.max_online_calls}) is reached")
+        remaining_time = self.remaining_time()
+        if remaining_time is not None and remaining_time <= 0:
+            self.exhausted = True
+            raise BudgetExceededException("the deadline of the lookup is reached")
+
+    def check_wait(self, duration: float):
+        """
+        Raise an exception if waiting for a given duration would go beyond the deadline
+
+        :param duration: duration to wait in seconds
+        :type duration: float
+        :return: None
+        :rtype: None
+        """
+        remaining_time = self.remaining_time()
+        if remaining_time is not None and duration >= remaining_time:
+            self.exhausted = True
+            raise BudgetExceededException(f"waiting {duration} seconds would go beyond the deadline of the lookup")
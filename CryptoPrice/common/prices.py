@@ -1,6 +1,8 @@
 from __future__ import annotations
+from array import array
 from dataclasses import dataclass
-from typing import List, Union, Set
+from enum import Enum
+from typing import ClassVar, Dict, FrozenSet, Iterable, List, Tuple, Union, Set
 
 from CryptoPrice.utils.time import TIMEFRAME
 
@@ -14,13 +16,161 @@ class Price:
     source: str
 
 
+class ProvenanceMode(Enum):
+    """
+    Enumeration for the details kept by the MetaPrices about the prices they were computed from
+    full: the Price and MetaPrice objects of each trading path
+    compact: the trading pairs and the timestamps of each trading path, in a CompactProvenance
+    none: nothing, only the value and the sources are kept
+    """
+    full = 'full'
+    compact = 'compact'
+    none = 'none'
+
+
+@dataclass(frozen=True)
+class CompactProvenance:
+    """
+    Trading paths of a MetaPrice, stored in a single array: for each path its number of legs, then the interned id of
+    the trading pair and the timestamp of the price of each leg
+    """
+    data: array
+
+    _pair_ids: ClassVar[Dict[Tuple[str, str, str], int]] = {}
+    _pairs: ClassVar[List[Tuple[str, str, str]]] = []
+
+    @staticmethod
+    def intern_pair(asset: str, ref_asset: str, source: str) -> int:
+        """
+        Return the id of a trading pair, the same for all the CompactProvenance instances
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param source: source of the price
+        :type source: str
+        :return: id of the trading pair
+        :rtype: int
+        """
+        key = (asset, ref_asset, source)
+        try:
+            return CompactProvenance._pair_ids[key]
+        except KeyError:
+            pair_id = CompactProvenance._pair_ids[key] = len(CompactProvenance._pairs)
+            CompactProvenance._pairs.append(key)
+            return pair_id
+
+    @staticmethod
+    def from_paths(paths: Iterable[Iterable[Tuple[str, str, str, int]]]) -> CompactProvenance:
+        """
+        Encode trading paths
+
+        :param paths: legs of each path as asset, ref_asset, source and timestamp
+        :type paths: Iterable[Iterable[Tuple[str, str, str, int]]]
+        :return: the compact provenance
+        :rtype: CompactProvenance
+        """
+        data = array('q')
+        for path in paths:
+            legs = list(path)
+            data.append(len(legs))
+            for asset, ref_asset, source, timestamp in legs:
+                data.append(CompactProvenance.intern_pair(asset, ref_asset, source))
+                data.append(timestamp)
+        return CompactProvenance(data)
+
+    @staticmethod
+    def from_meta_prices(meta_prices: Iterable[MetaPrice]) -> CompactProvenance:
+        """
+        Merge the trading paths of several MetaPrices, which hold either a CompactProvenance or a path of Prices
+
+        :param meta_prices: the MetaPrices to merge
+        :type meta_prices: Iterable[MetaPrice]
+        :return: the compact provenance of all the paths
+        :rtype: CompactProvenance
+        """
+        data = array('q')
+        for meta_price in meta_prices:
+            if isinstance(meta_price.prices, CompactProvenance):
+                data.extend(meta_price.prices.data)
+            else:
+                data.extend(CompactProvenance.from_price_path(meta_price.prices).data)
+        return CompactProvenance(data)
+
+    @staticmethod
+    def from_price_path(price_path: List[Price]) -> CompactProvenance:
+        """
+        Encode a single trading path
+
+        :param price_path: prices of the legs of the path
+        :type price_path: List[Price]
+        :return: the compact provenance of the path
+        :rtype: CompactProvenance
+        """
+        return CompactProvenance.from_paths([[(p.asset, p.ref_asset, p.source, p.timestamp) for p in price_path]])
+
+    def get_paths(self) -> List[List[Tuple[str, str, str, int]]]:
+        """
+        Decode the trading paths
+
+        :return: legs of each path as asset, ref_asset, source and timestamp
+        :rtype: List[List[Tuple[str, str, str, int]]]
+        """
+        paths = []
+        i = 0
+        while i < len(self.data):
+            n_legs = self.data[i]
+            paths.append([(*CompactProvenance._pairs[self.data[j]], self.data[j + 1])
+                          for j in range(i + 1, i + 1 + 2 * n_legs, 2)])
+            i += 1 + 2 * n_legs
+        return paths
+
+    def __len__(self) -> int:
+        """
+        number of trading paths
+        """
+        n_paths, i = 0, 0
+        while i < len(self.data):
+            n_paths += 1
+            i += 1 + 2 * self.data[i]
+        return n_paths
+
+
 @dataclass(frozen=True)
 class MetaPrice:
     value: float
     asset: str
     ref_asset: str
-    prices: List[Union[Price, MetaPrice]]
-    source: Set[str]
+    prices: Union[List[Union[Price, MetaPrice]], CompactProvenance, Tuple]
+    source: Union[Set[str], FrozenSet[str]]
+    partial: bool = False  # True if the lookup budget was exhausted, a better estimation may exist
+
+    # details kept by the MetaPrices built by from_price_path and mean_from_meta_price, see ProvenanceMode
+    provenance_mode: ClassVar[ProvenanceMode] = ProvenanceMode.full
+    _sources: ClassVar[Dict[FrozenSet[str], FrozenSet[str]]] = {}
+
+    @staticmethod
+    def _intern_source(source: Set[str]) -> FrozenSet[str]:
+        source = frozenset(source)
+        return MetaPrice._sources.setdefault(source, source)
+
+    @staticmethod
+    def _make(value: float, asset: str, ref_asset: str, prices: List[Union[Price, MetaPrice]],
+              source: Set[str]) -> MetaPrice:
+        """
+        Build a MetaPrice keeping the provenance details required by the provenance mode
+        """
+        mode = MetaPrice.provenance_mode
+        if mode == ProvenanceMode.full:
+            return MetaPrice(value, asset, ref_asset, prices, source=source)
+        if mode == ProvenanceMode.compact:
+            if all(isinstance(price, Price) for price in prices):
+                provenance = CompactProvenance.from_price_path(prices)
+            else:
+                provenance = CompactProvenance.from_meta_prices(prices)
+            return MetaPrice(value, asset, ref_asset, provenance, source=MetaPrice._intern_source(source))
+        return MetaPrice(value, asset, ref_asset, (), source=MetaPrice._intern_source(source))
 
     @staticmethod
     def mean_from_meta_price(meta_prices: List[MetaPrice]) -> MetaPrice:
@@ -43,7 +193,7 @@ class MetaPrice:
                 raise ValueError("asset and ref asset are inconsistent")
             cum_value += meta_price.value
             source.update(meta_price.source)
-        return MetaPrice(cum_value / len(meta_prices), asset, ref_asset, meta_prices, source=source)
+        return MetaPrice._make(cum_value / len(meta_prices), asset, ref_asset, meta_prices, source)
 
     @staticmethod
     def from_price_path(assets: List[str], price_path: List[Price]) -> MetaPrice:
@@ -70,7 +220,7 @@ class MetaPrice:
             else:
                 cumulated_price *= price.value
             source.add(price.source)
-        return MetaPrice(cumulated_price, assets[0], assets[-1], price_path, source=source)
+        return MetaPrice._make(cumulated_price, assets[0], assets[-1], price_path, source)
 
 
 @dataclass
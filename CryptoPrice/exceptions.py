@@ -7,3 +7,15 @@ class RateAPIException(Exception):
         self.retry_after = retry_after
         super().__init__(*args)
 
+
+
+class BudgetExceededException(Exception):
+    """
+    An exception to be raised when an online request would exceed the budget (time or number of API calls) of a lookup
+    """
+
+
+class SourceUnavailableException(Exception):
+    """
+    An exception to be raised when an API is not requested because its circuit breaker is open
+    """
@@ -1,19 +1,28 @@
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 
+from CryptoPrice.common.budget import LookupBudget
 from CryptoPrice.common.prices import Price
 from CryptoPrice.common.trade import TradingPair
 from CryptoPrice.utils.LoggerGenerator import LoggerGenerator
+from CryptoPrice.utils.MetricsRegistry import MetricsRegistry
 
 
 class AbstractRetriever(ABC):
 
     MAX_API_RETRY = 3
+    DEFAULT_LOOKUP_COST = 1.  # expected duration in seconds of a lookup when nothing better is known
 
     def __init__(self, name: str):
         self.name = name
         self.logger = LoggerGenerator.get_logger(self.name)
         self.supported_pairs = self.get_supported_pairs()
+        self.latest_prices_ttl = 5.  # duration in seconds during which the snapshot of the latest prices is used
+        self._latest_prices: Optional[Dict[Tuple[str, str], Price]] = None
+        self._latest_prices_time = 0.
+        self._latest_prices_lock = threading.Lock()
 
     @abstractmethod
     def get_supported_pairs(self) -> List[TradingPair]:
@@ -25,7 +34,8 @@ class AbstractRetriever(ABC):
         """
         raise NotImplementedError
 
-    def get_closest_price(self, asset: str, ref_asset: str, timestamp: int) -> Optional[Price]:
+    def get_closest_price(self, asset: str, ref_asset: str, timestamp: int, budget: Optional[LookupBudget] = None,
+                          tolerance: Optional[int] = None) -> Optional[Price]:
         """
         Will get the closest price possible in time for a trading pair asset/ref asset. If no price is found, return
         None
@@ -36,6 +46,11 @@ class AbstractRetriever(ABC):
         :type ref_asset: str
         :param timestamp: time to fetch the price needed (in seconds)
         :type timestamp: int
+        :param budget: limits on the time and the API calls of the lookup, None for no limit
+        :type budget: Optional[LookupBudget]
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the price, None to use
+            the default precision of the retriever. Retrievers based on klines use the coarsest timeframe satisfying it
+        :type tolerance: Optional[int]
         :return: the price closest in time found or None if no price found
         :rtype: Optional[Price]
         """
@@ -44,10 +59,74 @@ class AbstractRetriever(ABC):
         trading_pair = TradingPair('', asset, ref_asset, '')
         if trading_pair not in self.supported_pairs:
             return
-        return self._get_closest_price(asset, ref_asset, timestamp)
+        return self._get_closest_price(asset, ref_asset, timestamp, budget, tolerance)
+
+    def get_latest_price(self, asset: str, ref_asset: str) -> Optional[Price]:
+        """
+        Return the current price of a trading pair from the snapshot of the latest prices (see get_latest_prices)
+
+        :param asset: name of the asset in the trading pair (ex 'BTC' in 'BTCUSDT')
+        :type asset: str
+        :param ref_asset: name of the reference asset in the trading pair (ex 'USDT' in 'BTCUSDT')
+        :type ref_asset: str
+        :return: the latest price or None if the trading pair is not in the snapshot
+        :rtype: Optional[Price]
+        """
+        if asset == ref_asset:
+            return Price(1, asset, ref_asset, int(time.time()), source='')
+        return self.get_latest_prices().get((asset, ref_asset))
+
+    def get_latest_prices(self) -> Dict[Tuple[str, str], Price]:
+        """
+        Return the current prices of all the trading pairs. They are fetched with a single request and kept in memory
+        as a snapshot for latest_prices_ttl seconds
+
+        :return: the latest prices per asset and reference asset
+        :rtype: Dict[Tuple[str, str], Price]
+        """
+        with self._latest_prices_lock:
+            if self._latest_prices is None or time.monotonic() - self._latest_prices_time > self.latest_prices_ttl:
+                MetricsRegistry.increment('latest_prices_refresh_total', retriever=self.name)
+                self._latest_prices = {(p.asset, p.ref_asset): p for p in self._get_latest_prices_online()}
+                self._latest_prices_time = time.monotonic()
+            return self._latest_prices
+
+    def _get_latest_prices_online(self) -> List[Price]:
+        """
+        Fetch online the current prices of all the trading pairs, depends on the retriever used
+
+        :return: list of the latest prices
+        :rtype: List[Price]
+        """
+        raise NotImplementedError(f"the retriever {self.name} can not fetch the latest prices")
+
+    def is_available(self) -> bool:
+        """
+        Tell if the source of the retriever can currently be requested
+
+        :return: True if the source is available
+        :rtype: bool
+        """
+        return True
+
+    def get_lookup_cost(self, asset: str, ref_asset: str, timestamp: int) -> float:
+        """
+        Estimate the duration of a call to get_closest_price, used to choose between several trading paths
+
+        :param asset: name of the asset in the trading pair (ex 'BTC' in 'BTCUSDT')
+        :type asset: str
+        :param ref_asset: name of the reference asset in the trading pair (ex 'USDT' in 'BTCUSDT')
+        :type ref_asset: str
+        :param timestamp: time of the price needed (in seconds)
+        :type timestamp: int
+        :return: expected duration of the lookup in seconds
+        :rtype: float
+        """
+        return self.DEFAULT_LOOKUP_COST
 
     @abstractmethod
-    def _get_closest_price(self, asset: str, ref_asset: str, timestamp: int) -> Optional[Price]:
+    def _get_closest_price(self, asset: str, ref_asset: str, timestamp: int, budget: Optional[LookupBudget] = None,
+                           tolerance: Optional[int] = None) -> Optional[Price]:
         """
         Will get the closest price possible in time for a trading pair asset/ref asset. If no price is found, return
         None
@@ -58,6 +137,11 @@ class AbstractRetriever(ABC):
         :type ref_asset: str
         :param timestamp: time to fetch the price needed (in seconds)
         :type timestamp: int
+        :param budget: limits on the time and the API calls of the lookup, None for no limit
+        :type budget: Optional[LookupBudget]
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the price, None to use
+            the default precision of the retriever. Retrievers based on klines use the coarsest timeframe satisfying it
+        :type tolerance: Optional[int]
         :return: the price closest in time found or None if no price found
         :rtype: Optional[Price]
         """
@@ -1,6 +1,7 @@
 import datetime
+import time
 import traceback
-from typing import List
+from typing import List, Optional
 
 from binance.client import Client
 from binance.exceptions import BinanceAPIException
@@ -8,7 +9,7 @@ from binance.exceptions import BinanceAPIException
 from CryptoPrice.common.trade import TradingPair
 from CryptoPrice.exceptions import RateAPIException
 from CryptoPrice.retrievers.KlineRetriever import KlineRetriever
-from CryptoPrice.common.prices import Kline
+from CryptoPrice.common.prices import Kline, Price
 from CryptoPrice.utils.time import TIMEFRAME
 
 
@@ -34,10 +35,32 @@ class BinanceRetriever(KlineRetriever):
         TIMEFRAME.d3: Client.KLINE_INTERVAL_3DAY,
         TIMEFRAME.w1: Client.KLINE_INTERVAL_1WEEK
         }
+    max_klines_per_request = 1000
 
-    def __init__(self, kline_timeframe: TIMEFRAME = TIMEFRAME.m1, closest_window: int = 310):
-        self.client = Client()
-        super(BinanceRetriever, self).__init__('binance', kline_timeframe, closest_window)
+    def __init__(self, kline_timeframe: TIMEFRAME = TIMEFRAME.m1, closest_window: int = 310,
+                 api_url: Optional[str] = None, db_name: Optional[str] = None):
+        """
+        Instantiate a Binance retriever
+
+        :param kline_timeframe: timeframe of the klines used to compute the prices, default 1 minute
+        :type kline_timeframe: TIMEFRAME
+        :param closest_window: time window in seconds to look for the closest kline, default 310
+        :type closest_window: int
+        :param api_url: url of the API to use instead of the Binance one, for example a local mock exchange
+            (ex: 'http://localhost:8080')
+        :type api_url: Optional[str]
+        :param db_name: name of the database of the klines, default to 'binance'. If api_url is provided, the default
+            name is derived from it (ex: 'binance_localhost_8080'), the klines of another API never go to the binance
+            database
+        :type db_name: Optional[str]
+        """
+        if api_url is None:
+            self.client = Client()
+        else:  # the client formats API_URL with the endpoint and the tld, an url without placeholders is kept as is
+            self.client = type('LocalClient', (Client,), {'API_URL': f"{api_url}/api"})()
+        if db_name is None and api_url is not None:
+            db_name = self.get_api_db_name('binance', api_url)
+        super(BinanceRetriever, self).__init__('binance', kline_timeframe, closest_window, db_name)
 
     def get_supported_pairs(self) -> List[TradingPair]:
         """
@@ -49,6 +72,15 @@ class BinanceRetriever(KlineRetriever):
         binance_symbols = self.client.get_exchange_info()['symbols']
         return [TradingPair(s['symbol'], s['baseAsset'], s['quoteAsset'], source=self.name) for s in binance_symbols]
 
+    def get_supported_timeframes(self) -> List[TIMEFRAME]:
+        """
+        Return the timeframes of the klines provided by the Binance API
+
+        :return: list of timeframes
+        :rtype: List[TIMEFRAME]
+        """
+        return list(self.kline_translation)
+
     def _get_klines_online(self, asset: str, ref_asset: str, timeframe: TIMEFRAME,
                            start_time: int, end_time: int) -> List[Kline]:
         """
@@ -68,18 +100,20 @@ class BinanceRetriever(KlineRetriever):
         :rtype: List[Kline]
         """
         pair_name = asset + ref_asset
-        batch_size = 1000
         interval_trad = self.kline_translation[timeframe]
         try:
             result = self.client.get_klines(symbol=pair_name, interval=interval_trad, startTime=start_time * 1000,
-                                            endTime=end_time * 1000, limit=batch_size)
+                                            endTime=end_time * 1000, limit=self.max_klines_per_request)
 
         except BinanceAPIException as err:
             if err.code == -1121:
                 self.logger.info(f"The trading pair {asset} {ref_asset} is not supported")
                 return []
             elif err.code == -1003:
-                retry_after = 1 + 60 - datetime.datetime.now().timestamp() % 60
+                try:
+                    retry_after = float(err.response.headers['Retry-After'])
+                except (AttributeError, KeyError, TypeError, ValueError):
+                    retry_after = 1 + 60 - datetime.datetime.now().timestamp() % 60  # time until next minute
                 raise RateAPIException(retry_after, err.response)
             self.logger.error(str(traceback.format_exc()))
             raise err
@@ -96,3 +130,21 @@ class BinanceRetriever(KlineRetriever):
                                 asset, ref_asset, timeframe, source=self.name))
 
         return klines
+
+    def _get_latest_prices_online(self) -> List[Price]:
+        """
+        Fetch the current prices of all the trading pairs with the Binance ticker endpoint
+
+        :return: list of the latest prices
+        :rtype: List[Price]
+        """
+        pairs = {p.name: p for p in self.supported_pairs}
+        timestamp = int(time.time())
+        prices = []
+        for ticker in self.client.get_all_tickers():
+            try:
+                pair = pairs[ticker['symbol']]
+            except KeyError:  # pair listed after the instantiation of the retriever
+                continue
+            prices.append(Price(float(ticker['price']), pair.asset, pair.ref_asset, timestamp, source=self.name))
+        return prices
@@ -0,0 +1,107 @@
+import threading
+import time
+from enum import Enum
+
+
+class CircuitState(Enum):
+    """
+    Enumeration for the states of a circuit breaker
+    closed: the requests are sent
+    open: the requests are refused until the cool down is over
+    half_open: a limited number of trial requests are sent to check if the API is back
+    """
+    closed = 'closed'
+    open = 'open'
+    half_open = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    This class stops the requests to an API which keeps failing or throttling. After failure_threshold consecutive
+    failures the circuit opens and every request is refused for cool_down seconds. Then the circuit is half open:
+    up to half_open_max_calls trial requests are allowed, a success closes the circuit and a failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cool_down: float = 60., half_open_max_calls: int = 1):
+        """
+        Instantiate a closed circuit breaker
+
+        :param failure_threshold: number of consecutive failures opening the circuit
+        :type failure_threshold: int
+        :param cool_down: duration in seconds during which an open circuit refuses the requests
+        :type cool_down: float
+        :param half_open_max_calls: number of trial requests allowed in the half open state
+        :type half_open_max_calls: int
+        """
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.half_open_max_calls = half_open_max_calls
+        self._state = CircuitState.closed
+        self._failures = 0
+        self._opened_at = 0.
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> CircuitState:
+        """
+        current state of the circuit, an open circuit becomes half open once the cool down is over
+        """
+        with self._lock:
+            return self._update_state()
+
+    def _update_state(self) -> CircuitState:
+        if self._state == CircuitState.open and time.monotonic() - self._opened_at >= self.cool_down:
+            self._state = CircuitState.half_open
+            self._half_open_calls = 0
+        return self._state
+
+    def allow_request(self) -> bool:
+        """
+        Tell if a request can be sent to the API, and count it as a trial request if the circuit is half open
+
+        :return: True if the request can be sent
+        :rtype: bool
+        """
+        with self._lock:
+            state = self._update_state()
+            if state == CircuitState.closed:
+                return True
+            if state == CircuitState.half_open and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            return False
+
+    def record_success(self):
+        """
+        Record a successful request, it closes the circuit
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self._failures = 0
+            self._state = CircuitState.closed
+
+    def record_failure(self):
+        """
+        Record a failed request, it opens the circuit if the failure threshold is reached or if the circuit was
+        half open
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self._failures += 1
+            if self._state == CircuitState.half_open or self._failures >= self.failure_threshold:
+                self._state = CircuitState.open
+                self._opened_at = time.monotonic()
+
+    def reset(self):
+        """
+        Close the circuit and forget the failures
+
+        :return: None
+        :rtype: None
+        """
+        self.record_success()
@@ -0,0 +1,243 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from CryptoPrice.common.budget import LookupBudget
+from CryptoPrice.exceptions import BudgetExceededException, SourceUnavailableException
+from CryptoPrice.retrievers.AbstractRetriever import AbstractRetriever
+from CryptoPrice.retrievers.KlineRetriever import KlineRetriever
+from CryptoPrice.retrievers.MetaRetriever import MetaRetriever
+from CryptoPrice.utils.LoggerGenerator import LoggerGenerator
+from CryptoPrice.utils.MetricsRegistry import MetricsRegistry
+from CryptoPrice.utils.Tracer import Tracer
+from CryptoPrice.utils.time import TIMEFRAME
+
+KlineGap = Tuple[str, str, str, TIMEFRAME, int, int]  # source, asset, ref_asset, timeframe, start_time, end_time
+# source, asset, ref_asset, timeframe, start_time, end_time of the request and the gaps it repairs
+RepairRequest = Tuple[str, str, str, TIMEFRAME, int, int, List[Tuple[int, int]]]
+
+
+@dataclass
+class GapRepairReport:
+    """
+    Result of a scan and repair of the kline gaps, the counts of klines are in number of timeframes
+    """
+    n_gaps: int = 0
+    n_missing_klines: int = 0
+    n_requests: int = 0
+    n_repaired_klines: int = 0  # missing klines found online and saved
+    n_empty_klines: int = 0  # missing klines confirmed as not existing online, marked as covered
+    n_failed_requests: int = 0  # requests not made or failed, their gaps are found again by the next scan
+
+
+class KlineGapScanner:
+    """
+    This class finds the holes left in the kline databases by partial fetches, rate limits or outages of the APIs,
+    and repairs them with as few API calls as possible: the missing klines of a trading pair and a timeframe are
+    grouped into requests of at most one API page. The fetched ranges are recorded as covered, so the gaps where the
+    exchange has no kline (no trading) are not requested again and the lookups around them stay local.
+
+    .. code-block:: python
+
+        scanner = KlineGapScanner(get_default_retriever())
+        report = scanner.run()  # nightly, for example
+        print(report.n_repaired_klines, report.n_empty_klines)
+    """
+
+    def __init__(self, retriever: AbstractRetriever):
+        """
+        Instantiate a gap scanner
+
+        :param retriever: KlineRetriever or MetaRetriever whose kline databases are scanned
+        :type retriever: AbstractRetriever
+        """
+        if isinstance(retriever, MetaRetriever):
+            retrievers = retriever.retrievers.values()
+        else:
+            retrievers = [retriever]
+        self.retrievers: Dict[str, KlineRetriever] = {r.name: r for r in retrievers if isinstance(r, KlineRetriever)}
+        self.logger = LoggerGenerator.get_logger("kline_gap_scanner")
+
+    def run(self, start_time: Optional[int] = None, end_time: Optional[int] = None,
+            budget: Optional[LookupBudget] = None) -> GapRepairReport:
+        """
+        Scan the databases for gaps, then repair them
+
+        :param start_time: only consider the klines with an open time greater or equal than start_time
+        :type start_time: Optional[int]
+        :param end_time: only consider the klines with an open time lower than end_time
+        :type end_time: Optional[int]
+        :param budget: limits on the time and the API calls of the repair, None for no limit
+        :type budget: Optional[LookupBudget]
+        :return: counts of the gaps found and repaired
+        :rtype: GapRepairReport
+        """
+        report = GapRepairReport()
+        with Tracer.span('repair_gaps') as span:
+            gaps = self.scan(start_time, end_time)
+            requests = self.plan_repairs(gaps)
+            report.n_gaps = len(gaps)
+            report.n_missing_klines = sum(self.count_klines(timeframe, gap_start, gap_end)
+                                          for _, _, _, timeframe, gap_start, gap_end in gaps)
+            report.n_requests = len(requests)
+            self.repair(requests, report, budget)
+            span.set_attribute('n_requests', report.n_requests)
+            span.set_attribute('n_repaired_klines', report.n_repaired_klines)
+        self.logger.info("%s gaps found with %s missing klines, %s repaired and %s confirmed empty in %s requests, "
+                         "%s requests failed", report.n_gaps, report.n_missing_klines, report.n_repaired_klines,
+                         report.n_empty_klines, report.n_requests, report.n_failed_requests)
+        return report
+
+    def scan(self, start_time: Optional[int] = None, end_time: Optional[int] = None) -> List[KlineGap]:
+        """
+        Find the klines missing between the stored klines of each trading pair and timeframe. The parts of the gaps
+        already covered, confirmed empty by a previous fetch, are left out.
+
+        :param start_time: only consider the klines with an open time greater or equal than start_time
+        :type start_time: Optional[int]
+        :param end_time: only consider the klines with an open time lower than end_time
+        :type end_time: Optional[int]
+        :return: the gaps as source, asset, ref_asset, timeframe, start_time (included) and end_time (excluded)
+        :rtype: List[Tuple[str, str, str, TIMEFRAME, int, int]]
+        """
+        gaps = []
+        for source, retriever in self.retrievers.items():
+            for asset, ref_asset, timeframe in retriever.db.get_stored_pairs():
+                pair_gaps = retriever.db.get_kline_gaps(asset, ref_asset, timeframe, start_time, end_time)
+                if not len(pair_gaps):
+                    continue
+                covered_ranges = retriever.db.get_covered_ranges(asset, ref_asset, timeframe, pair_gaps[0][0],
+                                                                 pair_gaps[-1][1])
+                for gap_start, gap_end in self._subtract_ranges(pair_gaps, covered_ranges):
+                    gaps.append((source, asset, ref_asset, timeframe, gap_start, gap_end))
+        return gaps
+
+    @staticmethod
+    def count_klines(timeframe: TIMEFRAME, start_time: int, end_time: int) -> int:
+        """
+        Return the number of klines expected in the range [start_time, end_time)
+
+        :param timeframe: timeframe of the klines
+        :type timeframe: TIMEFRAME
+        :param start_time: start of the range (included)
+        :type start_time: int
+        :param end_time: end of the range (excluded)
+        :type end_time: int
+        :return: number of klines
+        :rtype: int
+        """
+        return -(-(end_time - start_time) // (timeframe.value * 60))
+
+    @staticmethod
+    def _subtract_ranges(ranges: List[Tuple[int, int]], removed_ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """
+        Remove some ranges from a list of ranges, both lists being sorted and without overlaps
+
+        :param ranges: ranges [start, end) to cut
+        :type ranges: List[Tuple[int, int]]
+        :param removed_ranges: ranges [start, end) to remove
+        :type removed_ranges: List[Tuple[int, int]]
+        :return: the remaining ranges
+        :rtype: List[Tuple[int, int]]
+        """
+        remaining = []
+        i = 0
+        for start, end in ranges:
+            while i < len(removed_ranges) and removed_ranges[i][1] <= start:
+                i += 1
+            j = i
+            while start < end and j < len(removed_ranges) and removed_ranges[j][0] < end:
+                if removed_ranges[j][0] > start:
+                    remaining.append((start, removed_ranges[j][0]))
+                start = max(start, removed_ranges[j][1])
+                j += 1
+            if start < end:
+                remaining.append((start, end))
+        return remaining
+
+    def plan_repairs(self, gaps: List[KlineGap]) -> List[RepairRequest]:
+        """
+        Group the gaps into the smallest number of requests, each request spanning at most one API page. A gap
+        longer than a page is split.
+
+        :param gaps: gaps as returned by scan
+        :type gaps: List[Tuple[str, str, str, TIMEFRAME, int, int]]
+        :return: the requests as source, asset, ref_asset, timeframe, start_time (included), end_time (excluded) and
+            the gaps repaired by the request
+        :rtype: List[Tuple[str, str, str, TIMEFRAME, int, int, List[Tuple[int, int]]]]
+        """
+        pairs_gaps: Dict[Tuple[str, str, str, TIMEFRAME], List[Tuple[int, int]]] = {}
+        for source, asset, ref_asset, timeframe, gap_start, gap_end in gaps:
+            pairs_gaps.setdefault((source, asset, ref_asset, timeframe), []).append((gap_start, gap_end))
+
+        requests = []
+        for (source, asset, ref_asset, timeframe), pair_gaps in pairs_gaps.items():
+            page_duration = self.retrievers[source].max_klines_per_request * timeframe.value * 60
+            pair_gaps.sort()
+            # greedy: each request starts at the first missing kline not requested yet and spans a full page
+            request_start, request_gaps = None, []
+            for gap_start, gap_end in pair_gaps:
+                while gap_start < gap_end:
+                    if request_start is None or gap_start >= request_start + page_duration:
+                        if request_start is not None:
+                            requests.append((source, asset, ref_asset, timeframe, request_start,
+                                             request_gaps[-1][1], request_gaps))
+                        request_start, request_gaps = gap_start, []
+                    part_end = min(gap_end, request_start + page_duration)
+                    request_gaps.append((gap_start, part_end))
+                    gap_start = part_end
+            if request_start is not None:
+                requests.append((source, asset, ref_asset, timeframe, request_start, request_gaps[-1][1],
+                                 request_gaps))
+        return requests
+
+    def repair(self, requests: List[RepairRequest], report: Optional[GapRepairReport] = None,
+               budget: Optional[LookupBudget] = None) -> GapRepairReport:
+        """
+        Fetch the requests planned by plan_repairs and save their klines. Each requested range is recorded as
+        covered, which marks the klines still missing as not existing online. The requests of an unavailable source
+        are skipped, and the remaining requests are stopped once the budget is exceeded.
+
+        :param requests: requests as returned by plan_repairs
+        :type requests: List[Tuple[str, str, str, TIMEFRAME, int, int, List[Tuple[int, int]]]]
+        :param report: report to update, a new one is created if None
+        :type report: Optional[GapRepairReport]
+        :param budget: limits on the time and the API calls, None for no limit
+        :type budget: Optional[LookupBudget]
+        :return: the updated report
+        :rtype: GapRepairReport
+        """
+        if report is None:
+            report = GapRepairReport(n_requests=len(requests))
+        unavailable_sources = set()
+        for i, (source, asset, ref_asset, timeframe, start_time, end_time, gaps) in enumerate(requests):
+            retriever = self.retrievers[source]
+            if source in unavailable_sources or not retriever.is_available():
+                unavailable_sources.add(source)
+                report.n_failed_requests += 1
+                continue
+            try:
+                retriever.fetch_klines(asset, ref_asset, timeframe, start_time, end_time, budget=budget)
+            except BudgetExceededException as err:
+                self.logger.warning("%s, %s gap repair requests left", err, len(requests) - i)
+                report.n_failed_requests += len(requests) - i
+                break
+            except SourceUnavailableException as err:
+                self.logger.warning("%s, the gaps of %s are not repaired", err, source)
+                unavailable_sources.add(source)
+                report.n_failed_requests += 1
+                continue
+            except Exception:
+                self.logger.exception("the repair of %s %s %s in [%s, %s) failed",
+                                      asset, ref_asset, timeframe.name, start_time, end_time)
+                report.n_failed_requests += 1
+                continue
+            n_missing = sum(self.count_klines(timeframe, gap_start, gap_end) for gap_start, gap_end in gaps)
+            n_repaired = sum(len(retriever.db.get_klines(asset, ref_asset, timeframe, gap_start, gap_end))
+                             for gap_start, gap_end in gaps)
+            report.n_repaired_klines += n_repaired
+            report.n_empty_klines += n_missing - n_repaired
+            MetricsRegistry.increment('gap_klines_repaired_total', n_repaired, retriever=source,
+                                      timeframe=timeframe.name)
+            MetricsRegistry.increment('gap_klines_empty_total', n_missing - n_repaired, retriever=source,
+                                      timeframe=timeframe.name)
+        return report
@@ -0,0 +1,254 @@
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple, Dict
+
+from CryptoPrice.common.trade import TradingPair
+from CryptoPrice.exceptions import SourceUnavailableException
+from CryptoPrice.retrievers.AbstractRetriever import AbstractRetriever
+from CryptoPrice.retrievers.KlineRetriever import KlineRetriever
+from CryptoPrice.retrievers.MetaRetriever import MetaRetriever
+from CryptoPrice.storage.KlineDataBase import KlineDataBase
+from CryptoPrice.utils.LoggerGenerator import LoggerGenerator
+from CryptoPrice.utils.Tracer import Tracer
+from CryptoPrice.utils.time import TIMEFRAME
+
+WatchedPair = Tuple[KlineRetriever, str, str, TIMEFRAME]
+
+
+class KlineRefresher:
+    """
+    This class keeps the recent klines of a watch list of trading pairs in the local databases, so that the lookups
+    close to the present time are answered without any API call. A background thread fetches, at each interval, the
+    klines newer than the last one stored.
+
+    The thread writes through its own connections to the databases, which have to wait for the write lock while the
+    retrievers hold deferred writes: a retriever database with write-behind must flush them in less than
+    DataBase.BUSY_TIMEOUT seconds (see DataBase.enable_write_behind), otherwise start raises a ValueError.
+
+    .. code-block:: python
+
+        refresher = KlineRefresher(retriever, [('BTC', 'USDT'), ('ETH', 'BTC')], interval=60)
+        refresher.start()
+        ...
+        refresher.stop()
+    """
+
+    def __init__(self, retriever: AbstractRetriever, watch_list: Optional[List[Tuple]] = None, interval: float = 60.,
+                 history: int = 3600):
+        """
+        Instantiate a refresher, the background thread is started with the method start
+
+        :param retriever: KlineRetriever or MetaRetriever to refresh. For a MetaRetriever, each pair is refreshed on
+            the first KlineRetriever supporting it
+        :type retriever: AbstractRetriever
+        :param watch_list: pairs to refresh as (asset, ref_asset) or (asset, ref_asset, timeframe). The default
+            timeframe is the one of the retriever
+        :type watch_list: Optional[List[Tuple]]
+        :param interval: time in seconds between two refreshes
+        :type interval: float
+        :param history: duration in seconds of the history fetched for a pair without any recent kline
+        :type history: int
+        """
+        self.retriever = retriever
+        self.interval = interval
+        self.history = history
+        self.logger = LoggerGenerator.get_logger("kline_refresher")
+        self._watched: List[WatchedPair] = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        for entry in watch_list or []:
+            self.watch(*entry)
+
+    def watch(self, asset: str, ref_asset: str, timeframe: Optional[TIMEFRAME] = None):
+        """
+        Add a trading pair to the watch list
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe of the klines to refresh, default to the timeframe of the retriever
+        :type timeframe: Optional[TIMEFRAME]
+        :return: None
+        :rtype: None
+        """
+        retriever = self._get_pair_retriever(asset, ref_asset)
+        if self.is_running:
+            self._check_write_behind(retriever)
+        if timeframe is None:
+            timeframe = retriever.kline_timeframe
+        with self._lock:
+            if (retriever, asset, ref_asset, timeframe) not in self._watched:
+                self._watched.append((retriever, asset, ref_asset, timeframe))
+
+    def unwatch(self, asset: str, ref_asset: str):
+        """
+        Remove a trading pair from the watch list, for all its timeframes
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self._watched = [w for w in self._watched if (w[1], w[2]) != (asset, ref_asset)]
+
+    def _get_pair_retriever(self, asset: str, ref_asset: str) -> KlineRetriever:
+        """
+        Find the KlineRetriever supporting a trading pair
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :return: the retriever to refresh the pair on
+        :rtype: KlineRetriever
+        """
+        if isinstance(self.retriever, MetaRetriever):
+            retrievers = self.retriever.retrievers.values()
+        else:
+            retrievers = [self.retriever]
+        trading_pair = TradingPair('', asset, ref_asset, '')
+        for retriever in retrievers:
+            if isinstance(retriever, KlineRetriever) and trading_pair in retriever.supported_pairs:
+                return retriever
+        raise ValueError(f"no kline retriever supports the trading pair {asset} {ref_asset}")
+
+    @staticmethod
+    def _check_write_behind(retriever: KlineRetriever):
+        """
+        Make sure the deferred writes of a retriever do not hold the write lock longer than the connections of the
+        refresher wait for it
+
+        :param retriever: retriever whose pairs are refreshed
+        :type retriever: KlineRetriever
+        :return: None
+        :rtype: None
+        """
+        max_delay = retriever.db.write_behind_max_delay
+        if max_delay is not None and max_delay >= retriever.db.BUSY_TIMEOUT:
+            raise ValueError(f"the database of {retriever.name} defers its writes for up to {max_delay} seconds, "
+                             f"the refresher would wait for the write lock longer than the timeout of "
+                             f"{retriever.db.BUSY_TIMEOUT} seconds: lower max_delay or disable the write-behind")
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        Start the background thread refreshing the watch list
+
+        :raises ValueError: if a retriever defers its writes for longer than the refresher can wait for them
+        :return: None
+        :rtype: None
+        """
+        if self.is_running:
+            return
+        with self._lock:
+            for retriever in {w[0] for w in self._watched}:
+                self._check_write_behind(retriever)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="kline_refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stop the background thread, the current refresh is finished first
+
+        :param timeout: maximum time in seconds to wait for the thread
+        :type timeout: Optional[float]
+        :return: None
+        :rtype: None
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        # SQLite connections can only be used by the thread which created them
+        databases: Dict[str, KlineDataBase] = {}
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self.refresh(databases)
+                except Exception:
+                    self.logger.exception("the refresh of the klines failed")
+                self._stop_event.wait(self.interval)
+        finally:
+            for db in databases.values():
+                db.close()
+
+    def refresh(self, databases: Optional[Dict[str, KlineDataBase]] = None) -> int:
+        """
+        Fetch and save the new klines of all the watched pairs once
+
+        :param databases: connections to use per retriever name, the missing ones are created. If None, the
+            databases of the retrievers are used, which is only possible from the thread that created them
+        :type databases: Optional[Dict[str, KlineDataBase]]
+        :return: number of klines fetched
+        :rtype: int
+        """
+        with self._lock:
+            watched = list(self._watched)
+        n_klines = 0
+        with Tracer.span('refresh', n_pairs=len(watched)) as span:
+            for retriever, asset, ref_asset, timeframe in watched:
+                if self._stop_event.is_set():
+                    break
+                if databases is None:
+                    db = retriever.db
+                else:
+                    try:
+                        db = databases[retriever.name]
+                    except KeyError:
+                        db = databases[retriever.name] = retriever.db.new_connection()
+                try:
+                    n_klines += self.refresh_pair(retriever, db, asset, ref_asset, timeframe)
+                except SourceUnavailableException as err:
+                    self.logger.debug("%s, %s %s %s not refreshed", err, asset, ref_asset, timeframe.name)
+                except sqlite3.OperationalError as err:
+                    if not db.is_locked_error(err):
+                        raise
+                    db.rollback()
+                    self.logger.error("the database of %s stayed locked by another connection for more than %s "
+                                      "seconds (deferred writes of a write-behind?), %s %s %s not refreshed",
+                                      retriever.name, db.BUSY_TIMEOUT, asset, ref_asset, timeframe.name)
+            span.set_attribute('n_klines', n_klines)
+        return n_klines
+
+    def refresh_pair(self, retriever: KlineRetriever, db: KlineDataBase, asset: str, ref_asset: str,
+                     timeframe: TIMEFRAME) -> int:
+        """
+        Fetch and save the klines of a trading pair newer than the last one stored
+
+        :param retriever: retriever to fetch the klines with
+        :type retriever: KlineRetriever
+        :param db: database to save the klines in
+        :type db: KlineDataBase
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe of the klines
+        :type timeframe: TIMEFRAME
+        :return: number of klines fetched
+        :rtype: int
+        """
+        now = int(time.time())
+        start_time = now - self.history
+        last_timestamp = db.get_last_kline_timestamp(asset, ref_asset, timeframe)
+        if last_timestamp is not None:
+            # the last stored kline is fetched again so that the new covered range joins the previous one
+            start_time = max(start_time, last_timestamp - timeframe.value * 60)
+        n_klines = retriever.fetch_klines(asset, ref_asset, timeframe, start_time, now, db=db)
+        db.commit()
+        retriever.mark_pair_refreshed(asset, ref_asset, timeframe, now - timeframe.value * 60,
+                                      time.time() + 2 * self.interval)
+        self.logger.debug("%s new klines for %s %s %s", n_klines, asset, ref_asset, timeframe.name)
+        return n_klines
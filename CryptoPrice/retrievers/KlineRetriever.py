@@ -1,29 +1,79 @@
+import re
 import time
 from abc import abstractmethod
-from typing import Optional, List
+from typing import Optional, List, Tuple, Dict
+from urllib.parse import urlsplit
 
-from CryptoPrice.exceptions import RateAPIException
+from CryptoPrice.common.budget import LookupBudget
+from CryptoPrice.exceptions import RateAPIException, BudgetExceededException, SourceUnavailableException
 from CryptoPrice.retrievers.AbstractRetriever import AbstractRetriever
+from CryptoPrice.retrievers.CircuitBreaker import CircuitBreaker, CircuitState
+from CryptoPrice.retrievers.ReadAheadPolicy import ReadAheadPolicy
+from CryptoPrice.storage.KlineCacheManager import KlineCacheManager
 from CryptoPrice.storage.KlineDataBase import KlineDataBase
 from CryptoPrice.common.prices import Price, Kline
+from CryptoPrice.utils.MetricsRegistry import MetricsRegistry
+from CryptoPrice.utils.RateLimiter import RateLimiter
+from CryptoPrice.utils.SingleFlight import SingleFlight
+from CryptoPrice.utils.Tracer import Tracer
 from CryptoPrice.utils.time import TIMEFRAME
 
 
 class KlineRetriever(AbstractRetriever):
 
-    def __init__(self, name: str, kline_timeframe: TIMEFRAME, closest_window: int = 120):
+    max_klines_per_request = 500  # maximum number of klines returned by the API in a single request
+    GENESIS_TIMESTAMP = 1230768000  # 2009-01-01, no crypto asset was traded before this date
+    LATENCY_SMOOTHING = 0.2  # weight of the last API call in the observed latency
+    DELISTED_MARGIN = 7 * 86400  # a pair without any kline this long before its listing check is delisted
+    LISTING_REFRESH_INTERVAL = 86400  # age in seconds of a listing check after which it is checked again if needed
+
+    def __init__(self, name: str, kline_timeframe: TIMEFRAME, closest_window: int = 120,
+                 db_name: Optional[str] = None, db: Optional[KlineDataBase] = None):
         super().__init__(name)
-        self.db = KlineDataBase(name)
+        if db is None:
+            db = KlineDataBase(name if db_name is None else db_name)
+            db.source = name
+        self.db = db
         self.closest_window = closest_window
         self.kline_timeframe = kline_timeframe
+        self.read_ahead_policy: Optional[ReadAheadPolicy] = ReadAheadPolicy()
+        self.circuit_breaker: Optional[CircuitBreaker] = CircuitBreaker()
+        self.rate_limiter: Optional[RateLimiter] = None  # can be shared between retrievers using the same API
+        self.single_flight: Optional[SingleFlight] = SingleFlight()  # coalesce the identical concurrent API calls
+        self.cache_manager: Optional[KlineCacheManager] = None  # bounds the size of the database
+        self._pairs_listing: Dict[Tuple[str, str, TIMEFRAME], Optional[Tuple[int, int, int]]] = {}
+        self.observed_latency: Optional[float] = None  # moving average of the API calls duration in seconds
+        # pairs kept up to date by a KlineRefresher: key -> end of the covered range, time until which it is valid
+        self._live_pairs: Dict[Tuple[str, str, TIMEFRAME], Tuple[int, float]] = {}
+
+    @staticmethod
+    def get_api_db_name(name: str, api_url: str) -> str:
+        """
+        Return the name of the database of a retriever using another API than the one of its exchange (a mock
+        exchange for example), so that its klines are never mixed with the ones of the exchange
 
-    def _get_closest_price(self, asset: str, ref_asset: str, timestamp: int) -> Optional[Price]:
+        :param name: name of the retriever
+        :type name: str
+        :param api_url: url of the API used (ex: 'http://localhost:8080')
+        :type api_url: str
+        :return: name of the database (ex: 'binance_localhost_8080')
+        :rtype: str
+        """
+        return f"{name}_{re.sub(r'[^A-Za-z0-9]+', '_', urlsplit(api_url).netloc or api_url).strip('_')}"
+
+    def _get_closest_price(self, asset: str, ref_asset: str, timestamp: int, budget: Optional[LookupBudget] = None,
+                           tolerance: Optional[int] = None) -> Optional[Price]:
         """
         Will get the closest price possible in time for a trading pair asset/ref asset. If no price is found, return
         None.
 
         Try to fetch a local kline first, if the kline is to far from the wanted timestamp, will fetch a batch of kline
-        online and return the closest one
+        online and return the closest one. If the budget does not allow to fetch online, if the API is unavailable
+        (open circuit breaker) or if the database is read only, the closest kline in the database is returned and the
+        result is not cached.
+
+        If a tolerance is given, the lookup is made on the timeframe returned by get_lookup_timeframe and only the
+        klines closer than the tolerance are considered.
 
         :param asset: name of the asset in the trading pair (ex 'BTC' in 'BTCUSDT')
         :type asset: str
@@ -31,72 +81,529 @@ class KlineRetriever(AbstractRetriever):
         :type ref_asset: str
         :param timestamp: time to fetch the price needed (in seconds)
         :type timestamp: int
+        :param budget: limits on the time and the API calls of the lookup, None for no limit
+        :type budget: Optional[LookupBudget]
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the price, None to use
+            the timeframe and the closest window of the retriever
+        :type tolerance: Optional[int]
         :return: the price closest in time found or None if no price found
         :rtype: Optional[Price]
         """
+        timeframe, window = self.kline_timeframe, self.closest_window
+        if tolerance is not None:
+            timeframe, window = self.get_lookup_timeframe(asset, ref_asset, timestamp, tolerance), tolerance
+        if self.cache_manager is not None and not self.db.read_only:
+            self.cache_manager.record_access(asset, ref_asset, timeframe, timestamp)
         closest_kline = None
         # first let's see if there is a cached result
-        closest_timestamp, window = self.db.get_cache_closest(asset, ref_asset, self.kline_timeframe, timestamp)
-        if closest_timestamp is not None and window <= self.closest_window:
+        with Tracer.span('cache_lookup', database=self.db.name):
+            closest_timestamp, cached_window = self.db.get_cache_closest(asset, ref_asset, timeframe, timestamp)
+        if closest_timestamp is not None and cached_window <= window:
             if closest_timestamp == -1:  # no closest kline can be found
-                self.logger.debug(f"cache indicates that no klines can be retrieved for {asset} {ref_asset}"
-                                  f" {self.kline_timeframe.name} {timestamp} and window {self.closest_window}")
+                MetricsRegistry.increment('cache_hits_total', retriever=self.name, timeframe=timeframe.name)
+                self.logger.debug("cache indicates that no klines can be retrieved for %s %s %s %s and window %s",
+                                  asset, ref_asset, timeframe.name, timestamp, window)
                 return None
-            klines = self.db.get_klines(asset, ref_asset, self.kline_timeframe,
-                                        start_time=closest_timestamp, end_time=closest_timestamp + 1)
+            klines = self.db.get_klines(asset, ref_asset, timeframe, start_time=closest_timestamp,
+                                        end_time=closest_timestamp + 1)
             if len(klines):
-                self.logger.debug(f"A result was cached for {asset} {ref_asset} {self.kline_timeframe.name} {timestamp}"
-                                  f" and it was found in the database")
+                self.logger.debug("A result was cached for %s %s %s %s and it was found in the database",
+                                  asset, ref_asset, timeframe.name, timestamp)
                 closest_kline = klines[0]
+                MetricsRegistry.increment('cache_hits_total', retriever=self.name, timeframe=timeframe.name)
             else:
-                self.logger.error(f"A result was cached for {asset} {ref_asset} {self.kline_timeframe.name} {timestamp}"
-                                  f" but it was not found in the database")
+                self.logger.error("A result was cached for %s %s %s %s but it was not found in the database",
+                                  asset, ref_asset, timeframe.name, timestamp)
 
         if closest_kline is None:
+            MetricsRegistry.increment('cache_misses_total', retriever=self.name, timeframe=timeframe.name)
             # first get closest kline locally
-            closest_kline = self.db.get_closest_kline(asset, ref_asset, self.kline_timeframe,
-                                                      timestamp, window=self.closest_window)
-
-            if closest_kline is not None:
-                time_delta = abs(closest_kline.open_timestamp - timestamp)
-                if time_delta > self.kline_timeframe.value * 60 / 2:
-                    self.logger.debug(f"{timestamp} and {closest_kline.open_timestamp} are to far apart "
-                                      f"for {self.kline_timeframe.name}, fetching online")
-                    closest_kline = None
-                else:
-                    self.logger.debug(f"a kline already in the database is close enough to the wanted timestamp")
+            with Tracer.span('get_closest_kline', database=self.db.name):
+                closest_kline = self.db.get_closest_kline(asset, ref_asset, timeframe, timestamp, window=window)
+
+            fetch_online = True
+            cache_result = True
+            if closest_kline is not None \
+                    and abs(closest_kline.open_timestamp - timestamp) <= timeframe.value * 60 / 2:
+                self.logger.debug("a kline already in the database is close enough to the wanted timestamp")
+                fetch_online = False
+            elif self.db.is_range_covered(asset, ref_asset, timeframe, timestamp - window, timestamp + window):
+                self.logger.debug("the window around %s is covered by the database, no better kline can be found"
+                                  " online", timestamp)
+                fetch_online = False
+            elif self.is_live_window_covered(asset, ref_asset, timestamp, timeframe, window):
+                self.logger.debug("the window around %s is kept up to date by a refresher", timestamp)
+                fetch_online = False
+                cache_result = False  # a closer kline may be added by the next refresh
+            elif closest_kline is not None:
+                self.logger.debug("%s and %s are to far apart for %s, fetching online",
+                                  timestamp, closest_kline.open_timestamp, timeframe.name)
             else:
-                self.logger.debug(f"no kline in the database around time {timestamp} with"
-                                  f" a {self.closest_window} window, fetching online")
+                self.logger.debug("no kline in the database around time %s with a %s window, fetching online",
+                                  timestamp, window)
+
+            if fetch_online and not self.db.read_only \
+                    and self.is_listing_stale(asset, ref_asset, timeframe, timestamp + window) \
+                    and self.is_outside_listing(asset, ref_asset, timeframe, timestamp - window, timestamp + window):
+                # the pair was delisted at the last check, it is checked again instead of trusting an old check
+                try:
+                    self.refresh_pair_listing(asset, ref_asset, timeframe, budget=budget)
+                except (BudgetExceededException, SourceUnavailableException) as err:
+                    self.logger.debug("%s, the listing of %s %s %s is not refreshed",
+                                      err, asset, ref_asset, timeframe.name)
+
+            if fetch_online and self.is_outside_listing(asset, ref_asset, timeframe, timestamp - window,
+                                                        timestamp + window):
+                self.logger.debug("%s %s %s has no kline around %s according to its listing period",
+                                  asset, ref_asset, timeframe.name, timestamp)
+                fetch_online = False
+
+            if self.db.read_only:  # nothing can be saved, the database is the only source
+                fetch_online = False
+                cache_result = False
 
-            if closest_kline is None:  # fetching online
-                klines = self.get_klines_online(asset, ref_asset, self.kline_timeframe,
-                                                timestamp - self.closest_window,
-                                                timestamp + self.closest_window)
-                self.db.add_klines(klines, ignore_if_exists=True)
+            if not fetch_online:
+                MetricsRegistry.increment('db_hits_total', retriever=self.name, timeframe=timeframe.name)
+            else:
+                start_time, end_time = timestamp - window, timestamp + window
+                if self.read_ahead_policy is not None:
+                    max_duration = self.max_klines_per_request * timeframe.value * 60
+                    start_time, end_time = self.read_ahead_policy.get_fetch_range(
+                        (asset, ref_asset, timeframe), timestamp, window, max_duration)
+                try:
+                    n_klines = self.fetch_klines(asset, ref_asset, timeframe, start_time, end_time, budget=budget)
+                    if not n_klines and self.get_pair_listing(asset, ref_asset, timeframe) is None:
+                        self.discover_pair_listing(asset, ref_asset, timeframe, budget=budget)
+                    elif not n_klines and self.is_listing_stale(asset, ref_asset, timeframe, end_time):
+                        self.refresh_pair_listing(asset, ref_asset, timeframe, budget=budget)
+                except BudgetExceededException as err:
+                    self.logger.debug("%s, answering from the database for %s %s %s %s",
+                                      err, asset, ref_asset, timeframe.name, timestamp)
+                    MetricsRegistry.increment('budget_exceeded_total', retriever=self.name, timeframe=timeframe.name)
+                    # a better kline may exist online, the result can not be cached
+                    cache_result = False
+                except SourceUnavailableException as err:
+                    self.logger.debug("%s, answering from the database for %s %s %s %s",
+                                      err, asset, ref_asset, timeframe.name, timestamp)
+                    MetricsRegistry.increment('source_unavailable_total', retriever=self.name,
+                                              timeframe=timeframe.name)
+                    cache_result = False
 
-                closest_kline = self.db.get_closest_kline(asset, ref_asset, self.kline_timeframe,
-                                                          timestamp, window=self.closest_window)
+                with Tracer.span('get_closest_kline', database=self.db.name):
+                    closest_kline = self.db.get_closest_kline(asset, ref_asset, timeframe, timestamp, window=window)
 
-            closest_open_timestamp = -1
-            if closest_kline is not None:
-                closest_open_timestamp = closest_kline.open_timestamp
-            self.db.add_cache_closest(asset, ref_asset, self.kline_timeframe, timestamp,
-                                      closest_open_timestamp, self.closest_window)
+            if cache_result:
+                closest_open_timestamp = -1
+                if closest_kline is not None:
+                    closest_open_timestamp = closest_kline.open_timestamp
+                with Tracer.span('add_cache_closest', database=self.db.name):
+                    self.db.add_cache_closest(asset, ref_asset, timeframe, timestamp, closest_open_timestamp, window)
 
         if closest_kline is not None:
             return Price(closest_kline.open, asset, ref_asset, closest_kline.open_timestamp, closest_kline.source)
 
-        msg = f"no Kline found for {asset}, {ref_asset}, {self.kline_timeframe.name}, {timestamp}," \
-              f" w={self.closest_window}"
+        MetricsRegistry.increment('not_found_total', retriever=self.name, timeframe=timeframe.name)
+        self.logger.debug("no Kline found for %s, %s, %s, %s, w=%s",
+                          asset, ref_asset, timeframe.name, timestamp, window)
+
+    def fetch_klines(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int, end_time: int,
+                     budget: Optional[LookupBudget] = None, db: Optional[KlineDataBase] = None) -> int:
+        """
+        Fetch online all the klines with an open time in [start_time, end_time), page by page, save them in the
+        database and mark the range as covered
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: start of the time range (included)
+        :type start_time: int
+        :param end_time: end of the time range (excluded)
+        :type end_time: int
+        :param budget: limits on the time and the API calls, None for no limit. The pages fetched before the budget
+            is exceeded are saved.
+        :type budget: Optional[LookupBudget]
+        :param db: database to save the klines in, default to the database of the retriever. A connection to the
+            database can only be used by the thread which created it.
+        :type db: Optional[KlineDataBase]
+        :return: number of klines fetched
+        :rtype: int
+        """
+        page_duration = self.max_klines_per_request * timeframe.value * 60
+        n_klines = 0
+        for page_start_time in range(start_time, end_time, page_duration):
+            page_end_time = min(page_start_time + page_duration, end_time)
+            klines = self.get_klines_online(asset, ref_asset, timeframe, page_start_time, page_end_time - 1,
+                                            budget=budget)
+            n_klines += len(klines)
+            self.save_fetched_klines(asset, ref_asset, timeframe, klines, page_start_time, page_end_time, db=db)
+        return n_klines
+
+    def save_fetched_klines(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, klines: List[Kline],
+                            start_time: int, end_time: int, db: Optional[KlineDataBase] = None):
+        """
+        Save in the database the klines fetched online for the time range [start_time, end_time) and mark the range
+        as covered. The klines must contain all the klines available online in this range.
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param klines: klines fetched online
+        :type klines: List[Kline]
+        :param start_time: start of the fetched time range (included)
+        :type start_time: int
+        :param end_time: end of the fetched time range (excluded)
+        :type end_time: int
+        :param db: database to save the klines in, default to the database of the retriever
+        :type db: Optional[KlineDataBase]
+        :return: None
+        :rtype: None
+        """
+        if db is None:
+            db = self.db
+        # the last kline may not be published yet, only the past is marked as covered
+        covered_end_time = min(end_time, int(time.time()) - timeframe.value * 60)
+        with Tracer.span('add_klines', database=db.name, n_klines=len(klines)):
+            db.add_klines(klines, ignore_if_exists=True, auto_commit=False)
+            db.add_covered_range(asset, ref_asset, timeframe, start_time, covered_end_time)
+
+    def has_local_price(self, asset: str, ref_asset: str, timestamp: int, timeframe: Optional[TIMEFRAME] = None,
+                        window: Optional[int] = None) -> bool:
+        """
+        Tell if get_closest_price can answer for a trading pair and a timestamp without any API call: the result is
+        cached, a close enough kline is in the database, the window around the timestamp is covered or it is outside
+        the listing period of the pair.
+
+        :param asset: name of the asset in the trading pair (ex 'BTC' in 'BTCUSDT')
+        :type asset: str
+        :param ref_asset: name of the reference asset in the trading pair (ex 'USDT' in 'BTCUSDT')
+        :type ref_asset: str
+        :param timestamp: time of the price needed (in seconds)
+        :type timestamp: int
+        :param timeframe: timeframe of the lookup, default to the timeframe of the retriever
+        :type timeframe: Optional[TIMEFRAME]
+        :param window: window of the lookup in seconds, default to the closest window of the retriever
+        :type window: Optional[int]
+        :return: True if no API call is needed
+        :rtype: bool
+        """
+        if timeframe is None:
+            timeframe = self.kline_timeframe
+        if window is None:
+            window = self.closest_window
+        closest_timestamp, cached_window = self.db.get_cache_closest(asset, ref_asset, timeframe, timestamp)
+        if closest_timestamp is not None and cached_window <= window:
+            return True
+        closest_kline = self.db.get_closest_kline(asset, ref_asset, timeframe, timestamp, window=window)
+        if closest_kline is not None and abs(closest_kline.open_timestamp - timestamp) <= timeframe.value * 60 / 2:
+            return True
+        start_time, end_time = timestamp - window, timestamp + window
+        return self.db.is_range_covered(asset, ref_asset, timeframe, start_time, end_time) \
+            or self.is_live_window_covered(asset, ref_asset, timestamp, timeframe, window) \
+            or self.is_outside_listing(asset, ref_asset, timeframe, start_time, end_time)
+
+    def get_supported_timeframes(self) -> List[TIMEFRAME]:
+        """
+        Return the timeframes of the klines provided by the API, all of them by default
+
+        :return: list of timeframes
+        :rtype: List[TIMEFRAME]
+        """
+        return list(TIMEFRAME)
+
+    def get_lookup_timeframe(self, asset: str, ref_asset: str, timestamp: int, tolerance: int) -> TIMEFRAME:
+        """
+        Choose the timeframe of a lookup accepting a price up to tolerance seconds away from the timestamp: the
+        coarsest timeframe whose klines are always closer than the tolerance (half a kline away at most) and which
+        can answer locally. If none can answer locally, the coarsest one is chosen, which needs the least data. If the
+        tolerance is below half of the finest timeframe, the finest timeframe is chosen.
+
+        :param asset: name of the asset in the trading pair (ex 'BTC' in 'BTCUSDT')
+        :type asset: str
+        :param ref_asset: name of the reference asset in the trading pair (ex 'USDT' in 'BTCUSDT')
+        :type ref_asset: str
+        :param timestamp: time of the price needed (in seconds)
+        :type timestamp: int
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the price
+        :type tolerance: int
+        :return: the timeframe to use
+        :rtype: TIMEFRAME
+        """
+        supported_timeframes = self.get_supported_timeframes()
+        timeframes = sorted((tf for tf in supported_timeframes if tf.value * 60 / 2 <= tolerance), reverse=True)
+        if not len(timeframes):
+            return min(supported_timeframes)
+        for timeframe in timeframes:
+            if self.has_local_price(asset, ref_asset, timestamp, timeframe, tolerance):
+                return timeframe
+        return timeframes[0]
+
+    def mark_pair_refreshed(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, covered_end_time: int,
+                            valid_until: float):
+        """
+        Record that a trading pair is kept up to date by a refresher: until valid_until, a lookup whose window goes
+        beyond covered_end_time is answered locally if the window is covered up to covered_end_time
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param covered_end_time: end of the range covered by the last refresh
+        :type covered_end_time: int
+        :param valid_until: time (in seconds) until which the refresh is considered as recent
+        :type valid_until: float
+        :return: None
+        :rtype: None
+        """
+        self._live_pairs[(asset, ref_asset, timeframe)] = covered_end_time, valid_until
+
+    def is_live_window_covered(self, asset: str, ref_asset: str, timestamp: int,
+                               timeframe: Optional[TIMEFRAME] = None, window: Optional[int] = None) -> bool:
+        """
+        Tell if the window around a timestamp is covered up to the last refresh of a trading pair kept up to date by
+        a refresher
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timestamp: time of the price needed (in seconds)
+        :type timestamp: int
+        :param timeframe: timeframe of the lookup, default to the timeframe of the retriever
+        :type timeframe: Optional[TIMEFRAME]
+        :param window: window of the lookup in seconds, default to the closest window of the retriever
+        :type window: Optional[int]
+        :return: True if the klines of the window are in the database, as far as the refresher knows
+        :rtype: bool
+        """
+        if timeframe is None:
+            timeframe = self.kline_timeframe
+        if window is None:
+            window = self.closest_window
+        try:
+            covered_end_time, valid_until = self._live_pairs[(asset, ref_asset, timeframe)]
+        except KeyError:
+            return False
+        start_time = timestamp - window
+        end_time = min(timestamp + window, covered_end_time)
+        if time.time() > valid_until or end_time <= start_time:
+            return False
+        return self.db.is_range_covered(asset, ref_asset, timeframe, start_time, end_time)
+
+    def get_pair_listing(self, asset: str, ref_asset: str, timeframe: TIMEFRAME) -> Optional[Tuple[int, int, int]]:
+        """
+        Return the listing period of a trading pair if it has already been discovered, without any API call
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :return: open time of the first and last klines, and time when they were checked. None if never discovered
+        :rtype: Optional[Tuple[int, int, int]]
+        """
+        key = (asset, ref_asset, timeframe)
+        try:
+            return self._pairs_listing[key]
+        except KeyError:
+            listing = self.db.get_pair_listing(asset, ref_asset, timeframe)
+            self._pairs_listing[key] = listing
+            return listing
+
+    def is_outside_listing(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int,
+                           end_time: int) -> bool:
+        """
+        Tell if the API is known to have no kline in the time range [start_time, end_time), because the range is
+        before the listing of the trading pair or after its last kline. No API call is made, if the listing period
+        of the pair has not been discovered yet, False is returned.
+
+        The ranges ending after the check of the listing are only known to be empty if the pair was delisted at the
+        time of the check: its last kline was more than DELISTED_MARGIN seconds older than the check. See
+        refresh_pair_listing to update an old check.
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: start of the time range (included)
+        :type start_time: int
+        :param end_time: end of the time range (excluded)
+        :type end_time: int
+        :return: True if no kline exists in the range
+        :rtype: bool
+        """
+        listing = self.get_pair_listing(asset, ref_asset, timeframe)
+        if listing is None:
+            return False
+        first_timestamp, last_timestamp, check_timestamp = listing
+        if end_time > check_timestamp and check_timestamp - last_timestamp <= self.DELISTED_MARGIN:
+            return False  # the pair was still traded at the last check, klines may have been created since
+        return first_timestamp == -1 or end_time <= first_timestamp or start_time > last_timestamp
+
+    def is_listing_stale(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, end_time: int) -> bool:
+        """
+        Tell if the listing period of a trading pair is too old to tell if klines exist before end_time: it was
+        checked before end_time and more than LISTING_REFRESH_INTERVAL seconds ago
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param end_time: end of the time range of interest (excluded)
+        :type end_time: int
+        :return: True if the listing is known and old
+        :rtype: bool
+        """
+        listing = self.get_pair_listing(asset, ref_asset, timeframe)
+        if listing is None:
+            return False
+        check_timestamp = listing[2]
+        return end_time > check_timestamp and time.time() - check_timestamp > self.LISTING_REFRESH_INTERVAL
+
+    def refresh_pair_listing(self, asset: str, ref_asset: str, timeframe: TIMEFRAME,
+                             budget: Optional[LookupBudget] = None) -> Tuple[int, int, int]:
+        """
+        Check with a single API call if klines were created after the last known kline of a trading pair. If not,
+        only the time of the check is updated, otherwise the listing period is discovered again.
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param budget: limits on the time and the API calls, None for no limit
+        :type budget: Optional[LookupBudget]
+        :return: open time of the first and last klines (-1 if there are none), and time of the check
+        :rtype: Tuple[int, int, int]
+        """
+        listing = self.get_pair_listing(asset, ref_asset, timeframe)
+        if listing is None:
+            return self.discover_pair_listing(asset, ref_asset, timeframe, budget=budget)
+        first_timestamp, last_timestamp, _ = listing
+        check_timestamp = int(time.time())
+        start_time = self.GENESIS_TIMESTAMP if last_timestamp == -1 else last_timestamp + 1
+        if len(self.get_klines_online(asset, ref_asset, timeframe, start_time, check_timestamp - 1, budget=budget)):
+            return self.discover_pair_listing(asset, ref_asset, timeframe, budget=budget)
+        self.db.add_pair_listing(asset, ref_asset, timeframe, first_timestamp, last_timestamp, check_timestamp)
+        listing = first_timestamp, last_timestamp, check_timestamp
+        self._pairs_listing[(asset, ref_asset, timeframe)] = listing
+        return listing
+
+    def discover_pair_listing(self, asset: str, ref_asset: str, timeframe: TIMEFRAME,
+                              budget: Optional[LookupBudget] = None) -> Tuple[int, int, int]:
+        """
+        Look for the open times of the first and last klines available on the API for a trading pair, with a binary
+        search over the API. The result is saved in the database.
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param budget: limits on the time and the API calls, None for no limit
+        :type budget: Optional[LookupBudget]
+        :return: open time of the first and last klines (-1 if there are none), and time of the check
+        :rtype: Tuple[int, int, int]
+        """
+        check_timestamp = int(time.time())
+        page_duration = self.max_klines_per_request * timeframe.value * 60
+
+        def has_klines(start_time: int, end_time: int) -> bool:
+            return len(self.get_klines_online(asset, ref_asset, timeframe, start_time, end_time - 1,
+                                              budget=budget)) > 0
+
+        # invariant: the first kline is in [lower_time, upper_time)
+        lower_time, upper_time = self.GENESIS_TIMESTAMP, check_timestamp
+        if not has_klines(lower_time, upper_time):
+            first_timestamp, last_timestamp = -1, -1
+        else:
+            while upper_time - lower_time > page_duration:
+                middle_time = (lower_time + upper_time) // 2
+                if has_klines(lower_time, middle_time):
+                    upper_time = middle_time
+                else:
+                    lower_time = middle_time
+            klines = self.get_klines_online(asset, ref_asset, timeframe, lower_time, upper_time - 1, budget=budget)
+            first_timestamp = min(k.open_timestamp for k in klines)
+
+            # invariant: the last kline is in [lower_time, upper_time)
+            lower_time, upper_time = first_timestamp, check_timestamp
+            while upper_time - lower_time > page_duration:
+                middle_time = (lower_time + upper_time) // 2
+                if has_klines(middle_time, upper_time):
+                    lower_time = middle_time
+                else:
+                    upper_time = middle_time
+            klines = self.get_klines_online(asset, ref_asset, timeframe, lower_time, upper_time - 1, budget=budget)
+            last_timestamp = max(k.open_timestamp for k in klines)
 
-        self.logger.debug(msg)
+        self.logger.info(f"{asset} {ref_asset} {timeframe.name} klines are available from {first_timestamp}"
+                         f" to {last_timestamp}")
+        self.db.add_pair_listing(asset, ref_asset, timeframe, first_timestamp, last_timestamp, check_timestamp)
+        listing = first_timestamp, last_timestamp, check_timestamp
+        self._pairs_listing[(asset, ref_asset, timeframe)] = listing
+        return listing
+
+    def get_lookup_cost(self, asset: str, ref_asset: str, timestamp: int) -> float:
+        """
+        Estimate the duration of a call to get_closest_price: 0 if it can be answered locally, the observed latency
+        of the API otherwise (infinite if the API is unavailable)
+
+        :param asset: name of the asset in the trading pair (ex 'BTC' in 'BTCUSDT')
+        :type asset: str
+        :param ref_asset: name of the reference asset in the trading pair (ex 'USDT' in 'BTCUSDT')
+        :type ref_asset: str
+        :param timestamp: time of the price needed (in seconds)
+        :type timestamp: int
+        :return: expected duration of the lookup in seconds
+        :rtype: float
+        """
+        if self.has_local_price(asset, ref_asset, timestamp):
+            return 0.
+        if not self.is_available():
+            return float('inf')
+        if self.observed_latency is None:
+            return self.DEFAULT_LOOKUP_COST
+        return self.observed_latency
+
+    def is_available(self) -> bool:
+        """
+        Tell if the API can be requested, ie the circuit breaker is not open and the database is not read only. When
+        it is not, the lookups are answered from the local database only
+
+        :return: False if the requests to the API are currently refused
+        :rtype: bool
+        """
+        if self.db.read_only:
+            return False
+        return self.circuit_breaker is None or self.circuit_breaker.state != CircuitState.open
 
     def get_klines_online(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int, end_time: int,
-                          retry_count: int = 0) -> List[Kline]:
+                          retry_count: int = 0, budget: Optional[LookupBudget] = None) -> List[Kline]:
         """
         This method handles RateAPIException and calls _get_klines_online which will effectively
-        retrieve the online data
+        retrieve the online data. A BudgetExceededException is raised if the budget does not allow the call or the
+        wait for the rate limits, the budget is only charged for the requests sent. The deadline of the budget does
+        not bound a request already sent. A SourceUnavailableException is raised if the circuit breaker refuses the
+        call, the failures and the rate limits are reported to the circuit breaker.
+
+        The identical calls made concurrently by several threads are coalesced by the single_flight attribute: a
+        single API request is made and its result (or its error) is shared. The calls waiting for another one do not
+        consume their budget.
 
         :param asset: asset of the trading pair
         :type asset: str
@@ -110,16 +617,133 @@ class KlineRetriever(AbstractRetriever):
         :type end_time: Optional[int]
         :param retry_count: internal use, number of recursive loops done on this method
         :type retry_count: int
+        :param budget: limits on the time and the API calls, None for no limit
+        :type budget: Optional[LookupBudget]
+        :return: list of klines
+        :rtype: List[Kline]
+        """
+        if self.single_flight is None or retry_count:
+            return self._call_klines_api(asset, ref_asset, timeframe, start_time, end_time, retry_count, budget)
+
+        executed, budget_errors = [], []
+
+        def call() -> Optional[List[Kline]]:
+            executed.append(True)
+            try:
+                return self._call_klines_api(asset, ref_asset, timeframe, start_time, end_time, budget=budget)
+            except BudgetExceededException as err:
+                # the budget belongs to this caller only, the waiting callers make the call themselves
+                budget_errors.append(err)
+                return None
+
+        key = (self.name, asset, ref_asset, timeframe, start_time, end_time)
+        klines = self.single_flight.do(key, call)
+        if len(budget_errors):
+            raise budget_errors[0]
+        if not len(executed):
+            MetricsRegistry.increment('coalesced_calls_total', retriever=self.name, timeframe=timeframe.name)
+            if klines is None:
+                return self.get_klines_online(asset, ref_asset, timeframe, start_time, end_time, budget=budget)
+        return klines
+
+    def _call_klines_api(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int, end_time: int,
+                         retry_count: int = 0, budget: Optional[LookupBudget] = None) -> List[Kline]:
+        """
+        Make the API call of get_klines_online, without coalescing. The budget is only charged for the requests
+        actually sent: a request refused by the circuit breaker or by the deadline does not count as an API call. The
+        deadline does not bound a request already sent.
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: fetch only klines with an open time greater or equal than start_time
+        :type start_time: Optional[int]
+        :param end_time: fetch only klines with an open time lower than end_time
+        :type end_time: Optional[int]
+        :param retry_count: number of retries already made after a rate limit
+        :type retry_count: int
+        :param budget: limits on the time and the API calls, None for no limit
+        :type budget: Optional[LookupBudget]
         :return: list of klines
         :rtype: List[Kline]
         """
         if retry_count > AbstractRetriever.MAX_API_RETRY:
             raise RuntimeError(f"The API rate limits has been breached {retry_count} times in a row")
+        if budget is not None:
+            budget.check_online_call()
+        if self.circuit_breaker is not None and self.circuit_breaker.state == CircuitState.open:
+            raise SourceUnavailableException(f"the circuit breaker of {self.name} is open")
+        if self.rate_limiter is not None:
+            timeout = None if budget is None else budget.remaining_time()
+            if not self.rate_limiter.acquire(timeout=timeout):
+                budget.exhausted = True
+                raise BudgetExceededException("waiting for the rate limiter would go beyond the deadline of the lookup")
+        # the trial requests of a half open circuit are only taken once the request is sure to be sent
+        if self.circuit_breaker is not None and not self.circuit_breaker.allow_request():
+            raise SourceUnavailableException(f"the circuit breaker of {self.name} is open")
+        if budget is not None:
+            budget.record_online_call()
         try:
-            return self._get_klines_online(asset, ref_asset, timeframe, start_time, end_time)
+            MetricsRegistry.increment('online_calls_total', retriever=self.name, timeframe=timeframe.name)
+            with MetricsRegistry.timer('http_request_seconds', retriever=self.name, timeframe=timeframe.name), \
+                    Tracer.span('get_klines_online', retriever=self.name, asset=asset, ref_asset=ref_asset,
+                                timeframe=timeframe.name, start_time=start_time, end_time=end_time,
+                                retry_count=retry_count) as span:
+                request_start = time.perf_counter()
+                try:
+                    klines = self._get_klines_online(asset, ref_asset, timeframe, start_time, end_time)
+                except Exception:
+                    self._record_failure()
+                    raise
+                self._observe_latency(time.perf_counter() - request_start)
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_success()
+                span.set_attribute('n_klines', len(klines))
+                return klines
         except RateAPIException as err:
+            if not self.is_available():
+                raise SourceUnavailableException(f"the circuit breaker of {self.name} opened after a rate limit")
+            if budget is not None:
+                budget.check_wait(err.retry_after)
+            self.logger.warning("API rate limit reached, retrying in %.1f seconds", err.retry_after)
+            MetricsRegistry.increment('rate_limit_sleeps_total', retriever=self.name, timeframe=timeframe.name)
+            MetricsRegistry.increment('rate_limit_sleep_seconds_total', err.retry_after, retriever=self.name,
+                                      timeframe=timeframe.name)
             time.sleep(err.retry_after)
-            return self._get_klines_online(asset, ref_asset, timeframe, start_time, end_time)
+            return self._call_klines_api(asset, ref_asset, timeframe, start_time, end_time, retry_count + 1, budget)
+
+    def _record_failure(self):
+        """
+        Report a failed API call to the circuit breaker
+
+        :return: None
+        :rtype: None
+        """
+        if self.circuit_breaker is None:
+            return
+        was_available = self.is_available()
+        self.circuit_breaker.record_failure()
+        if was_available and not self.is_available():
+            self.logger.warning("too many failures on the API, the requests are stopped for %s seconds",
+                                self.circuit_breaker.cool_down)
+            MetricsRegistry.increment('circuit_opened_total', retriever=self.name)
+
+    def _observe_latency(self, latency: float):
+        """
+        Update the moving average of the API calls duration
+
+        :param latency: duration of the last API call in seconds
+        :type latency: float
+        :return: None
+        :rtype: None
+        """
+        if self.observed_latency is None:
+            self.observed_latency = latency
+        else:
+            self.observed_latency += self.LATENCY_SMOOTHING * (latency - self.observed_latency)
 
     @abstractmethod
     def _get_klines_online(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int,
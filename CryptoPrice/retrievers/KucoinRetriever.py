@@ -1,12 +1,13 @@
 import datetime
-from typing import List
+import time
+from typing import List, Optional
 
 from kucoin.client import Market
 
 from CryptoPrice.common.trade import TradingPair
 from CryptoPrice.exceptions import RateAPIException
 from CryptoPrice.retrievers.KlineRetriever import KlineRetriever
-from CryptoPrice.common.prices import Kline
+from CryptoPrice.common.prices import Kline, Price
 from CryptoPrice.utils.time import TIMEFRAME
 
 
@@ -30,10 +31,29 @@ class KucoinRetriever(KlineRetriever):
         TIMEFRAME.d1: '1day',
         TIMEFRAME.w1: '1week'
     }
+    max_klines_per_request = 1500
 
-    def __init__(self, kline_timeframe: TIMEFRAME = TIMEFRAME.m1, closest_window: int = 310):
-        self.client = Market(url='https://api.kucoin.com')
-        super(KucoinRetriever, self).__init__('kucoin', kline_timeframe, closest_window)
+    def __init__(self, kline_timeframe: TIMEFRAME = TIMEFRAME.m1, closest_window: int = 310,
+                 api_url: Optional[str] = None, db_name: Optional[str] = None):
+        """
+        Instantiate a Kucoin retriever
+
+        :param kline_timeframe: timeframe of the klines used to compute the prices, default 1 minute
+        :type kline_timeframe: TIMEFRAME
+        :param closest_window: time window in seconds to look for the closest kline, default 310
+        :type closest_window: int
+        :param api_url: url of the API to use instead of the Kucoin one, for example a local mock exchange
+            (ex: 'http://localhost:8080')
+        :type api_url: Optional[str]
+        :param db_name: name of the database of the klines, default to 'kucoin'. If api_url is provided, the default
+            name is derived from it (ex: 'kucoin_localhost_8080'), the klines of another API never go to the kucoin
+            database
+        :type db_name: Optional[str]
+        """
+        self.client = Market(url=api_url or 'https://api.kucoin.com')
+        if db_name is None and api_url is not None:
+            db_name = self.get_api_db_name('kucoin', api_url)
+        super(KucoinRetriever, self).__init__('kucoin', kline_timeframe, closest_window, db_name)
 
     def get_supported_pairs(self) -> List[TradingPair]:
         """
@@ -45,6 +65,15 @@ class KucoinRetriever(KlineRetriever):
         symbols = self.client.get_symbol_list()
         return [TradingPair(s['symbol'], s['baseCurrency'], s['quoteCurrency'], source=self.name) for s in symbols]
 
+    def get_supported_timeframes(self) -> List[TIMEFRAME]:
+        """
+        Return the timeframes of the klines provided by the Kucoin API
+
+        :return: list of timeframes
+        :rtype: List[TIMEFRAME]
+        """
+        return list(self.kline_translation)
+
     def _get_klines_online(self, asset: str, ref_asset: str, timeframe: TIMEFRAME,
                            start_time: int, end_time: int) -> List[Kline]:
         """
@@ -64,11 +93,10 @@ class KucoinRetriever(KlineRetriever):
         :rtype: List[Kline]
         """
         pair_name = f"{asset}-{ref_asset}"
-        batch_size = 1500
         interval_trad = self.kline_translation[timeframe]
         try:
             result = self.client.get_kline(symbol=pair_name, kline_type=interval_trad, startAt=start_time,
-                                           endAt=end_time, pageSize=batch_size)
+                                           endAt=end_time, pageSize=self.max_klines_per_request)
             if not isinstance(result, List):  # valid trading pair but no data
                 return []
         except Exception as e:
@@ -95,3 +123,23 @@ class KucoinRetriever(KlineRetriever):
                                 asset, ref_asset, timeframe, source=self.name))
 
         return klines
+
+    def _get_latest_prices_online(self) -> List[Price]:
+        """
+        Fetch the current prices of all the trading pairs with the Kucoin tickers endpoint
+
+        :return: list of the latest prices
+        :rtype: List[Price]
+        """
+        pairs = {p.name: p for p in self.supported_pairs}
+        timestamp = int(time.time())
+        prices = []
+        for ticker in self.client.get_all_tickers()['ticker']:
+            try:
+                pair = pairs[ticker['symbol']]
+            except KeyError:  # pair listed after the instantiation of the retriever
+                continue
+            if ticker.get('last') is None:  # no trade yet
+                continue
+            prices.append(Price(float(ticker['last']), pair.asset, pair.ref_asset, timestamp, source=self.name))
+        return prices
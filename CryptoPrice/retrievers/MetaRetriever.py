@@ -1,16 +1,24 @@
+import dataclasses
+import itertools
 from queue import Queue
-from typing import List, Optional, Dict, Tuple, Iterator
+from typing import List, Optional, Dict, Tuple, Iterator, Iterable
 
+from CryptoPrice.common.budget import LookupBudget
 from CryptoPrice.common.prices import Price, MetaPrice
 from CryptoPrice.common.trade import TradingPair
 from CryptoPrice.retrievers.AbstractRetriever import AbstractRetriever
+from CryptoPrice.utils.Tracer import Tracer
 
 
 class MetaRetriever(AbstractRetriever):
 
+    HOP_COST = 0.001  # cost added for each trading pair of a path, on top of the expected duration of its lookup
+    BIDIRECTIONAL_MIN_DEPTH = 4  # from this maximum depth, the trading paths are searched from both ends
+
     def __init__(self, retrievers: List[AbstractRetriever]):
         self.retrievers = {r.name: r for r in retrievers}
         super(MetaRetriever, self).__init__("meta_retriever")
+        self._latest_paths: Dict[Tuple, List[Tuple[List[str], List[TradingPair]]]] = {}
 
     def get_supported_pairs(self) -> List[TradingPair]:
         """
@@ -24,7 +32,8 @@ class MetaRetriever(AbstractRetriever):
             supported_pairs.extend(retriever.supported_pairs)
         return supported_pairs
 
-    def _get_closest_price(self, asset: str, ref_asset: str, timestamp: int) -> Optional[Price]:
+    def _get_closest_price(self, asset: str, ref_asset: str, timestamp: int, budget: Optional[LookupBudget] = None,
+                           tolerance: Optional[int] = None) -> Optional[Price]:
         """
         Will get the closest price possible in time for a trading pair asset/ref asset. If no price is found, return
         None
@@ -35,16 +44,24 @@ class MetaRetriever(AbstractRetriever):
         :type ref_asset: str
         :param timestamp: time to fetch the price needed (in seconds)
         :type timestamp: int
+        :param budget: limits on the time and the API calls of the lookup, None for no limit
+        :type budget: Optional[LookupBudget]
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the prices, None to use
+            the default precision of the retrievers
+        :type tolerance: Optional[int]
         :return: the price closest in time found or None if no price found
         :rtype: Optional[Price]
         """
-        for _, retriever in self.retrievers.items():
-            price = retriever.get_closest_price(asset, ref_asset, timestamp)
+        # the unavailable sources are tried last, they can only answer from their local data
+        for retriever in sorted(self.retrievers.values(), key=lambda r: not r.is_available()):
+            price = retriever.get_closest_price(asset, ref_asset, timestamp, budget, tolerance)
             if price is not None:
                 return price
 
     def get_mean_price(self, asset: str, ref_asset: str, timestamp: int, preferred_assets: Optional[List[str]] = None,
-                       max_depth: int = 3, max_depth_range: int = 0) -> Optional[MetaPrice]:
+                       max_depth: int = 3, max_depth_range: int = 0,
+                       max_paths: Optional[int] = None, budget: Optional[LookupBudget] = None,
+                       tolerance: Optional[int] = None) -> Optional[MetaPrice]:
         """
         Will use the method get_path_prices and return the mean price of an asset compared to a reference asset
         on a given timestamp.
@@ -63,30 +80,228 @@ class MetaRetriever(AbstractRetriever):
         :param max_depth_range: maximum length difference between different trading path. If the first trading path has
             a length of 1 and this parameter is equal to 2, trading_path with a length superior to 3 will be ignored
         :type max_depth_range: int
+        :param max_paths: maximum number of trading paths to use in the mean, the cheapest paths are used first
+            (see get_path_cost). Default None means that all the paths are used.
+        :type max_paths: Optional[int]
+        :param budget: limits on the time and the API calls of the lookup, None for no limit. When the budget is
+            exhausted, the best price found is returned with the partial flag
+        :type budget: Optional[LookupBudget]
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the prices, None to use
+            the default precision of the retrievers
+        :type tolerance: Optional[int]
         :return: Metaprice reflecting the value calculated with a mean of trading path
         :rtype: Optional[MetaPrice]
         """
+        with Tracer.span('get_mean_price', asset=asset, ref_asset=ref_asset, timestamp=timestamp,
+                         max_depth=max_depth) as span:
+            meta_prices = []
+            min_depth = max_depth + 1
+            for depth, meta_price in self._get_path_prices(asset, ref_asset, timestamp, preferred_assets,
+                                                           max_depth, -1, budget, tolerance):
+                if meta_price is not None:
+                    if min_depth > max_depth:
+                        min_depth = depth
+                    if depth - min_depth > max_depth_range:
+                        break
+                    else:
+                        meta_prices.append(meta_price)
+                        if max_paths is not None and len(meta_prices) >= max_paths:
+                            break
+            span.set_attribute('n_paths', len(meta_prices))
+            if len(meta_prices):
+                mean_price = MetaPrice.mean_from_meta_price(meta_prices)
+                if budget is not None and budget.exhausted:
+                    span.set_attribute('partial', True)
+                    mean_price = dataclasses.replace(mean_price, partial=True)
+                return mean_price
+
+    def get_price_matrix(self, assets: Iterable[str], ref_asset: str, timestamp: int,
+                         preferred_assets: Optional[List[str]] = None, max_depth: int = 3, max_depth_range: int = 0,
+                         tolerance: Optional[int] = None) -> Dict[str, Optional[MetaPrice]]:
+        """
+        Value several assets in the same reference asset at the same time, with the same results as calling
+        get_mean_price for each asset. The trading paths of all the assets are built at once, outward from the
+        reference asset: the paths of an intermediate asset are shared by all the assets trading with it, and the price
+        of each trading pair is looked up only once.
+
+        :param assets: names of the assets to value
+        :type assets: Iterable[str]
+        :param ref_asset: name of the reference asset
+        :type ref_asset: str
+        :param timestamp: time to fetch the prices needed (in seconds)
+        :type timestamp: int
+        :param preferred_assets: list of assets to construct the price paths from. If None, default value is
+            ['BTC', 'ETH']
+        :type preferred_assets: Optional[List[str]]
+        :param max_depth: maximum number of trading pair to use, default 3
+        :type max_depth: int
+        :param max_depth_range: maximum length difference between different trading path, default 0
+        :type max_depth_range: int
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the prices, None to use
+            the default precision of the retrievers
+        :type tolerance: Optional[int]
+        :return: the mean price of each asset, with the trading paths used, or None if no price could be found
+        :rtype: Dict[str, Optional[MetaPrice]]
+        """
+        if preferred_assets is None:
+            preferred_assets = ['BTC', 'ETH']
+        assets = list(dict.fromkeys(assets))
+        assets_neighbours = self.construct_assets_neighbours(preferred_assets + assets + [ref_asset])
+        intermediates = set(preferred_assets) - {ref_asset}
+        leg_prices: Dict[Tuple[str, str, str], Optional[Price]] = {}
+        # (asset, depth) -> complete paths from the asset to the reference asset with depth trading pairs, as the
+        # assets seen and the prices of the trading pairs
+        layers: Dict[Tuple[str, int], List[Tuple[List[str], List[Price]]]] = {(ref_asset, 0): [([ref_asset], [])]}
+
+        def get_leg_price(pair: TradingPair) -> Optional[Price]:
+            key = (pair.source, pair.asset, pair.ref_asset)
+            try:
+                return leg_prices[key]
+            except KeyError:
+                with Tracer.span('leg', source=pair.source, asset=pair.asset, ref_asset=pair.ref_asset):
+                    price = self.retrievers[pair.source].get_closest_price(pair.asset, pair.ref_asset, timestamp,
+                                                                           tolerance=tolerance)
+                leg_prices[key] = price
+                return price
+
+        def get_layer(asset: str, depth: int) -> List[Tuple[List[str], List[Price]]]:
+            try:
+                return layers[(asset, depth)]
+            except KeyError:
+                pass
+            paths = []
+            if depth > 0 and asset != ref_asset:
+                for next_asset, pairs in assets_neighbours.get(asset, {}).items():
+                    if next_asset != ref_asset and next_asset not in intermediates:
+                        continue
+                    next_paths = [p for p in get_layer(next_asset, depth - 1) if asset not in p[0]]
+                    if not len(next_paths):
+                        continue
+                    for pair in pairs:
+                        price = get_leg_price(pair)
+                        if price is not None:
+                            paths.extend(([asset] + next_assets, [price] + next_prices)
+                                         for next_assets, next_prices in next_paths)
+            layers[(asset, depth)] = paths
+            return paths
+
+        results: Dict[str, Optional[MetaPrice]] = {}
+        with Tracer.span('get_price_matrix', n_assets=len(assets), ref_asset=ref_asset, timestamp=timestamp) as span:
+            for asset in assets:
+                if asset == ref_asset:
+                    results[asset] = MetaPrice(1, asset, ref_asset, [], source=set('',))
+                    continue
+                meta_prices = []
+                min_depth = None
+                for depth in range(1, max_depth + 1):
+                    if min_depth is not None and depth - min_depth > max_depth_range:
+                        break
+                    paths = get_layer(asset, depth)
+                    if len(paths) and min_depth is None:
+                        min_depth = depth
+                    meta_prices.extend(MetaPrice.from_price_path(path_assets, path_prices)
+                                       for path_assets, path_prices in paths)
+                results[asset] = MetaPrice.mean_from_meta_price(meta_prices) if len(meta_prices) else None
+            span.set_attribute('n_legs', len(leg_prices))
+        return results
+
+    def get_latest_price(self, asset: str, ref_asset: str) -> Optional[Price]:
+        """
+        Return the current price of a trading pair from the snapshot of the first retriever listing it
+
+        :param asset: name of the asset in the trading pair (ex 'BTC' in 'BTCUSDT')
+        :type asset: str
+        :param ref_asset: name of the reference asset in the trading pair (ex 'USDT' in 'BTCUSDT')
+        :type ref_asset: str
+        :return: the latest price or None if no retriever has the trading pair in its snapshot
+        :rtype: Optional[Price]
+        """
+        if asset == ref_asset:
+            return super().get_latest_price(asset, ref_asset)
+        for retriever in self.retrievers.values():
+            try:
+                price = retriever.get_latest_prices().get((asset, ref_asset))
+            except NotImplementedError:
+                continue
+            if price is not None:
+                return price
+
+    def get_latest_prices(self) -> Dict[Tuple[str, str], Price]:
+        """
+        Return the current prices of all the trading pairs of all the retrievers, for a pair listed by several
+        retrievers the first one is used
+
+        :return: the latest prices per asset and reference asset
+        :rtype: Dict[Tuple[str, str], Price]
+        """
+        latest_prices = {}
+        for retriever in reversed(list(self.retrievers.values())):
+            try:
+                latest_prices.update(retriever.get_latest_prices())
+            except NotImplementedError:
+                continue
+        return latest_prices
+
+    def get_latest_mean_price(self, asset: str, ref_asset: str, preferred_assets: Optional[List[str]] = None,
+                              max_depth: int = 3, max_depth_range: int = 0) -> Optional[MetaPrice]:
+        """
+        Same as get_mean_price for the current time, but the prices of the trading paths are taken from the
+        snapshots of the latest prices of the retrievers: once the snapshots are fetched, no other request is made.
+        The trading paths are computed once per couple of assets and kept in memory.
+
+        :param asset: name of the asset to get the price of
+        :type asset: str
+        :param ref_asset: name of the reference asset
+        :type ref_asset: str
+        :param preferred_assets: list of assets to construct the price path from. If None, default value is
+            ['BTC', 'ETH']
+        :type preferred_assets: Optional[List[str]]
+        :param max_depth: maximum number of trading pair to use, default 3
+        :type max_depth: int
+        :param max_depth_range: maximum length difference between different trading path, default 0
+        :type max_depth_range: int
+        :return: Metaprice reflecting the current value calculated with a mean of trading path
+        :rtype: Optional[MetaPrice]
+        """
+        if asset == ref_asset:
+            return MetaPrice(1, asset, ref_asset, [], source=set('',))
+        key = (asset, ref_asset, None if preferred_assets is None else tuple(preferred_assets), max_depth)
+        try:
+            trading_paths = self._latest_paths[key]
+        except KeyError:
+            trading_paths = self.get_trading_paths(asset, ref_asset, preferred_assets, max_depth, -1)
+            trading_paths = self._latest_paths[key] = [] if trading_paths is None else list(trading_paths)
+
         meta_prices = []
-        min_depth = max_depth + 1
-        for meta_price in self.get_path_prices(asset, ref_asset, timestamp, preferred_assets,
-                                               max_depth, -1):
-            if meta_price is not None:
-                if min_depth > max_depth:
-                    min_depth = len(meta_price.prices)
-                if len(meta_price.prices) - min_depth > max_depth_range:
+        min_depth = None
+        for assets_p, trade_p in trading_paths:
+            if min_depth is not None and len(trade_p) - min_depth > max_depth_range:
+                break
+            price_path = []
+            for pair in trade_p:
+                try:
+                    price = self.retrievers[pair.source].get_latest_price(pair.asset, pair.ref_asset)
+                except NotImplementedError:
+                    price = None
+                if price is None:
                     break
-                else:
-                    meta_prices.append(meta_price)
+                price_path.append(price)
+            if len(price_path) == len(trade_p):
+                if min_depth is None:
+                    min_depth = len(trade_p)
+                meta_prices.append(MetaPrice.from_price_path(assets_p, price_path))
         if len(meta_prices):
             return MetaPrice.mean_from_meta_price(meta_prices)
 
     def get_path_prices(self, asset: str, ref_asset: str, timestamp: int,
                         preferred_assets: Optional[List[str]] = None, max_depth: int = 2,
-                        max_depth_range: int = -1) -> Iterator[MetaPrice]:
+                        max_depth_range: int = -1, budget: Optional[LookupBudget] = None,
+                        tolerance: Optional[int] = None) -> Iterator[MetaPrice]:
         """
         Iterator that return MetaPrices that estimates the price of an asset compared to a reference asset.
         It will use the trading pair at its disposal to create trading path from the asset to the ref asset.
-        It use a BFS algorithm, so the shortest path will be returned first.
+        The shortest paths are returned first and paths of the same length are ordered by cost (see get_path_cost),
+        so the paths already available locally are used before the ones that need an API call.
         If no price is found, return None
 
         :param max_depth_range:
@@ -106,35 +321,163 @@ class MetaRetriever(AbstractRetriever):
             a length of 1 and this parameter is equal to 2, trading_path with a length superior to 3 will be ignored.
             Default -1 means that this parameter is ignored.
         :type max_depth_range: int
+        :param budget: limits on the time and the API calls of the lookup, None for no limit. Once the budget is
+            exhausted, only the local data is used and the MetaPrices are flagged as partial
+        :type budget: Optional[LookupBudget]
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the prices, None to use
+            the default precision of the retrievers
+        :type tolerance: Optional[int]
         :return: Metaprice reflecting the value calculated through a trading path
         :rtype: Optional[MetaPrice]
         """
+        for _, meta_price in self._get_path_prices(asset, ref_asset, timestamp, preferred_assets, max_depth,
+                                                   max_depth_range, budget, tolerance):
+            yield meta_price
+
+    def _get_path_prices(self, asset: str, ref_asset: str, timestamp: int, preferred_assets: Optional[List[str]],
+                         max_depth: int, max_depth_range: int, budget: Optional[LookupBudget],
+                         tolerance: Optional[int]) -> Iterator[Tuple[int, Optional[MetaPrice]]]:
+        """
+        Same as get_path_prices, but each MetaPrice comes with the length of its trading path, as the legs of the
+        MetaPrice are not kept when the provenance mode is ProvenanceMode.none
+
+        :return: couples of trading path length and MetaPrice
+        :rtype: Iterator[Tuple[int, Optional[MetaPrice]]]
+        """
         if asset == ref_asset:
-            yield MetaPrice(1, asset, ref_asset, [], source=set('',))
+            yield 0, MetaPrice(1, asset, ref_asset, [], source=set('',))
+            return
+        trading_paths = self.get_trading_paths(asset, ref_asset, preferred_assets, max_depth, max_depth_range)
+        if trading_paths is None:
+            yield 0, None
             return
+
+        for assets_p, trade_p in self.sort_paths_by_cost(trading_paths, timestamp):
+            meta_price = self.get_trading_path_price(assets_p, trade_p, timestamp, budget, tolerance)
+            if meta_price is not None:
+                yield len(trade_p), meta_price
+
+    def get_trading_paths(self, asset: str, ref_asset: str, preferred_assets: Optional[List[str]] = None,
+                          max_depth: int = 2,
+                          max_depth_range: int = -1) -> Optional[Iterator[Tuple[List[str], List[TradingPair]]]]:
+        """
+        Return an iterator over the trading paths linking an asset to a reference asset, the shortest paths first.
+        No price is fetched.
+
+        :param asset: name of the asset to get the price of
+        :type asset: str
+        :param ref_asset: name of the reference asset
+        :type ref_asset: str
+        :param preferred_assets: list of assets to construct the price path from. If None, default value is
+            ['BTC', 'ETH']
+        :type preferred_assets: Optional[List[str]]
+        :param max_depth: maximum number of trading pair to use, default 2
+        :type max_depth: int
+        :param max_depth_range: maximum length difference between different trading path. Default -1 means that
+            this parameter is ignored.
+        :type max_depth_range: int
+        :return: iterator of assets seen on the path and trading pairs to take, None if the asset or the reference
+            asset is not supported
+        :rtype: Optional[Iterator[Tuple[List[str], List[TradingPair]]]]
+        """
         if preferred_assets is None:
             preferred_assets = ['BTC', 'ETH']
 
         assets_neighbours = self.construct_assets_neighbours(preferred_assets + [asset, ref_asset])
 
         if asset not in assets_neighbours or ref_asset not in assets_neighbours:
-            yield None
-            return
+            return None
 
-        seen_assets = [asset]
-        current_path = []
-        for assets_p, trade_p in self._explore_assets_path(ref_asset, assets_neighbours, seen_assets,
-                                                           current_path, max_depth=max_depth,
-                                                           max_depth_range=max_depth_range):
-            price_path = []
-            for pair in trade_p:
-                price = self.retrievers[pair.source].get_closest_price(pair.asset, pair.ref_asset, timestamp)
-                if price is not None:
-                    price_path.append(price)
-                else:
+        if max_depth >= self.BIDIRECTIONAL_MIN_DEPTH:
+            return self._explore_assets_path_bidirectional(asset, ref_asset, assets_neighbours, max_depth=max_depth,
+                                                           max_depth_range=max_depth_range)
+        return self._explore_assets_path(ref_asset, assets_neighbours, [asset], [], max_depth=max_depth,
+                                         max_depth_range=max_depth_range)
+
+    def get_path_cost(self, trading_path: List[TradingPair], timestamp: int,
+                      legs_cost: Optional[Dict[Tuple[str, str, str], float]] = None) -> float:
+        """
+        Estimate the cost of pricing a trading path: the expected duration of the lookup of each trading pair (0 if
+        it is available locally, the observed latency of its source otherwise) plus a small cost per trading pair
+
+        :param trading_path: trading pairs of the path
+        :type trading_path: List[TradingPair]
+        :param timestamp: time of the price needed (in seconds)
+        :type timestamp: int
+        :param legs_cost: if provided, dictionary used to remember the cost of each trading pair between calls
+        :type legs_cost: Optional[Dict[Tuple[str, str, str], float]]
+        :return: the cost of the path
+        :rtype: float
+        """
+        if legs_cost is None:
+            legs_cost = {}
+        cost = self.HOP_COST * len(trading_path)
+        for pair in trading_path:
+            key = (pair.source, pair.asset, pair.ref_asset)
+            try:
+                cost += legs_cost[key]
+            except KeyError:
+                leg_cost = self.retrievers[pair.source].get_lookup_cost(pair.asset, pair.ref_asset, timestamp)
+                legs_cost[key] = leg_cost
+                cost += leg_cost
+        return cost
+
+    def sort_paths_by_cost(self, trading_paths: Iterable[Tuple[List[str], List[TradingPair]]],
+                           timestamp: int) -> Iterator[Tuple[List[str], List[TradingPair]]]:
+        """
+        Order the trading paths of the same length by cost, the paths have to be ordered by length.
+        The paths are read lazily, one length at a time.
+
+        :param trading_paths: trading paths ordered by length, as returned by get_trading_paths
+        :type trading_paths: Iterable[Tuple[List[str], List[TradingPair]]]
+        :param timestamp: time of the price needed (in seconds)
+        :type timestamp: int
+        :return: the trading paths, the cheapest first for each length
+        :rtype: Iterator[Tuple[List[str], List[TradingPair]]]
+        """
+        legs_cost = {}
+        for _, same_length_paths in itertools.groupby(trading_paths, key=lambda path: len(path[1])):
+            same_length_paths = list(same_length_paths)
+            if len(same_length_paths) > 1:
+                same_length_paths.sort(key=lambda path: self.get_path_cost(path[1], timestamp, legs_cost))
+            yield from same_length_paths
+
+    def get_trading_path_price(self, assets: List[str], trading_path: List[TradingPair],
+                               timestamp: int, budget: Optional[LookupBudget] = None,
+                               tolerance: Optional[int] = None) -> Optional[MetaPrice]:
+        """
+        Fetch the price of each trading pair of a trading path and combine them
+
+        :param assets: list of assets seen on the path (in order)
+        :type assets: List[str]
+        :param trading_path: trading pairs to use to go from the first asset to the last one
+        :type trading_path: List[TradingPair]
+        :param timestamp: time to fetch the price needed (in seconds)
+        :type timestamp: int
+        :param budget: limits on the time and the API calls of the lookup, None for no limit
+        :type budget: Optional[LookupBudget]
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the prices, None to use
+            the default precision of the retrievers
+        :type tolerance: Optional[int]
+        :return: the price between the first and the last asset, None if a price of the path is missing. It is
+            flagged as partial if the budget is exhausted
+        :rtype: Optional[MetaPrice]
+        """
+        price_path = []
+        with Tracer.span('path', path='>'.join(assets)) as path_span:
+            for pair in trading_path:
+                with Tracer.span('leg', source=pair.source, asset=pair.asset, ref_asset=pair.ref_asset):
+                    price = self.retrievers[pair.source].get_closest_price(pair.asset, pair.ref_asset, timestamp,
+                                                                           budget, tolerance)
+                if price is None:
                     break
-            if len(price_path) + 1 == len(assets_p):  # all prices have been found
-                yield MetaPrice.from_price_path(assets_p, price_path)
+                price_path.append(price)
+            path_span.set_attribute('complete', len(price_path) == len(trading_path))
+        if len(price_path) == len(trading_path):  # all prices have been found
+            meta_price = MetaPrice.from_price_path(assets, price_path)
+            if budget is not None and budget.exhausted:
+                meta_price = dataclasses.replace(meta_price, partial=True)
+            return meta_price
 
     def construct_assets_neighbours(self, asset_subsets: List[str]) -> Dict:
         """
@@ -210,3 +553,60 @@ class MetaRetriever(AbstractRetriever):
 
                         elif len(current_path) + 1 < max_depth:
                             to_explore.put((seen_assets + [next_asset], current_path + [pair]))
+
+    @staticmethod
+    def _explore_assets_path_bidirectional(asset: str, target_asset: str, assets_neighbours: Dict,
+                                           max_depth: int = 4, max_depth_range: int = -1
+                                           ) -> Iterator[Tuple[List[str], List[TradingPair]]]:
+        """
+        Iterator returning the same trading paths as _explore_assets_path, ordered by length, but built by meeting
+        in the middle: the paths are explored from both ends up to half of max_depth, then joined on their common
+        asset. It avoids to enumerate the whole tree of paths when max_depth is large.
+
+        :param asset: asset to start from
+        :type asset: str
+        :param target_asset: asset to look for
+        :type target_asset: str
+        :param assets_neighbours: dictionary of neighbours for assets
+        :type assets_neighbours: Dict
+        :param max_depth: maximum number of trading pair to use, default 4
+        :type max_depth: int
+        :param max_depth_range: maximum length difference between different trading path. Default -1 means that
+            this parameter is ignored.
+        :type max_depth_range: int
+        :return: list of assets to explore and the trading path to take
+        :rtype: Tuple[List[str], List[TradingPair]]
+        """
+        def explore_half(start_asset: str, forbidden_asset: str, depth: int) -> List[Dict]:
+            # half_paths[d][meeting asset] = paths of length d from start_asset, not going through forbidden_asset
+            half_paths = [{start_asset: [([start_asset], [])]}]
+            for _ in range(depth):
+                next_paths = {}
+                for current_asset, paths in half_paths[-1].items():
+                    if current_asset == forbidden_asset:
+                        continue
+                    for next_asset, pairs in assets_neighbours[current_asset].items():
+                        for seen_assets, current_path in paths:
+                            if next_asset in seen_assets:
+                                continue
+                            for pair in pairs:
+                                next_paths.setdefault(next_asset, []).append((seen_assets + [next_asset],
+                                                                              current_path + [pair]))
+                half_paths.append(next_paths)
+            return half_paths
+
+        forward_paths = explore_half(asset, target_asset, (max_depth + 1) // 2)
+        backward_paths = explore_half(target_asset, asset, max_depth // 2)
+        min_depth = None
+        for depth in range(1, max_depth + 1):
+            if min_depth is not None and depth - min_depth > max_depth_range:
+                return
+            forward_depth = (depth + 1) // 2
+            for meeting_asset, paths in forward_paths[forward_depth].items():
+                for backward_assets, backward_path in backward_paths[depth - forward_depth].get(meeting_asset, []):
+                    for forward_assets, forward_path in paths:
+                        if len(set(forward_assets).intersection(backward_assets)) > 1:
+                            continue
+                        if min_depth is None and max_depth_range >= 0:
+                            min_depth = depth
+                        yield forward_assets + backward_assets[-2::-1], forward_path + backward_path[::-1]
@@ -0,0 +1,67 @@
+from typing import Dict, Tuple, Hashable
+
+
+class ReadAheadPolicy:
+    """
+    This class decides the time range to fetch online when a kline is missing locally. When the missing lookups of a
+    trading pair are sequential or clustered in time (for example a ledger read chronologically), the fetched range
+    grows geometrically in the direction of travel, up to the maximum range an API can return in one request.
+    """
+
+    def __init__(self, cluster_distance: int = 3600, growth_factor: int = 4):
+        """
+        Instantiate a read ahead policy
+
+        :param cluster_distance: two lookups are considered as clustered if they are less than this distance (in
+            seconds) apart, on top of the range fetched for the first one
+        :type cluster_distance: int
+        :param growth_factor: multiplication factor of the fetched range for each new clustered lookup
+        :type growth_factor: int
+        """
+        self.cluster_distance = cluster_distance
+        self.growth_factor = growth_factor
+        self._states: Dict[Hashable, Tuple[int, int, int]] = {}  # key -> last timestamp, direction, duration
+
+    def get_fetch_range(self, key: Hashable, timestamp: int, window: int, max_duration: int) -> Tuple[int, int]:
+        """
+        Return the time range [start_time, end_time) to fetch online for a lookup, and record the lookup
+
+        :param key: identifier of the access pattern, for example (asset, ref_asset, timeframe)
+        :type key: Hashable
+        :param timestamp: time of the lookup
+        :type timestamp: int
+        :param window: the returned range always contains [timestamp - window, timestamp + window)
+        :type window: int
+        :param max_duration: maximum duration of the returned range
+        :type max_duration: int
+        :return: start_time, end_time
+        :rtype: Tuple[int, int]
+        """
+        duration = 2 * window
+        direction = 0
+        try:
+            last_timestamp, last_direction, last_duration = self._states[key]
+        except KeyError:
+            pass
+        else:
+            if abs(timestamp - last_timestamp) <= last_duration + self.cluster_distance:
+                direction = (timestamp > last_timestamp) - (timestamp < last_timestamp) or last_direction
+                duration = max(duration, min(last_duration * self.growth_factor, max_duration))
+        self._states[key] = timestamp, direction, duration
+
+        if direction > 0:
+            start_time = timestamp - window
+            return start_time, start_time + duration
+        if direction < 0:
+            end_time = timestamp + window
+            return end_time - duration, end_time
+        return timestamp - duration // 2, timestamp + duration - duration // 2
+
+    def reset(self):
+        """
+        Forget all the recorded lookups
+
+        :return: None
+        :rtype: None
+        """
+        self._states.clear()
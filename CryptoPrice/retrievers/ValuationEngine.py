@@ -0,0 +1,446 @@
+from __future__ import annotations
+
+import math
+from array import array
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Tuple, Dict
+
+from CryptoPrice.common.prices import Kline, MetaPrice, Price
+from CryptoPrice.common.trade import TradingPair
+from CryptoPrice.exceptions import SourceUnavailableException
+from CryptoPrice.retrievers.KlineRetriever import KlineRetriever
+from CryptoPrice.retrievers.MetaRetriever import MetaRetriever
+from CryptoPrice.storage.KlineDataBase import KlineDataBase
+from CryptoPrice.storage.ShardedKlineDataBase import ShardedKlineDataBase, ShardingMode
+from CryptoPrice.utils.LoggerGenerator import LoggerGenerator
+from CryptoPrice.utils.Tracer import Tracer
+from CryptoPrice.utils.time import TIMEFRAME
+
+PriceRequest = Tuple[str, str, int]  # asset, ref_asset, timestamp
+TradingPath = Tuple[List[str], List[TradingPair]]
+FetchWindow = Tuple[str, str, str, TIMEFRAME, int, int]  # source, asset, ref_asset, timeframe, start_time, end_time
+LegsTask = List[Tuple[List[Tuple[str, str, str]], int]]  # legs as source, asset, ref_asset and timestamp of each path
+
+
+@dataclass
+class SourceSpec:
+    """
+    Picklable description of a KlineRetriever, from which a worker process answers the lookups of the retriever on a
+    read only connection to its database, without any API client
+    """
+    name: str
+    kline_timeframe: TIMEFRAME
+    closest_window: int
+    supported_pairs: List[TradingPair]
+    supported_timeframes: List[TIMEFRAME]
+    db_name: str
+    sharding: Optional[ShardingMode] = None  # None for a KlineDataBase, else the sharding of a ShardedKlineDataBase
+    n_shards: int = 0
+
+    @classmethod
+    def from_retriever(cls, retriever: KlineRetriever) -> SourceSpec:
+        """
+        Describe a retriever and its database
+
+        :param retriever: retriever to describe
+        :type retriever: KlineRetriever
+        :return: the description of the retriever
+        :rtype: SourceSpec
+        """
+        db = retriever.db
+        spec = cls(retriever.name, retriever.kline_timeframe, retriever.closest_window, retriever.supported_pairs,
+                   retriever.get_supported_timeframes(), db.name)
+        if isinstance(db, ShardedKlineDataBase):
+            spec.db_name, spec.sharding, spec.n_shards = db.source, db.sharding, db.n_shards
+        return spec
+
+
+class LocalKlineRetriever(KlineRetriever):
+    """
+    KlineRetriever of a worker process: it answers from a read only connection to the database of the retriever it
+    describes and never calls any API
+    """
+
+    def __init__(self, spec: SourceSpec):
+        """
+        Open the database of a retriever in read only mode
+
+        :param spec: description of the retriever
+        :type spec: SourceSpec
+        """
+        self.spec = spec
+        if spec.sharding is None:
+            db = KlineDataBase(spec.db_name, read_only=True)
+            db.source = spec.name
+        else:
+            db = ShardedKlineDataBase(spec.db_name, spec.sharding, spec.n_shards, read_only=True)
+        super().__init__(spec.name, spec.kline_timeframe, spec.closest_window, db=db)
+        self.read_ahead_policy = None
+        self.circuit_breaker = None
+        self.single_flight = None
+
+    def get_supported_pairs(self) -> List[TradingPair]:
+        return self.spec.supported_pairs
+
+    def get_supported_timeframes(self) -> List[TIMEFRAME]:
+        return self.spec.supported_timeframes
+
+    def _get_klines_online(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int,
+                           end_time: int) -> List[Kline]:
+        raise SourceUnavailableException(f"{self.name} answers from its local database only")
+
+
+_worker_retrievers: Dict[str, LocalKlineRetriever] = {}  # retrievers of a worker process, per source
+
+
+def _init_worker(specs: List[SourceSpec]):
+    """
+    Build the retrievers of a worker process on read only databases: the worker answers from the local data only,
+    the missing klines being fetched by the parent process
+
+    :param specs: descriptions of the retrievers of the parent process
+    :type specs: List[SourceSpec]
+    :return: None
+    :rtype: None
+    """
+    for spec in specs:
+        _worker_retrievers[spec.name] = LocalKlineRetriever(spec)
+
+
+def _price_legs(task: LegsTask, tolerance: Optional[int]) -> Tuple[array, array]:
+    """
+    Look up the prices of the legs of trading paths in a worker process. The results are returned as two flat arrays,
+    much cheaper to send back than Price objects
+
+    :param task: legs of each path and the timestamp to price them at
+    :type task: List[Tuple[List[Tuple[str, str, str]], int]]
+    :param tolerance: maximum time difference in seconds accepted between the timestamps and the prices
+    :type tolerance: Optional[int]
+    :return: the value and the timestamp of the price of each leg, in the order of the task. When a leg has no price,
+        its value and the values of the next legs of its path are nan
+    :rtype: Tuple[array, array]
+    """
+    values, timestamps = array('d'), array('q')
+    for legs, timestamp in task:
+        n_found = 0
+        for source, asset, ref_asset in legs:
+            price = _worker_retrievers[source].get_closest_price(asset, ref_asset, timestamp, tolerance=tolerance)
+            if price is None:
+                break
+            values.append(price.value)
+            timestamps.append(price.timestamp)
+            n_found += 1
+        values.extend([math.nan] * (len(legs) - n_found))
+        timestamps.extend([0] * (len(legs) - n_found))
+    return values, timestamps
+
+
+@dataclass
+class ValuationReport:
+    """
+    Result of a valuation: the prices, in the order of the requests, and statistics about the fetch plan
+    """
+    prices: List[Optional[MetaPrice]] = field(default_factory=list)
+    n_requests: int = 0
+    n_unique_requests: int = 0
+    naive_api_calls: int = 0  # one API call per missing leg lookup, as done by calling get_mean_price for each row
+    planned_api_calls: int = 0
+
+    @property
+    def api_calls_saved(self) -> int:
+        return self.naive_api_calls - self.planned_api_calls
+
+
+class ValuationEngine:
+    """
+    This class values a whole list of price requests (a transaction ledger for example) with the same results as
+    calling MetaRetriever.get_mean_price for each request, but with far less API calls:
+
+    - the requests are deduplicated
+    - the trading paths are resolved once per couple of assets
+    - the leg lookups missing locally are grouped by source, trading pair and time window into a fetch plan where each
+      window fits in a single API request
+    - the plan is executed in parallel, then all the prices are computed from the local data
+
+    .. code-block:: python
+
+        engine = ValuationEngine(get_default_retriever())
+        report = engine.value([('LTC', 'USDT', 1609459200), ('ETH', 'EUR', 1612137600)])
+        print(report.prices, report.api_calls_saved)
+
+    Once the klines are fetched, computing the prices is bound to a single core. With processes > 0, the leg lookups
+    are spread over a pool of worker processes. The workers receive a description of each retriever of the engine
+    (see SourceSpec) and answer from read only connections to their databases, without building any API client.
+
+    .. code-block:: python
+
+        engine = ValuationEngine(get_default_retriever(), processes=8)
+        report = engine.value(ledger)
+        engine.close()
+    """
+
+    def __init__(self, retriever: MetaRetriever, preferred_assets: Optional[List[str]] = None, max_depth: int = 3,
+                 max_depth_range: int = 0, max_workers: int = 4, tolerance: Optional[int] = None,
+                 processes: int = 0):
+        """
+        Instantiate a valuation engine, the arguments preferred_assets, max_depth, max_depth_range and tolerance have
+        the same meaning as for MetaRetriever.get_mean_price
+
+        :param retriever: retriever used to compute the prices
+        :type retriever: MetaRetriever
+        :param preferred_assets: list of assets to construct the price path from. If None, default value is
+            ['BTC', 'ETH']
+        :type preferred_assets: Optional[List[str]]
+        :param max_depth: maximum number of trading pair to use, default 3
+        :type max_depth: int
+        :param max_depth_range: maximum length difference between different trading path, default 0
+        :type max_depth_range: int
+        :param max_workers: maximum number of API requests made in parallel
+        :type max_workers: int
+        :param tolerance: maximum time difference in seconds accepted between the timestamps and the prices, None to
+            use the default precision of the retrievers
+        :type tolerance: Optional[int]
+        :param processes: number of worker processes computing the prices, 0 to compute them in the calling thread.
+            Only possible if all the retrievers are based on klines
+        :type processes: int
+        """
+        if processes > 0 and not all(isinstance(r, KlineRetriever) for r in retriever.retrievers.values()):
+            raise ValueError("the prices can only be computed by worker processes with retrievers based on klines")
+        self.retriever = retriever
+        self.preferred_assets = preferred_assets
+        self.max_depth = max_depth
+        self.max_depth_range = max_depth_range
+        self.max_workers = max_workers
+        self.tolerance = tolerance
+        self.processes = processes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.logger = LoggerGenerator.get_logger("valuation_engine")
+
+    def close(self):
+        """
+        Stop the worker processes, if any
+
+        :return: None
+        :rtype: None
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def value(self, requests: Iterable[PriceRequest]) -> ValuationReport:
+        """
+        Compute the mean price of each request
+
+        :param requests: couples of asset, reference asset and timestamp to value
+        :type requests: Iterable[Tuple[str, str, int]]
+        :return: the prices in the order of the requests (None if no price could be found) and the plan statistics
+        :rtype: ValuationReport
+        """
+        requests = list(requests)
+        unique_requests = list(dict.fromkeys(requests))
+        report = ValuationReport(n_requests=len(requests), n_unique_requests=len(unique_requests))
+        with Tracer.span('value', n_requests=len(requests), n_unique_requests=len(unique_requests)) as span:
+            paths = self._resolve_paths(unique_requests)
+            results = self._compute_prices(unique_requests, paths, report)
+            report.prices = [results[request] for request in requests]
+            span.set_attribute('naive_api_calls', report.naive_api_calls)
+            span.set_attribute('planned_api_calls', report.planned_api_calls)
+        self.logger.info("%s requests valued, %s API calls planned instead of %s",
+                         len(requests), report.planned_api_calls, report.naive_api_calls)
+        return report
+
+    def _resolve_paths(self, requests: List[PriceRequest]) -> Dict[Tuple[str, str], List[TradingPath]]:
+        """
+        Find the trading paths of each couple of assets, the shortest first
+
+        :param requests: unique requests to value
+        :type requests: List[Tuple[str, str, int]]
+        :return: the trading paths per couple of assets
+        :rtype: Dict[Tuple[str, str], List[Tuple[List[str], List[TradingPair]]]]
+        """
+        paths = {}
+        for asset, ref_asset, _ in requests:
+            if (asset, ref_asset) in paths:
+                continue
+            if asset == ref_asset:
+                trading_paths = None
+            else:
+                trading_paths = self.retriever.get_trading_paths(asset, ref_asset, self.preferred_assets,
+                                                                 self.max_depth, -1)
+            paths[(asset, ref_asset)] = [] if trading_paths is None else list(trading_paths)
+        return paths
+
+    def _compute_prices(self, requests: List[PriceRequest], paths: Dict[Tuple[str, str], List[TradingPath]],
+                        report: ValuationReport) -> Dict[PriceRequest, Optional[MetaPrice]]:
+        """
+        Compute the prices depth by depth: the paths of a given length are only priced for the requests that still
+        need them, as get_mean_price stops at the first complete paths (plus max_depth_range)
+
+        :param requests: unique requests to value
+        :type requests: List[Tuple[str, str, int]]
+        :param paths: trading paths per couple of assets
+        :type paths: Dict[Tuple[str, str], List[Tuple[List[str], List[TradingPair]]]]
+        :param report: report to update with the plan statistics
+        :type report: ValuationReport
+        :return: the mean price of each request
+        :rtype: Dict[Tuple[str, str, int], Optional[MetaPrice]]
+        """
+        meta_prices: Dict[PriceRequest, List[MetaPrice]] = {}
+        min_depths: Dict[PriceRequest, int] = {}
+        for request in requests:
+            asset, ref_asset, _ = request
+            meta_prices[request] = []
+            if asset == ref_asset:
+                meta_prices[request].append(MetaPrice(1, asset, ref_asset, [], source=set('',)))
+                min_depths[request] = 0
+
+        for depth in range(1, self.max_depth + 1):
+            to_price = []
+            for request in requests:
+                if request in min_depths and depth - min_depths[request] > self.max_depth_range:
+                    continue
+                asset, ref_asset, _ = request
+                to_price.extend((request, path) for path in paths[(asset, ref_asset)] if len(path[1]) == depth)
+            if not len(to_price):
+                continue
+
+            legs = {(pair.source, pair.asset, pair.ref_asset, request[2])
+                    for request, (_, trading_path) in to_price for pair in trading_path}
+            self._execute_plan(legs, report)
+
+            if self.processes > 0:
+                path_prices = self._price_paths_in_processes(to_price)
+            else:
+                path_prices = [self.retriever.get_trading_path_price(assets, trading_path, request[2],
+                                                                     tolerance=self.tolerance)
+                               for request, (assets, trading_path) in to_price]
+            for (request, _), meta_price in zip(to_price, path_prices):
+                if meta_price is not None:
+                    meta_prices[request].append(meta_price)
+                    min_depths.setdefault(request, depth)
+
+        return {request: MetaPrice.mean_from_meta_price(prices) if len(prices) else None
+                for request, prices in meta_prices.items()}
+
+    def _price_paths_in_processes(self, to_price: List[Tuple[PriceRequest, TradingPath]]) -> List[Optional[MetaPrice]]:
+        """
+        Price trading paths with the worker processes. The paths are sorted by trading pair and time before being
+        split into tasks, so that each worker reads few tables on a short time range
+
+        :param to_price: requests and trading paths to price
+        :type to_price: List[Tuple[Tuple[str, str, int], Tuple[List[str], List[TradingPair]]]]
+        :return: the price of each path, None if a price of the path is missing
+        :rtype: List[Optional[MetaPrice]]
+        """
+        for retriever in self.retriever.retrievers.values():
+            if isinstance(retriever, KlineRetriever):
+                retriever.db.flush()  # the workers only see the committed data
+        if self._pool is None:
+            specs = [SourceSpec.from_retriever(r) for r in self.retriever.retrievers.values()]
+            self._pool = ProcessPoolExecutor(self.processes, initializer=_init_worker, initargs=(specs,))
+
+        order = sorted(range(len(to_price)),
+                       key=lambda i: ([(p.asset, p.ref_asset) for p in to_price[i][1][1]], to_price[i][0][2]))
+        chunk_size = max(1, math.ceil(len(order) / (4 * self.processes)))
+        chunks = [order[i:i + chunk_size] for i in range(0, len(order), chunk_size)]
+        tasks = [[([(p.source, p.asset, p.ref_asset) for p in to_price[i][1][1]], to_price[i][0][2]) for i in chunk]
+                 for chunk in chunks]
+
+        path_prices: List[Optional[MetaPrice]] = [None] * len(to_price)
+        with Tracer.span('price_paths_in_processes', n_paths=len(to_price), n_tasks=len(tasks)):
+            results = self._pool.map(_price_legs, tasks, [self.tolerance] * len(tasks))
+            for chunk, (values, timestamps) in zip(chunks, results):
+                offset = 0
+                for i in chunk:
+                    assets, trading_path = to_price[i][1]
+                    leg_values = values[offset:offset + len(trading_path)]
+                    if not any(math.isnan(v) for v in leg_values):
+                        price_path = [Price(v, pair.asset, pair.ref_asset, t, pair.source)
+                                      for v, t, pair in zip(leg_values, timestamps[offset:], trading_path)]
+                        path_prices[i] = MetaPrice.from_price_path(assets, price_path)
+                    offset += len(trading_path)
+        return path_prices
+
+    def _execute_plan(self, legs: Iterable[Tuple[str, str, str, int]], report: ValuationReport):
+        """
+        Fetch online, in parallel, the klines needed by the leg lookups missing locally and save them in the
+        databases of the retrievers
+
+        :param legs: leg lookups as source, asset, ref_asset and timestamp
+        :type legs: Iterable[Tuple[str, str, str, int]]
+        :param report: report to update with the plan statistics
+        :type report: ValuationReport
+        :return: None
+        :rtype: None
+        """
+        plan = self.plan_fetches(legs, report)
+        if not len(plan):
+            return
+
+        def fetch(window: FetchWindow):
+            source, asset, ref_asset, timeframe, start_time, end_time = window
+            try:
+                return self.retriever.retrievers[source].get_klines_online(asset, ref_asset, timeframe, start_time,
+                                                                           end_time - 1)
+            except SourceUnavailableException:
+                return None  # the lookups will be answered from the local data
+
+        with Tracer.span('execute_plan', n_windows=len(plan)), \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # the databases are bound to the main thread, only the API calls are made in the workers
+            for window, klines in zip(plan, executor.map(fetch, plan)):
+                if klines is None:
+                    continue
+                source, asset, ref_asset, timeframe, start_time, end_time = window
+                self.retriever.retrievers[source].save_fetched_klines(asset, ref_asset, timeframe, klines,
+                                                                      start_time, end_time)
+        for source in {window[0] for window in plan}:
+            self.retriever.retrievers[source].db.commit()
+
+    def plan_fetches(self, legs: Iterable[Tuple[str, str, str, int]],
+                     report: Optional[ValuationReport] = None) -> List[FetchWindow]:
+        """
+        Group the leg lookups that can not be answered locally into time windows, each window being fetched with a
+        single API request. Only the available sources based on klines are planned, the others are queried lookup by
+        lookup. With a tolerance, each lookup is planned on the timeframe chosen by KlineRetriever.get_lookup_timeframe.
+
+        :param legs: leg lookups as source, asset, ref_asset and timestamp
+        :type legs: Iterable[Tuple[str, str, str, int]]
+        :param report: if provided, report to update with the number of API calls planned and avoided
+        :type report: Optional[ValuationReport]
+        :return: the windows to fetch as source, asset, ref_asset, timeframe, start_time (included) and end_time
+            (excluded)
+        :rtype: List[Tuple[str, str, str, TIMEFRAME, int, int]]
+        """
+        missing_legs: Dict[Tuple[str, str, str, TIMEFRAME], List[int]] = {}
+        for source, asset, ref_asset, timestamp in legs:
+            retriever = self.retriever.retrievers[source]
+            if not isinstance(retriever, KlineRetriever) or not retriever.is_available():
+                continue
+            timeframe, window = retriever.kline_timeframe, retriever.closest_window
+            if self.tolerance is not None:
+                timeframe = retriever.get_lookup_timeframe(asset, ref_asset, timestamp, self.tolerance)
+                window = self.tolerance
+            if not retriever.has_local_price(asset, ref_asset, timestamp, timeframe, window):
+                missing_legs.setdefault((source, asset, ref_asset, timeframe), []).append(timestamp)
+
+        plan = []
+        for (source, asset, ref_asset, timeframe), timestamps in missing_legs.items():
+            retriever = self.retriever.retrievers[source]
+            page_duration = retriever.max_klines_per_request * timeframe.value * 60
+            window = retriever.closest_window if self.tolerance is None else min(self.tolerance, page_duration // 2)
+            timestamps.sort()
+            start_time, last_timestamp = timestamps[0] - window, timestamps[0]
+            for timestamp in timestamps[1:]:
+                if timestamp + window - start_time > page_duration:
+                    plan.append((source, asset, ref_asset, timeframe, start_time, last_timestamp + window))
+                    start_time = timestamp - window
+                last_timestamp = timestamp
+            plan.append((source, asset, ref_asset, timeframe, start_time, last_timestamp + window))
+            if report is not None:
+                report.naive_api_calls += len(timestamps)
+
+        if report is not None:
+            report.planned_api_calls += len(plan)
+        return plan
@@ -0,0 +1,176 @@
+import json
+import urllib.error
+import urllib.request
+from typing import List, Optional, Tuple, Dict
+
+from CryptoPrice.common.prices import Price, MetaPrice, Kline
+from CryptoPrice.server.serialization import price_from_dict, kline_from_dict
+
+
+class PriceClient:
+    """
+    Client of a PriceServer, with the same lookup methods as a MetaRetriever. It opens no database and no API client,
+    so it is cheap to instantiate in each worker process.
+
+    .. code-block:: python
+
+        client = PriceClient('http://localhost:8765')
+        meta_price = client.get_mean_price('LTC', 'XRP', 1609459200)
+    """
+
+    def __init__(self, url: str = 'http://localhost:8765', timeout: Optional[float] = None):
+        """
+        Instantiate a client
+
+        :param url: url of the PriceServer
+        :type url: str
+        :param timeout: maximum time in seconds to wait for a response, None to wait indefinitely
+        :type timeout: Optional[float]
+        """
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _post(self, endpoint: str, body: Dict) -> Dict:
+        """
+        Send a request to the server and return its decoded response
+
+        :param endpoint: path of the endpoint
+        :type endpoint: str
+        :param body: content of the request
+        :type body: Dict
+        :return: content of the response
+        :rtype: Dict
+        """
+        request = urllib.request.Request(f"{self.url}{endpoint}", data=json.dumps(body).encode(),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as err:
+            try:
+                message = json.loads(err.read())['error']
+            except (ValueError, KeyError):
+                message = err.reason
+            raise RuntimeError(f"the price server answered {err.code} to {endpoint}: {message}") from err
+
+    def is_alive(self) -> bool:
+        """
+        Tell if the server answers
+
+        :return: True if the server is up
+        :rtype: bool
+        """
+        try:
+            with urllib.request.urlopen(f"{self.url}/health", timeout=self.timeout) as response:
+                return response.status == 200
+        except OSError:
+            return False
+
+    def get_closest_price(self, asset: str, ref_asset: str, timestamp: int,
+                          tolerance: Optional[int] = None) -> Optional[Price]:
+        """
+        Same as MetaRetriever.get_closest_price
+
+        :param asset: name of the asset in the trading pair (ex 'BTC' in 'BTCUSDT')
+        :type asset: str
+        :param ref_asset: name of the reference asset in the trading pair (ex 'USDT' in 'BTCUSDT')
+        :type ref_asset: str
+        :param timestamp: time to fetch the price needed (in seconds)
+        :type timestamp: int
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the price, None to use
+            the default precision of the retrievers
+        :type tolerance: Optional[int]
+        :return: the price closest in time found or None if no price found
+        :rtype: Optional[Price]
+        """
+        return self.get_closest_prices([(asset, ref_asset, timestamp)], tolerance)[0]
+
+    def get_closest_prices(self, requests: List[Tuple[str, str, int]],
+                           tolerance: Optional[int] = None) -> List[Optional[Price]]:
+        """
+        Batch version of get_closest_price, in a single request to the server
+
+        :param requests: couples of asset, reference asset and timestamp
+        :type requests: List[Tuple[str, str, int]]
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the price, None to use
+            the default precision of the retrievers
+        :type tolerance: Optional[int]
+        :return: the prices in the order of the requests
+        :rtype: List[Optional[Price]]
+        """
+        response = self._post('/closest_prices', {'requests': [list(r) for r in requests], 'tolerance': tolerance})
+        return [price_from_dict(p) for p in response['prices']]
+
+    def get_mean_price(self, asset: str, ref_asset: str, timestamp: int, preferred_assets: Optional[List[str]] = None,
+                       max_depth: int = 3, max_depth_range: int = 0,
+                       tolerance: Optional[int] = None) -> Optional[MetaPrice]:
+        """
+        Same as MetaRetriever.get_mean_price
+
+        :param asset: name of the asset to get the price of
+        :type asset: str
+        :param ref_asset: name of the reference asset
+        :type ref_asset: str
+        :param timestamp: time to fetch the price needed (in seconds)
+        :type timestamp: int
+        :param preferred_assets: list of assets to construct the price path from. If None, default value is
+            ['BTC', 'ETH']
+        :type preferred_assets: Optional[List[str]]
+        :param max_depth: maximum number of trading pair to use, default 3
+        :type max_depth: int
+        :param max_depth_range: maximum length difference between different trading path, default 0
+        :type max_depth_range: int
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the price, None to use
+            the default precision of the retrievers
+        :type tolerance: Optional[int]
+        :return: Metaprice reflecting the value calculated with a mean of trading path
+        :rtype: Optional[MetaPrice]
+        """
+        return self.get_mean_prices([(asset, ref_asset, timestamp)], preferred_assets, max_depth, max_depth_range,
+                                    tolerance)[0]
+
+    def get_mean_prices(self, requests: List[Tuple[str, str, int]], preferred_assets: Optional[List[str]] = None,
+                        max_depth: int = 3, max_depth_range: int = 0,
+                        tolerance: Optional[int] = None) -> List[Optional[MetaPrice]]:
+        """
+        Batch version of get_mean_price, valued by the server with a ValuationEngine
+
+        :param requests: couples of asset, reference asset and timestamp
+        :type requests: List[Tuple[str, str, int]]
+        :param preferred_assets: list of assets to construct the price path from. If None, default value is
+            ['BTC', 'ETH']
+        :type preferred_assets: Optional[List[str]]
+        :param max_depth: maximum number of trading pair to use, default 3
+        :type max_depth: int
+        :param max_depth_range: maximum length difference between different trading path, default 0
+        :type max_depth_range: int
+        :param tolerance: maximum time difference in seconds accepted between the timestamp and the price, None to use
+            the default precision of the retrievers
+        :type tolerance: Optional[int]
+        :return: the mean prices in the order of the requests
+        :rtype: List[Optional[MetaPrice]]
+        """
+        body = {'requests': [list(r) for r in requests], 'preferred_assets': preferred_assets,
+                'max_depth': max_depth, 'max_depth_range': max_depth_range, 'tolerance': tolerance}
+        response = self._post('/mean_prices', body)
+        return [price_from_dict(p) for p in response['prices']]
+
+    def get_klines(self, source: str, asset: str, ref_asset: str, start_time: int, end_time: int) -> List[Kline]:
+        """
+        Return the klines of a source with an open time in [start_time, end_time), in the timeframe of the source
+
+        :param source: name of the retriever (ex 'binance')
+        :type source: str
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param start_time: start of the time range (included)
+        :type start_time: int
+        :param end_time: end of the time range (excluded)
+        :type end_time: int
+        :return: list of klines
+        :rtype: List[Kline]
+        """
+        response = self._post('/klines', {'requests': [[source, asset, ref_asset, start_time, end_time]]})
+        return [kline_from_dict(k) for k in response['klines'][0]]
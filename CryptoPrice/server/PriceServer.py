@@ -0,0 +1,222 @@
+import json
+import queue
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple, Any
+
+from CryptoPrice.retrievers.KlineRetriever import KlineRetriever
+from CryptoPrice.retrievers.MetaRetriever import MetaRetriever
+from CryptoPrice.retrievers.ValuationEngine import ValuationEngine
+from CryptoPrice.server.serialization import price_to_dict, kline_to_dict
+from CryptoPrice.utils.LoggerGenerator import LoggerGenerator
+from CryptoPrice.utils.MetricsRegistry import MetricsRegistry
+
+
+class PriceServer:
+    """
+    Local HTTP server sharing a single MetaRetriever (databases, API clients, rate limits and circuit breakers) between
+    several processes, which use it through a PriceClient.
+
+    The HTTP requests are received by several threads, but the lookups are all executed one after the other by the
+    thread calling serve_forever, which must be the thread that created the retriever (SQLite connections can only
+    be used by the thread which created them). Identical requests received at the same time are executed once.
+
+    .. code-block:: python
+
+        server = PriceServer(get_default_retriever(), port=8765)
+        server.serve_forever()
+    """
+
+    def __init__(self, retriever: MetaRetriever, host: str = 'localhost', port: int = 8765, max_workers: int = 4):
+        """
+        Instantiate the server, it starts to listen when serve_forever is called
+
+        :param retriever: retriever answering the requests
+        :type retriever: MetaRetriever
+        :param host: host to listen on
+        :type host: str
+        :param port: port to listen on, 0 to pick a free one
+        :type port: int
+        :param max_workers: maximum number of API requests made in parallel for the batches of mean prices
+        :type max_workers: int
+        """
+        self.retriever = retriever
+        self.max_workers = max_workers
+        self.logger = LoggerGenerator.get_logger("price_server")
+        self.http_server = ThreadingHTTPServer((host, port), PriceRequestHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.price_server = self
+        self._jobs: queue.Queue = queue.Queue()
+        self._in_flight: Dict[Tuple, Future] = {}
+        self._lock = threading.Lock()
+        self.endpoints: Dict[str, Callable[[Dict], Any]] = {
+            '/closest_prices': self.get_closest_prices,
+            '/mean_prices': self.get_mean_prices,
+            '/klines': self.get_klines,
+        }
+
+    @property
+    def url(self) -> str:
+        host, port = self.http_server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def submit(self, endpoint: str, body: Dict) -> Future:
+        """
+        Queue a request for the lookup thread, or return the future of an identical request already queued
+
+        :param endpoint: path of the endpoint
+        :type endpoint: str
+        :param body: content of the request
+        :type body: Dict
+        :return: the future of the response
+        :rtype: Future
+        """
+        key = (endpoint, json.dumps(body, sort_keys=True))
+        with self._lock:
+            try:
+                future = self._in_flight[key]
+                MetricsRegistry.increment('server_coalesced_requests_total', endpoint=endpoint)
+                return future
+            except KeyError:
+                future = self._in_flight[key] = Future()
+        self._jobs.put((key, endpoint, body, future))
+        return future
+
+    def serve_forever(self):
+        """
+        Listen to the HTTP requests and execute the lookups until shutdown is called
+
+        :return: None
+        :rtype: None
+        """
+        http_thread = threading.Thread(target=self.http_server.serve_forever, name="price_server_http", daemon=True)
+        http_thread.start()
+        self.logger.info("price server listening on %s", self.url)
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                key, endpoint, body, future = job
+                MetricsRegistry.increment('server_requests_total', endpoint=endpoint)
+                try:
+                    future.set_result(self.endpoints[endpoint](body))
+                except Exception as err:
+                    future.set_exception(err)
+                finally:
+                    with self._lock:
+                        del self._in_flight[key]
+        finally:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+
+    def shutdown(self):
+        """
+        Stop serve_forever, can be called from any thread
+
+        :return: None
+        :rtype: None
+        """
+        self._jobs.put(None)
+
+    def get_closest_prices(self, body: Dict) -> Dict:
+        """
+        Endpoint /closest_prices, closest price of each trading pair
+
+        :param body: {'requests': [[asset, ref_asset, timestamp], ...], 'tolerance': optional int}
+        :type body: Dict
+        :return: {'prices': [price or None, ...]}
+        :rtype: Dict
+        """
+        tolerance = body.get('tolerance')
+        prices = [self.retriever.get_closest_price(asset, ref_asset, int(timestamp), tolerance=tolerance)
+                  for asset, ref_asset, timestamp in body['requests']]
+        return {'prices': [price_to_dict(p) for p in prices]}
+
+    def get_mean_prices(self, body: Dict) -> Dict:
+        """
+        Endpoint /mean_prices, mean price of each request computed with a ValuationEngine
+
+        :param body: {'requests': [[asset, ref_asset, timestamp], ...], 'preferred_assets': optional list,
+            'max_depth': optional int, 'max_depth_range': optional int, 'tolerance': optional int}
+        :type body: Dict
+        :return: {'prices': [meta price or None, ...], 'api_calls_saved': int}
+        :rtype: Dict
+        """
+        engine = ValuationEngine(self.retriever, preferred_assets=body.get('preferred_assets'),
+                                 max_depth=body.get('max_depth', 3), max_depth_range=body.get('max_depth_range', 0),
+                                 max_workers=self.max_workers, tolerance=body.get('tolerance'))
+        report = engine.value((asset, ref_asset, int(timestamp)) for asset, ref_asset, timestamp in body['requests'])
+        return {'prices': [price_to_dict(p) for p in report.prices], 'api_calls_saved': report.api_calls_saved}
+
+    def get_klines(self, body: Dict) -> Dict:
+        """
+        Endpoint /klines, klines of the timeframe of each source with an open time in [start_time, end_time). The
+        ranges not stored locally are fetched online.
+
+        :param body: {'requests': [[source, asset, ref_asset, start_time, end_time], ...]}
+        :type body: Dict
+        :return: {'klines': [[kline, ...], ...]}
+        :rtype: Dict
+        """
+        results: List[List[Dict]] = []
+        for source, asset, ref_asset, start_time, end_time in body['requests']:
+            retriever = self.retriever.retrievers[source]
+            if not isinstance(retriever, KlineRetriever):
+                raise ValueError(f"the source {source} does not provide klines")
+            start_time, end_time, timeframe = int(start_time), int(end_time), retriever.kline_timeframe
+            if not retriever.db.is_range_covered(asset, ref_asset, timeframe, start_time, end_time):
+                retriever.fetch_klines(asset, ref_asset, timeframe, start_time, end_time)
+            klines = retriever.db.get_klines(asset, ref_asset, timeframe, start_time, end_time)
+            results.append([kline_to_dict(k) for k in klines])
+        return {'klines': results}
+
+
+class PriceRequestHandler(BaseHTTPRequestHandler):
+    server: ThreadingHTTPServer
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        elif self.path == '/metrics':
+            body = MetricsRegistry.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_json(404, {'error': f"unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        price_server: PriceServer = self.server.price_server
+        if self.path not in price_server.endpoints:
+            self.send_json(404, {'error': f"unknown endpoint {self.path}"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError as err:
+            self.send_json(400, {'error': f"invalid json: {err}"})
+            return
+        try:
+            result = price_server.submit(self.path, body).result()
+        except (KeyError, TypeError, ValueError) as err:
+            self.send_json(400, {'error': repr(err)})
+        except Exception as err:
+            price_server.logger.exception("error while serving %s", self.path)
+            self.send_json(500, {'error': repr(err)})
+        else:
+            self.send_json(200, result)
+
+    def send_json(self, status: int, content: Dict):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,22 @@
+import argparse
+
+from CryptoPrice import get_default_retriever
+from CryptoPrice.server.PriceServer import PriceServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local server sharing a warm price retriever between processes")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-workers', type=int, default=4,
+                        help="maximum number of API requests made in parallel for the batches of mean prices")
+    args = parser.parse_args()
+    server = PriceServer(get_default_retriever(), args.host, args.port, args.max_workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+from typing import Dict, Optional, Union
+
+from CryptoPrice.common.prices import Price, MetaPrice, Kline, CompactProvenance
+from CryptoPrice.utils.time import TIMEFRAME
+
+
+def price_to_dict(price: Optional[Union[Price, MetaPrice]]) -> Optional[Dict]:
+    """
+    Convert a Price or a MetaPrice into a json serializable dictionary
+
+    :param price: price to convert
+    :type price: Optional[Union[Price, MetaPrice]]
+    :return: the dictionary, None if the price is None
+    :rtype: Optional[Dict]
+    """
+    if price is None:
+        return None
+    if isinstance(price, MetaPrice):
+        content = {'value': price.value, 'asset': price.asset, 'ref_asset': price.ref_asset,
+                   'source': sorted(price.source), 'partial': price.partial}
+        if isinstance(price.prices, CompactProvenance):
+            content['legs'] = price.prices.get_paths()
+        else:
+            content['prices'] = [price_to_dict(p) for p in price.prices]
+        return content
+    return {'value': price.value, 'asset': price.asset, 'ref_asset': price.ref_asset, 'timestamp': price.timestamp,
+            'source': price.source}
+
+
+def price_from_dict(content: Optional[Dict]) -> Optional[Union[Price, MetaPrice]]:
+    """
+    Convert a dictionary made by price_to_dict back into a Price or a MetaPrice
+
+    :param content: dictionary to convert
+    :type content: Optional[Dict]
+    :return: the price, None if the content is None
+    :rtype: Optional[Union[Price, MetaPrice]]
+    """
+    if content is None:
+        return None
+    if 'legs' in content:
+        return MetaPrice(content['value'], content['asset'], content['ref_asset'],
+                         CompactProvenance.from_paths(content['legs']), source=frozenset(content['source']),
+                         partial=content.get('partial', False))
+    if 'prices' in content:
+        return MetaPrice(content['value'], content['asset'], content['ref_asset'],
+                         [price_from_dict(p) for p in content['prices']], source=set(content['source']),
+                         partial=content.get('partial', False))
+    return Price(content['value'], content['asset'], content['ref_asset'], content['timestamp'], content['source'])
+
+
+def kline_to_dict(kline: Kline) -> Dict:
+    """
+    Convert a Kline into a json serializable dictionary
+
+    :param kline: kline to convert
+    :type kline: Kline
+    :return: the dictionary
+    :rtype: Dict
+    """
+    return {'open_timestamp': kline.open_timestamp, 'open': kline.open, 'high': kline.high, 'low': kline.low,
+            'close': kline.close, 'asset': kline.asset, 'ref_asset': kline.ref_asset,
+            'timeframe': kline.timeframe.name, 'source': kline.source}
+
+
+def kline_from_dict(content: Dict) -> Kline:
+    """
+    Convert a dictionary made by kline_to_dict back into a Kline
+
+    :param content: dictionary to convert
+    :type content: Dict
+    :return: the kline
+    :rtype: Kline
+    """
+    return Kline(content['open_timestamp'], content['open'], content['high'], content['low'], content['close'],
+                 content['asset'], content['ref_asset'], TIMEFRAME[content['timeframe']], content['source'])
@@ -0,0 +1,293 @@
+import csv
+import datetime
+import io
+import os
+import re
+import zipfile
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Dict, Optional, Tuple, Iterator, Union
+
+from CryptoPrice.common.trade import TradingPair
+from CryptoPrice.storage.KlineDataBase import KlineDataBase
+from CryptoPrice.storage.tables import KlineTable
+from CryptoPrice.utils.LoggerGenerator import LoggerGenerator
+from CryptoPrice.utils.time import TIMEFRAME
+
+KlineRow = Tuple[int, float, float, float, float]  # open_timestamp, open, high, low, close
+CHUNK_ROWS = 10000  # number of rows parsed, sent to the writer and inserted at once
+# errors raised by a dump file truncated or corrupted
+DUMP_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, OSError, UnicodeDecodeError, ValueError, IndexError)
+
+
+class BinanceDumpLoader:
+    """
+    This class loads the kline dumps published by Binance (https://data.binance.vision) from a local directory into a
+    KlineDataBase, without any API call. The files are expected to keep their original names, for example
+    BTCUSDT-1m-2021-01.zip (monthly dump) or BTCUSDT-1m-2021-01-05.zip (daily dump).
+
+    The periods of the loaded files are marked as covered in the database, so the retrievers using this database
+    will never ask the API for klines inside those periods. A file that can not be read entirely (truncated archive or
+    csv) is loaded as far as possible but its period is not marked as covered.
+    """
+
+    FILE_NAME_PATTERN = re.compile(r"^(?P<symbol>[A-Z0-9]+)-(?P<interval>\w+)-"
+                                   r"(?P<year>\d{4})-(?P<month>\d{2})(?:-(?P<day>\d{2}))?\.(?:zip|csv)$")
+    # name of the intervals in the dumps, the same as the ones of the Binance API
+    default_kline_translation = {timeframe: f"{timeframe.name[1:]}{timeframe.name[0]}" for timeframe in TIMEFRAME}
+
+    def __init__(self, trading_pairs: List[TradingPair], db_name: str = 'binance',
+                 kline_translation: Optional[Dict[TIMEFRAME, str]] = None, db: Optional[KlineDataBase] = None):
+        """
+        Instantiate a dump loader
+
+        :param trading_pairs: trading pairs used to translate the dump symbols into assets and reference assets,
+            for example the supported_pairs of a BinanceRetriever
+        :type trading_pairs: List[TradingPair]
+        :param db_name: name of the KlineDataBase to fill, it should be the name of the retriever that will use the
+            data, default 'binance'
+        :type db_name: str
+        :param kline_translation: name of the interval in the dump files for each timeframe, default to the Binance
+            names (1m, 1h, 1d...)
+        :type kline_translation: Optional[Dict[TIMEFRAME, str]]
+        :param db: database to fill, for example the db of the retriever that will use the data, sharded or not. If
+            None, the single file KlineDataBase named db_name is filled
+        :type db: Optional[KlineDataBase]
+        """
+        if kline_translation is None:
+            kline_translation = self.default_kline_translation
+        self.timeframe_translation = {v: k for k, v in kline_translation.items()}
+        self.db_name = db_name if db is None else db.source
+        self.db = db
+        self.symbols = {p.name: (p.asset, p.ref_asset) for p in trading_pairs}
+        self.logger = LoggerGenerator.get_logger(f"dump_loader_{self.db_name}")
+
+    def list_dump_files(self, directory: Union[str, Path]) -> Dict[Tuple[str, str, TIMEFRAME], List[Path]]:
+        """
+        Look for dump files in a directory (and its sub directories) and group them by trading pair and timeframe
+
+        :param directory: directory containing the dump files
+        :type directory: Union[str, Path]
+        :return: the dump files, grouped by (asset, ref_asset, timeframe)
+        :rtype: Dict[Tuple[str, str, TIMEFRAME], List[Path]]
+        """
+        dump_files = {}
+        for file_path in sorted(Path(directory).rglob('*')):
+            match = self.FILE_NAME_PATTERN.match(file_path.name)
+            if match is None:
+                continue
+            try:
+                asset, ref_asset = self.symbols[match['symbol']]
+            except KeyError:
+                self.logger.warning(f"unknown symbol {match['symbol']}, the file {file_path} is ignored")
+                continue
+            try:
+                timeframe = self.timeframe_translation[match['interval']]
+            except KeyError:
+                self.logger.warning(f"unsupported interval {match['interval']}, the file {file_path} is ignored")
+                continue
+            try:
+                dump_files[(asset, ref_asset, timeframe)].append(file_path)
+            except KeyError:
+                dump_files[(asset, ref_asset, timeframe)] = [file_path]
+        return dump_files
+
+    def load_directory(self, directory: Union[str, Path], max_workers: Optional[int] = None) -> Dict[str, int]:
+        """
+        Load all the dump files of a directory into the database. The files are parsed in parallel by worker
+        processes and written by the current process, a single writer being the fastest for a SQLite file. At most
+        2 * max_workers files are parsed ahead of the writer, and the rows are sent and inserted by chunks of
+        CHUNK_ROWS rows, so the memory used does not depend on the number or the size of the files
+
+        :param directory: directory containing the dump files
+        :type directory: Union[str, Path]
+        :param max_workers: maximum number of processes parsing the files, default to the number of processors of the
+            machine. if equal to 1, everything is done in the current process and the files are streamed
+        :type max_workers: Optional[int]
+        :return: number of klines read for each table
+        :rtype: Dict[str, int]
+        """
+        dump_files = self.list_dump_files(directory)
+        jobs = [(asset, ref_asset, timeframe, file_path)
+                for (asset, ref_asset, timeframe), file_paths in dump_files.items() for file_path in file_paths]
+        results = {KlineTable(asset, ref_asset, timeframe).name: 0 for asset, ref_asset, timeframe in dump_files}
+        # the writes go through a connection of their own, closed once the files are loaded
+        db = KlineDataBase(self.db_name) if self.db is None else self.db.new_connection()
+        try:
+            if max_workers == 1:
+                for asset, ref_asset, timeframe, file_path in jobs:
+                    n_rows = self._save_file_chunks(db, asset, ref_asset, timeframe, file_path,
+                                                    iter_dump_chunks(file_path))
+                    results[KlineTable(asset, ref_asset, timeframe).name] += n_rows
+            else:
+                if max_workers is None:
+                    max_workers = os.cpu_count() or 1
+                in_flight: Dict[int, Future] = {}
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    next_job = 0
+                    # the files are parsed ahead by the workers while the current process writes the previous ones
+                    for job_index, (asset, ref_asset, timeframe, file_path) in enumerate(jobs):
+                        while next_job < len(jobs) and next_job < job_index + 2 * max_workers:
+                            in_flight[next_job] = executor.submit(parse_dump_file, jobs[next_job][3])
+                            next_job += 1
+                        chunks, complete = in_flight.pop(job_index).result()
+                        n_rows = self._save_file_chunks(db, asset, ref_asset, timeframe, file_path, chunks, complete)
+                        results[KlineTable(asset, ref_asset, timeframe).name] += n_rows
+        finally:
+            db.close()
+        self.logger.info(f"{sum(results.values())} klines loaded from {len(results)} trading pairs")
+        return results
+
+    def _save_file_chunks(self, db: KlineDataBase, asset: str, ref_asset: str, timeframe: TIMEFRAME,
+                          file_path: Path, chunks: Iterable[List[KlineRow]], complete: bool = True) -> int:
+        """
+        Save the rows parsed from a dump file, chunk by chunk, and mark the period of the file as covered, up to its
+        last kline. The period of a file not read entirely is not covered
+
+        :param db: database to fill
+        :type db: KlineDataBase
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe of the klines in the file
+        :type timeframe: TIMEFRAME
+        :param file_path: path of the dump file
+        :type file_path: Path
+        :param chunks: kline rows read from the file, by chunks. The reading errors of a truncated or corrupted file
+            are caught
+        :type chunks: Iterable[List[Tuple[int, float, float, float, float]]]
+        :param complete: False if the file is already known to be truncated or corrupted
+        :type complete: bool
+        :return: number of rows read
+        :rtype: int
+        """
+        n_rows, first_timestamp, last_timestamp = 0, None, None
+        try:
+            for chunk in chunks:
+                db.add_kline_rows(asset, ref_asset, timeframe, chunk, ignore_if_exists=True, auto_commit=False)
+                n_rows += len(chunk)
+                chunk_first, chunk_last = min(row[0] for row in chunk), max(row[0] for row in chunk)
+                first_timestamp = chunk_first if first_timestamp is None else min(first_timestamp, chunk_first)
+                last_timestamp = chunk_last if last_timestamp is None else max(last_timestamp, chunk_last)
+        except DUMP_ERRORS:
+            complete = False
+        if not complete:
+            self.logger.warning(f"{file_path} is truncated or corrupted, {n_rows} klines loaded but its period is "
+                                f"not marked as covered")
+        elif n_rows:
+            # a csv cut at the end of a line can not be detected, the coverage stops at the last kline read
+            end_time = last_timestamp + timeframe.value * 60
+            period = get_dump_period(file_path)
+            start_time = first_timestamp if period is None else period[0]
+            if period is not None:
+                end_time = min(end_time, period[1])
+            db.add_covered_range(asset, ref_asset, timeframe, start_time, end_time, auto_commit=False)
+        db.commit()
+        return n_rows
+
+
+def get_dump_period(file_path: Path) -> Optional[Tuple[int, int]]:
+    """
+    Return the period [start_time, end_time) contained in a dump file, deduced from its name
+
+    :param file_path: path of the dump file
+    :type file_path: Path
+    :return: start and end of the period, None if the name of the file does not follow the dumps naming
+    :rtype: Optional[Tuple[int, int]]
+    """
+    match = BinanceDumpLoader.FILE_NAME_PATTERN.match(file_path.name)
+    if match is None:
+        return None
+    year, month = int(match['year']), int(match['month'])
+    if match['day'] is not None:
+        start = datetime.datetime(year, month, int(match['day']), tzinfo=datetime.timezone.utc)
+        end = start + datetime.timedelta(days=1)
+    else:
+        start = datetime.datetime(year, month, 1, tzinfo=datetime.timezone.utc)
+        end = datetime.datetime(year + month // 12, month % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def iter_dump_rows(file_path: Path) -> Iterator[KlineRow]:
+    """
+    Stream the rows of a dump file (zip or csv) as kline rows (open_timestamp, open, high, low, close)
+
+    :param file_path: path of the dump file
+    :type file_path: Path
+    :return: iterator of kline rows
+    :rtype: Iterator[Tuple[int, float, float, float, float]]
+    """
+    if file_path.suffix == '.zip':
+        with zipfile.ZipFile(file_path) as archive:
+            for csv_name in archive.namelist():
+                with archive.open(csv_name) as binary_file:
+                    yield from _iter_csv_rows(io.TextIOWrapper(binary_file, encoding='utf-8'))
+    else:
+        with open(file_path, encoding='utf-8') as text_file:
+            yield from _iter_csv_rows(text_file)
+
+
+def _iter_csv_rows(text_file: io.TextIOBase) -> Iterator[KlineRow]:
+    """
+    Parse the rows of a dump csv file, the columns are the same as the ones returned by the klines endpoint
+
+    :param text_file: csv file opened in text mode
+    :type text_file: io.TextIOBase
+    :return: iterator of kline rows
+    :rtype: Iterator[Tuple[int, float, float, float, float]]
+    """
+    for row in csv.reader(text_file):
+        if not row or not row[0].isdigit():  # empty line or header
+            continue
+        open_timestamp = int(row[0])
+        if open_timestamp >= 10 ** 14:  # recent dumps are in microseconds instead of milliseconds
+            open_timestamp //= 1000
+        yield int(open_timestamp / 1000), float(row[1]), float(row[2]), float(row[3]), float(row[4])
+
+
+def iter_dump_chunks(file_path: Path, chunk_rows: int = CHUNK_ROWS) -> Iterator[List[KlineRow]]:
+    """
+    Stream the rows of a dump file by chunks. If the file is truncated or corrupted, the rows read before the error
+    are yielded, then the error is raised
+
+    :param file_path: path of the dump file
+    :type file_path: Path
+    :param chunk_rows: maximum number of rows in a chunk
+    :type chunk_rows: int
+    :return: iterator of lists of kline rows
+    :rtype: Iterator[List[Tuple[int, float, float, float, float]]]
+    """
+    chunk = []
+    try:
+        for row in iter_dump_rows(file_path):
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+    except DUMP_ERRORS:
+        if len(chunk):  # the rows read before the error are still valid
+            yield chunk
+        raise
+    if len(chunk):
+        yield chunk
+
+
+def parse_dump_file(file_path: Path) -> Tuple[List[List[KlineRow]], bool]:
+    """
+    Read the kline rows of a dump file by chunks of CHUNK_ROWS rows. Meant to be executed in a worker process
+
+    :param file_path: path of the dump file
+    :type file_path: Path
+    :return: the chunks of kline rows read and whether the file was read entirely, False if it is truncated or
+        corrupted
+    :rtype: Tuple[List[List[Tuple[int, float, float, float, float]]], bool]
+    """
+    chunks = []
+    try:
+        for chunk in iter_dump_chunks(file_path):
+            chunks.append(chunk)
+    except DUMP_ERRORS:
+        return chunks, False
+    return chunks, True
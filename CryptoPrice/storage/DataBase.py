@@ -1,9 +1,13 @@
+import atexit
+import threading
+import time
 from enum import Enum
 from typing import List, Tuple, Optional, Any, Union
 import sqlite3
 
 from CryptoPrice.storage.tables import Table
 from CryptoPrice.utils.LoggerGenerator import LoggerGenerator
+from CryptoPrice.utils.MetricsRegistry import MetricsRegistry
 from CryptoPrice.utils.paths import get_data_path
 
 
@@ -23,19 +27,37 @@ class DataBase:
     """
     This class will be used to interact with sqlite3 databases without having to generates sqlite commands
     """
+    BUSY_TIMEOUT = 5.  # time in seconds a connection waits for the write lock held by another connection
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, read_only: bool = False):
         """
         Instantiate a database object, the name will be used for the saving file
 
         :param name: name of the database
         :type name: str
+        :param read_only: if the database is opened in read only mode, the file must exist. Any write raises an
+            sqlite3.OperationalError, default False
+        :type read_only: bool
         """
         self.name = name
         self.logger = LoggerGenerator.get_logger(self.name)
         self.save_path = get_data_path() / f"{name}.db"
-        self.db_conn = sqlite3.connect(self.save_path)
+        self.read_only = read_only
+        if read_only:
+            self.db_conn = sqlite3.connect(f"{self.save_path.as_uri()}?mode=ro", uri=True, timeout=self.BUSY_TIMEOUT)
+        else:
+            # the write-behind timer flushes the deferred writes from its own thread, under self._lock
+            self.db_conn = sqlite3.connect(self.save_path, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
         self.db_cursor = self.db_conn.cursor()
+        # write-behind settings, None when every commit is executed immediately
+        self.write_behind_max_pending: Optional[int] = None
+        self.write_behind_max_delay: Optional[float] = None
+        self._pending_commits = 0
+        self._pending_since = 0.
+        self._pending_changes = 0  # total changes of the connection at the last deferred commit
+        self._flush_timer: Optional[threading.Timer] = None
+        # serializes the statements of the connection with the flushes of the write-behind timer
+        self._lock = threading.RLock()
 
     def _fetch_rows(self, execution_cmd: str):
         """
@@ -44,15 +66,18 @@ class DataBase:
         :return:
         """
         rows = []
-        try:
-            self.db_cursor.execute(execution_cmd)
-        except sqlite3.OperationalError:
-            return rows
-        while True:
-            row = self.db_cursor.fetchone()
-            if row is None:
-                break
-            rows.append(row)
+        with self._lock, MetricsRegistry.timer('sql_query_seconds', database=self.name, operation='select'):
+            try:
+                self.db_cursor.execute(execution_cmd)
+            except sqlite3.OperationalError as err:
+                if not self._is_missing_table(err):
+                    raise
+                return rows
+            while True:
+                row = self.db_cursor.fetchone()
+                if row is None:
+                    break
+                rows.append(row)
         return rows
 
     def get_row_by_key(self, table: Table, key_value) -> Optional[Tuple]:
@@ -93,20 +118,23 @@ class DataBase:
         row_s = ", ".join(f"'{v}'" for v in row)
         row_s = f'({row_s})'
         execution_order = f"INSERT INTO {table.name} VALUES {row_s}"
-        try:
-            self.db_cursor.execute(execution_order)
-            if auto_commit:
-                self.commit()
-        except sqlite3.OperationalError:
-            self.create_table(table)
-            self.db_cursor.execute(execution_order)
-            if auto_commit:
-                self.commit()
-        except sqlite3.IntegrityError as err:
-            if update_if_exists:
-                self.update_row(table, row, auto_commit)
-            else:
-                raise err
+        with self._lock:
+            try:
+                self.db_cursor.execute(execution_order)
+                if auto_commit:
+                    self.commit()
+            except sqlite3.OperationalError as err:
+                if not self._is_missing_table(err):
+                    raise
+                self.create_table(table)
+                self.db_cursor.execute(execution_order)
+                if auto_commit:
+                    self.commit()
+            except sqlite3.IntegrityError as err:
+                if update_if_exists:
+                    self.update_row(table, row, auto_commit)
+                else:
+                    raise err
 
     def add_rows(self, table: Table, rows: List[Tuple], auto_commit: bool = True, update_if_exists: bool = False):
         for row in rows:
@@ -114,12 +142,81 @@ class DataBase:
         if auto_commit:
             self.commit()
 
+    def bulk_add_rows(self, table: Table, rows: List[Tuple], auto_commit: bool = True, ignore_if_exists: bool = False):
+        """
+        Insert several rows at once with a single sqlite command, much faster than add_rows for large batches
+
+        :param table: table to insert the rows into
+        :type table: Table
+        :param rows: rows to insert, each row must contain a value for every column of the table
+        :type rows: List[Tuple]
+        :param auto_commit: if the database state should be saved after the insertion, default True
+        :type auto_commit: bool
+        :param ignore_if_exists: if rows with an already existing primary key should be skipped, default False
+        :type ignore_if_exists: bool
+        :return: number of rows inserted
+        :rtype: int
+        """
+        if not len(rows):
+            return 0
+        n_columns = len(table.columns_names) + int(table.primary_key is not None)
+        insert_cmd = "INSERT OR IGNORE" if ignore_if_exists else "INSERT"
+        execution_order = f"{insert_cmd} INTO {table.name} VALUES ({', '.join('?' * n_columns)})"
+        with self._lock:
+            with MetricsRegistry.timer('sql_query_seconds', database=self.name, operation='insert'):
+                try:
+                    self.db_cursor.executemany(execution_order, rows)
+                except sqlite3.OperationalError as err:
+                    if not self._is_missing_table(err):  # a locked or read only database for example
+                        raise
+                    self.create_table(table)
+                    self.db_cursor.executemany(execution_order, rows)
+            n_inserted = self.db_cursor.rowcount
+            if auto_commit:
+                self.commit()
+        return n_inserted
+
+    def delete_conditions_rows(self, table: Table,
+                               conditions_list: Optional[List[Tuple[str, SQLConditionEnum, Any]]] = None,
+                               auto_commit: bool = True):
+        """
+        Delete the rows of a table that match a list of conditions. If no condition is provided, all the rows of the
+        table are deleted
+
+        :param table: table to delete the rows from
+        :type table: Table
+        :param conditions_list: conditions that the rows to delete have to fulfill
+        :type conditions_list: Optional[List[Tuple[str, SQLConditionEnum, Any]]]
+        :param auto_commit: if the database state should be saved after the deletion, default True
+        :type auto_commit: bool
+        :return: number of rows deleted
+        :rtype: int
+        """
+        if conditions_list is None:
+            conditions_list = []
+        execution_order = f"DELETE FROM {table.name}"
+        execution_order = self._add_conditions(execution_order, conditions_list=conditions_list)
+        with self._lock:
+            try:
+                self.db_cursor.execute(execution_order)
+            except sqlite3.OperationalError as err:
+                if not self._is_missing_table(err):
+                    raise
+                return 0
+            n_deleted = self.db_cursor.rowcount
+            if auto_commit:
+                self.commit()
+        return n_deleted
+
     def update_row(self, table: Table, row: Tuple, auto_commit=True):
-        row_s = ", ".join(f"{n} = {v}" for n, v in zip(table.columns_names, row))
-        execution_order = f"UPDATE {table.name} SET {row_s} WHERE {table.primary_key} = {row[0]}"
-        self.db_cursor.execute(execution_order)
-        if auto_commit:
-            self.commit()
+        if table.primary_key is None:
+            raise ValueError(f"table {table.name} has no explicit primary key")
+        row_s = ", ".join(f"{n} = ?" for n in table.columns_names)
+        execution_order = f"UPDATE {table.name} SET {row_s} WHERE {table.primary_key} = ?"
+        with self._lock:
+            self.db_cursor.execute(execution_order, (*row[1:], row[0]))
+            if auto_commit:
+                self.commit()
 
     def create_table(self, table: Table):
         """
@@ -128,8 +225,9 @@ class DataBase:
         :return:
         """
         create_cmd = self.get_create_cmd(table)
-        self.db_cursor.execute(create_cmd)
-        self.db_conn.commit()
+        with self._lock:
+            self.db_cursor.execute(create_cmd)
+            self.db_conn.commit()
 
     def drop_table(self, table: Union[Table, str]):
         """
@@ -151,12 +249,13 @@ class DataBase:
         :return: None
         :rtype: None
         """
-        for table in tables:
-            if isinstance(table, Table):
-                table = table.name
-            execution_order = f"DROP TABLE IF EXISTS {table}"
-            self.db_cursor.execute(execution_order)
-        self.commit()
+        with self._lock:
+            for table in tables:
+                if isinstance(table, Table):
+                    table = table.name
+                execution_order = f"DROP TABLE IF EXISTS {table}"
+                self.db_cursor.execute(execution_order)
+            self.commit()
 
     def drop_all_tables(self):
         """
@@ -178,12 +277,213 @@ class DataBase:
         cmd = "SELECT * FROM sqlite_master WHERE type='table';"
         return self._fetch_rows(cmd)
 
+    def get_size(self) -> int:
+        """
+        Return the space used by the data of the database in bytes, the free pages of the file are not counted
+
+        :return: size in bytes
+        :rtype: int
+        """
+        with self._lock:
+            page_size = self.db_conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = self.db_conn.execute("PRAGMA page_count").fetchone()[0]
+            freelist_count = self.db_conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - freelist_count) * page_size
+
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        Set the database in incremental auto vacuum mode, so that reclaim_space can give the free pages back to the
+        file system. The mode can only be changed before the first table is created, an existing database would
+        need a full VACUUM: its free pages are then only reused by the next writes.
+
+        :return: True if the database is in incremental auto vacuum mode
+        :rtype: bool
+        """
+        with self._lock:
+            self.db_conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            return self.db_conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    def reclaim_space(self, max_pages: Optional[int] = None):
+        """
+        Give free pages back to the file system, without rewriting the whole file as VACUUM does. Only effective if
+        the database is in incremental auto vacuum mode (see enable_incremental_vacuum)
+
+        :param max_pages: maximum number of pages to free, None to free all of them
+        :type max_pages: Optional[int]
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self.flush()
+            # executed as a script, a single step of the statement would only free one page
+            self.db_conn.executescript(f"PRAGMA incremental_vacuum({max_pages or 0});")
+
     def commit(self):
         """
-        submit and save the database state
+        submit and save the database state. If the write-behind is enabled, the commit is deferred until enough
+        commits are pending or the oldest pending one is too old
         :return:
         """
-        self.db_conn.commit()
+        with self._lock:
+            if self.write_behind_max_pending is None:
+                with MetricsRegistry.timer('sql_query_seconds', database=self.name, operation='commit'):
+                    self.db_conn.commit()
+                return
+            if not self.db_conn.in_transaction:
+                self._pending_commits = 0
+                return
+            if not self._pending_commits:
+                self._pending_since = time.monotonic()
+                self._start_flush_timer()
+            self._pending_commits += 1
+            self._pending_changes = self.db_conn.total_changes
+            if self._pending_commits >= self.write_behind_max_pending \
+                    or time.monotonic() - self._pending_since >= self.write_behind_max_delay:
+                self.flush()
+
+    def flush(self):
+        """
+        save the writes deferred by the write-behind in a single transaction
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self.db_conn.in_transaction:
+                with MetricsRegistry.timer('sql_query_seconds', database=self.name, operation='commit'):
+                    self.db_conn.commit()
+                MetricsRegistry.increment('write_behind_flushes_total', database=self.name)
+            self._pending_commits = 0
+
+    def rollback(self):
+        """
+        Cancel the writes not committed yet, including the ones deferred by the write-behind
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            self.db_conn.rollback()
+            self._pending_commits = 0
+
+    def enable_write_behind(self, max_pending: int = 1000, max_delay: float = 1.):
+        """
+        Defer the commits so that the writes of many lookups are saved in a single transaction, instead of one
+        transaction (and disk sync) per write. The reads on this database see the deferred writes, as they use the
+        same connection, but the other connections only see them once flushed.
+
+        The deferred writes are flushed when max_pending commits are pending, max_delay seconds after the oldest
+        pending commit (by a timer, even if no other write comes), when flush or close is called and when the
+        interpreter exits. Until then, the other connections can not write in the database: they wait for the lock
+        up to BUSY_TIMEOUT seconds, so max_delay should stay well below it.
+
+        :param max_pending: maximum number of deferred commits
+        :type max_pending: int
+        :param max_delay: maximum time in seconds a deferred commit waits for the next commits
+        :type max_delay: float
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            if self.write_behind_max_pending is None:
+                atexit.register(self._flush_at_exit)
+            self.write_behind_max_pending = max_pending
+            self.write_behind_max_delay = max_delay
+
+    def disable_write_behind(self):
+        """
+        Flush the deferred writes and go back to executing every commit immediately
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            if self.write_behind_max_pending is not None:
+                atexit.unregister(self._flush_at_exit)
+                self.write_behind_max_pending = None
+                self.write_behind_max_delay = None
+                self.flush()
+
+    def _start_flush_timer(self):
+        """
+        Schedule the flush of the pending commits once the oldest one is max_delay seconds old
+
+        :return: None
+        :rtype: None
+        """
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        self._flush_timer = threading.Timer(self.write_behind_max_delay, self._flush_on_timer)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+
+    def _flush_on_timer(self):
+        """
+        Flush the pending commits from the timer thread. If some writes were executed since the last deferred
+        commit, the owner of the connection is in the middle of a write and the flush is left to its next commit,
+        so that a group of writes is never saved partially.
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            if threading.current_thread() is not self._flush_timer or not self._pending_commits:
+                return  # flushed or rescheduled meanwhile
+            self._flush_timer = None
+            if self.db_conn.total_changes != self._pending_changes:
+                return
+            try:
+                self.flush()
+            except (sqlite3.ProgrammingError, sqlite3.OperationalError):  # closed or locked
+                self.logger.exception("the deferred writes of %s could not be flushed", self.name)
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except (sqlite3.ProgrammingError, sqlite3.OperationalError):  # closed or locked
+            self.logger.warning("the deferred writes of %s could not be flushed at exit", self.name)
+
+    def close(self):
+        """
+        Flush the deferred writes and close the connection to the database
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self.disable_write_behind()
+            self.db_conn.close()
+
+    @staticmethod
+    def is_locked_error(err: sqlite3.OperationalError) -> bool:
+        """
+        Tell if an error raised by sqlite comes from the write lock being held by another connection for longer
+        than BUSY_TIMEOUT
+
+        :param err: error raised by sqlite
+        :type err: sqlite3.OperationalError
+        :return: True if the database was locked
+        :rtype: bool
+        """
+        return str(err).startswith("database is locked")
+
+    @staticmethod
+    def _is_missing_table(err: sqlite3.OperationalError) -> bool:
+        """
+        Tell if an error raised by sqlite comes from a table not created yet
+
+        :param err: error raised by sqlite
+        :type err: sqlite3.OperationalError
+        :return: True if the table does not exist
+        :rtype: bool
+        """
+        return str(err).startswith("no such table")
 
     @staticmethod
     def _add_conditions(execution_cmd: str, conditions_list: List[Tuple[str, SQLConditionEnum, Any]]):
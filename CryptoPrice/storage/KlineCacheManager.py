@@ -0,0 +1,266 @@
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from CryptoPrice.storage.DataBase import SQLConditionEnum
+from CryptoPrice.storage.KlineDataBase import KlineDataBase
+from CryptoPrice.storage.tables import KlineAccessTable, KlineCacheTable
+from CryptoPrice.utils.LoggerGenerator import LoggerGenerator
+from CryptoPrice.utils.MetricsRegistry import MetricsRegistry
+from CryptoPrice.utils.time import TIMEFRAME
+
+
+class KlineCacheManager:
+    """
+    This class keeps a KlineDataBase within a retention period per timeframe and a disk budget. The klines are
+    tracked by blocks of block_klines klines per trading pair and timeframe: the lookups record the last access time
+    of their block, and when the database is above its budget the least recently used blocks are deleted. Each
+    deletion removes the covered ranges and the cached results of the block, so the klines are fetched again if
+    needed, and the free pages are given back to the file system by an incremental vacuum.
+
+    .. code-block:: python
+
+        retriever.cache_manager = KlineCacheManager(retriever.db, max_size=2 * 1024 ** 3,
+                                                    retention={TIMEFRAME.m1: 90 * 86400})
+        ...
+        retriever.cache_manager.enforce()  # or automatically every check_interval seconds
+    """
+
+    def __init__(self, db: KlineDataBase, max_size: Optional[int] = None,
+                 retention: Optional[Dict[TIMEFRAME, int]] = None, block_klines: int = 1000,
+                 check_interval: Optional[float] = None):
+        """
+        Instantiate a cache manager
+
+        :param db: database to manage
+        :type db: KlineDataBase
+        :param max_size: maximum size of the data of the database in bytes, None for no limit
+        :type max_size: Optional[int]
+        :param retention: maximum age in seconds of the klines per timeframe, the timeframes missing are kept forever
+        :type retention: Optional[Dict[TIMEFRAME, int]]
+        :param block_klines: number of klines in a block, the unit of the access tracking and of the eviction
+        :type block_klines: int
+        :param check_interval: if provided, enforce is called by record_access when this number of seconds elapsed
+            since the last enforcement
+        :type check_interval: Optional[float]
+        """
+        self.db = db
+        self.max_size = max_size
+        self.retention = {} if retention is None else retention
+        self.block_klines = block_klines
+        self.check_interval = check_interval
+        self.logger = LoggerGenerator.get_logger(f"cache_manager_{db.name}")
+        self._accesses: Dict[Tuple[str, str, TIMEFRAME, int], int] = {}  # access times not saved yet
+        self._last_check = time.monotonic()
+        if not db.enable_incremental_vacuum():
+            self.logger.info("the database %s was created without incremental vacuum, the space of the evicted "
+                             "klines will be reused but the file will not shrink", db.name)
+
+    def get_block_duration(self, timeframe: TIMEFRAME) -> int:
+        """
+        Return the duration of a block in seconds
+
+        :param timeframe: timeframe of the klines
+        :type timeframe: TIMEFRAME
+        :return: duration of a block
+        :rtype: int
+        """
+        return self.block_klines * timeframe.value * 60
+
+    def record_access(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, timestamp: int):
+        """
+        Record a lookup of the klines of a trading pair. The access times are kept in memory until the next
+        enforcement
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe of the klines
+        :type timeframe: TIMEFRAME
+        :param timestamp: time looked up
+        :type timestamp: int
+        :return: None
+        :rtype: None
+        """
+        block_duration = self.get_block_duration(timeframe)
+        self._accesses[(asset, ref_asset, timeframe, timestamp - timestamp % block_duration)] = int(time.time())
+        if self.check_interval is not None and time.monotonic() - self._last_check >= self.check_interval:
+            self.enforce()
+
+    def save_accesses(self):
+        """
+        Save in the database the access times recorded in memory
+
+        :return: None
+        :rtype: None
+        """
+        if not len(self._accesses):
+            return
+        rows = [self._get_access_row(asset, ref_asset, timeframe, block_start, access_time)
+                for (asset, ref_asset, timeframe, block_start), access_time in self._accesses.items()]
+        self.db.add_rows(KlineAccessTable(), rows, update_if_exists=True)
+        self._accesses.clear()
+
+    def enforce(self) -> Dict[str, int]:
+        """
+        Save the access times, delete the klines older than their retention period, then delete the least recently
+        used blocks until the database fits in its budget
+
+        :return: number of klines deleted for the retention and for the budget
+        :rtype: Dict[str, int]
+        """
+        self._last_check = time.monotonic()
+        self.save_accesses()
+        n_deleted = {'retention': self.apply_retention(), 'size': self.evict_to_budget()}
+        if n_deleted['retention'] or n_deleted['size']:
+            self.logger.info("%s klines deleted for the retention and %s for the size budget of %s, %s bytes used",
+                             n_deleted['retention'], n_deleted['size'], self.db.name, self.db.get_size())
+        return n_deleted
+
+    def apply_retention(self, now: Optional[int] = None) -> int:
+        """
+        Delete the klines older than the retention period of their timeframe
+
+        :param now: current time in seconds, default to the system time
+        :type now: Optional[int]
+        :return: number of klines deleted
+        :rtype: int
+        """
+        if not len(self.retention):
+            return 0
+        if now is None:
+            now = int(time.time())
+        n_deleted = 0
+        evicted_pairs = set()
+        for asset, ref_asset, timeframe in self.db.get_stored_pairs():
+            max_age = self.retention.get(timeframe)
+            if max_age is None:
+                continue
+            n_deleted += self._evict(asset, ref_asset, timeframe, 0, now - max_age, 'retention')
+            evicted_pairs.add((asset, ref_asset, timeframe))
+        self._drop_empty_pairs(evicted_pairs)
+        for block_key, _, _, timeframe_name, block_start, _ in self.db.get_all_rows(KlineAccessTable()):
+            max_age = self.retention.get(TIMEFRAME[timeframe_name])
+            if max_age is not None and block_start + self.get_block_duration(TIMEFRAME[timeframe_name]) \
+                    <= now - max_age:
+                self._delete_access(block_key)
+        self.db.commit()
+        self.db.reclaim_space()
+        return n_deleted
+
+    def evict_to_budget(self) -> int:
+        """
+        Delete the least recently used blocks until the database fits in its budget. A block without any recorded
+        lookup (loaded by a backfill for example) counts as used at the time it is first seen by this method. The
+        size is checked after each block, the pages freed by the deletions being counted before they are given back
+        to the file system
+
+        :return: number of klines deleted
+        :rtype: int
+        """
+        if self.max_size is None or self.db.get_size() <= self.max_size:
+            return 0
+        self._track_new_blocks()
+        table = KlineAccessTable()
+        rows = self.db.get_conditions_rows(table, order_list=[table.last_access])
+        n_deleted = 0
+        for block_key, asset, ref_asset, timeframe_name, block_start, _ in rows:
+            timeframe = TIMEFRAME[timeframe_name]
+            n_deleted += self._evict(asset, ref_asset, timeframe, block_start,
+                                     block_start + self.get_block_duration(timeframe), 'size')
+            self._delete_access(block_key)
+            self._drop_empty_pairs([(asset, ref_asset, timeframe)])
+            if self.db.get_size() <= self.max_size:
+                break
+        else:
+            self.logger.warning("%s is still above its budget of %s bytes once all the klines are evicted",
+                                self.db.name, self.max_size)
+        self.db.commit()
+        self.db.reclaim_space()
+        return n_deleted
+
+    def _track_new_blocks(self):
+        """
+        Add an access time to the blocks of the database which have none, such as the klines loaded by a backfill
+
+        :return: None
+        :rtype: None
+        """
+        tracked = {row[0] for row in self.db.get_all_rows(KlineAccessTable())}
+        now = int(time.time())
+        rows = []
+        for asset, ref_asset, timeframe in self.db.get_stored_pairs():
+            for block_start in self.db.get_kline_blocks(asset, ref_asset, timeframe,
+                                                        self.get_block_duration(timeframe)):
+                row = self._get_access_row(asset, ref_asset, timeframe, block_start, now)
+                if row[0] not in tracked:
+                    rows.append(row)
+        self.db.bulk_add_rows(KlineAccessTable(), rows)
+
+    @staticmethod
+    def _get_access_row(asset: str, ref_asset: str, timeframe: TIMEFRAME, block_start: int,
+                        access_time: int) -> Tuple[str, str, str, str, int, int]:
+        """
+        Build the row of the access table of a block
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe of the klines
+        :type timeframe: TIMEFRAME
+        :param block_start: start time of the block
+        :type block_start: int
+        :param access_time: last access time of the block
+        :type access_time: int
+        :return: the row, starting with the key of the block
+        :rtype: Tuple[str, str, str, str, int, int]
+        """
+        return f"{asset}_{ref_asset}_{timeframe.name}_{block_start}", asset, ref_asset, timeframe.name, block_start, \
+            access_time
+
+    def _evict(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int, end_time: int,
+               reason: str) -> int:
+        """
+        Delete the klines of a trading pair in [start_time, end_time), along with their covered ranges and their
+        cached results. Nothing is committed
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe of the klines
+        :type timeframe: TIMEFRAME
+        :param start_time: start of the range (included)
+        :type start_time: int
+        :param end_time: end of the range (excluded)
+        :type end_time: int
+        :param reason: reason of the eviction for the metrics
+        :type reason: str
+        :return: number of klines deleted
+        :rtype: int
+        """
+        n_deleted = self.db.delete_klines(asset, ref_asset, timeframe, start_time, end_time, auto_commit=False)
+        self.db.remove_covered_range(asset, ref_asset, timeframe, start_time, end_time, auto_commit=False)
+        self.db.delete_cache_closest(asset, ref_asset, timeframe, start_time, end_time, auto_commit=False)
+        if n_deleted:
+            MetricsRegistry.increment('klines_evicted_total', n_deleted, database=self.db.name, reason=reason)
+        return n_deleted
+
+    def _drop_empty_pairs(self, pairs: Iterable[Tuple[str, str, TIMEFRAME]]):
+        """
+        Drop the tables of the trading pairs without any kline left, as each table takes at least a page of the file
+
+        :param pairs: trading pairs and timeframes to check
+        :type pairs: Iterable[Tuple[str, str, TIMEFRAME]]
+        :return: None
+        :rtype: None
+        """
+        for asset, ref_asset, timeframe in pairs:
+            if self.db.get_last_kline_timestamp(asset, ref_asset, timeframe) is None:
+                self.db.drop_pair_table(asset, ref_asset, timeframe)
+                self.db.drop_table(KlineCacheTable(asset, ref_asset, timeframe))
+
+    def _delete_access(self, block_key: str):
+        table = KlineAccessTable()
+        self.db.delete_conditions_rows(table, [(table.block, SQLConditionEnum.equal, block_key)], auto_commit=False)
@@ -1,24 +1,41 @@
-import sqlite3
+from __future__ import annotations
 from typing import List, Optional, Tuple
 
 from CryptoPrice.storage.DataBase import DataBase, SQLConditionEnum
 from CryptoPrice.common.prices import Kline
-from CryptoPrice.storage.tables import KlineTable, KlineCacheTable
+from CryptoPrice.storage.tables import KlineTable, KlineCacheTable, KlineCoverageTable, PairListingTable
+from CryptoPrice.utils.MetricsRegistry import MetricsRegistry
 from CryptoPrice.utils.time import TIMEFRAME
 
 
 class KlineDataBase(DataBase):
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, read_only: bool = False):
         """
         Instantiate a kline database object, the name will be used for the saving file
 
         :param name: name of the database
         :type name: str
+        :param read_only: if the database is opened in read only mode, default False
+        :type read_only: bool
         """
-        super().__init__(name)
+        super().__init__(name, read_only)
+        self.source = name  # source of the klines read from this database
 
-    def add_klines(self, klines: List[Kline], ignore_if_exists: bool = False):
+    def new_connection(self, read_only: bool = False) -> KlineDataBase:
+        """
+        Open another connection to the same database, for another thread or process
+
+        :param read_only: if the new connection is read only, default False
+        :type read_only: bool
+        :return: the new database object
+        :rtype: KlineDataBase
+        """
+        db = KlineDataBase(self.name, read_only)
+        db.source = self.source
+        return db
+
+    def add_klines(self, klines: List[Kline], ignore_if_exists: bool = False, auto_commit: bool = True):
         """
         add several klines to the database
 
@@ -26,18 +43,49 @@ class KlineDataBase(DataBase):
         :type klines: List[Kline]
         :param ignore_if_exists: if integrity errors should be ignored, default False
         :type ignore_if_exists: bool
+        :param auto_commit: if the database state should be saved after the insertion, default True
+        :type auto_commit: bool
         :return: None
         :rtype: None
         """
+        tables_rows = {}
         for kline in klines:
-            table = KlineTable(klines[0].asset, kline.ref_asset, kline.timeframe)
+            key = (kline.asset, kline.ref_asset, kline.timeframe)
             row = (kline.open_timestamp, kline.open, kline.high, kline.low, kline.close)
             try:
-                self.add_row(table, row, auto_commit=False)
-            except sqlite3.IntegrityError as err:
-                if not ignore_if_exists:
-                    raise err
-        self.commit()
+                tables_rows[key].append(row)
+            except KeyError:
+                tables_rows[key] = [row]
+        for (asset, ref_asset, timeframe), rows in tables_rows.items():
+            self.add_kline_rows(asset, ref_asset, timeframe, rows, ignore_if_exists=ignore_if_exists, auto_commit=False)
+        if auto_commit:
+            self.commit()
+
+    def add_kline_rows(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, rows: List[Tuple],
+                       ignore_if_exists: bool = False, auto_commit: bool = True) -> int:
+        """
+        add several klines of a trading pair to the database, given as rows (open_timestamp, open, high, low, close).
+        Faster than add_klines for large batches as no Kline object is needed
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe of the klines
+        :type timeframe: TIMEFRAME
+        :param rows: rows of the klines to add
+        :type rows: List[Tuple[int, float, float, float, float]]
+        :param ignore_if_exists: if the klines already stored should be skipped, default False
+        :type ignore_if_exists: bool
+        :param auto_commit: if the database state should be saved after the insertion, default True
+        :type auto_commit: bool
+        :return: number of klines inserted
+        :rtype: int
+        """
+        table = KlineTable(asset, ref_asset, timeframe)
+        n_inserted = self.bulk_add_rows(table, rows, auto_commit=auto_commit, ignore_if_exists=ignore_if_exists)
+        MetricsRegistry.increment('klines_inserted_total', n_inserted, database=self.name, timeframe=timeframe.name)
+        return n_inserted
 
     def get_klines(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: Optional[int] = None,
                    end_time: Optional[int] = None) -> List[Kline]:
@@ -71,6 +119,110 @@ class KlineDataBase(DataBase):
         rows = self.get_conditions_rows(table, conditions_list=conditions_list)
         return [self.row_to_kline(asset, ref_asset, timeframe, r) for r in rows]
 
+    def delete_klines(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: Optional[int] = None,
+                      end_time: Optional[int] = None, auto_commit: bool = True) -> int:
+        """
+        delete the klines of a trading pair and a timeframe with an open time in [start_time, end_time). The covered
+        ranges are not modified, see remove_covered_range
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: delete only klines with an open time greater or equal than start_time
+        :type start_time: Optional[int]
+        :param end_time: delete only klines with an open time lower than end_time
+        :type end_time: Optional[int]
+        :param auto_commit: if the database state should be saved after the deletion, default True
+        :type auto_commit: bool
+        :return: number of klines deleted
+        :rtype: int
+        """
+        table = KlineTable(asset, ref_asset, timeframe)
+        conditions_list = []
+        if start_time is not None:
+            conditions_list.append((table.open_timestamp, SQLConditionEnum.greater_equal, start_time))
+        if end_time is not None:
+            conditions_list.append((table.open_timestamp, SQLConditionEnum.lower, end_time))
+        return self.delete_conditions_rows(table, conditions_list=conditions_list, auto_commit=auto_commit)
+
+    def get_stored_pairs(self) -> List[Tuple[str, str, TIMEFRAME]]:
+        """
+        Return the trading pairs and timeframes having a kline table in the database. The names of the tables are
+        split from the right, an underscore in a name being attributed to the asset (ex: 'BTC_3L_USDT_m1')
+
+        :return: list of asset, ref_asset and timeframe
+        :rtype: List[Tuple[str, str, TIMEFRAME]]
+        """
+        stored_pairs = []
+        for table_name in [t[1] for t in self.get_tables_descriptions()]:
+            parts = table_name.rsplit('_', 2)
+            if len(parts) == 3 and parts[2] in TIMEFRAME.__members__:
+                stored_pairs.append((parts[0], parts[1], TIMEFRAME[parts[2]]))
+        return stored_pairs
+
+    def get_kline_blocks(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, block_duration: int) -> List[int]:
+        """
+        Split the time in blocks of block_duration seconds and return the start of the blocks where klines of a
+        trading pair and a timeframe are stored
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param block_duration: duration of a block in seconds
+        :type block_duration: int
+        :return: start times of the blocks
+        :rtype: List[int]
+        """
+        table = KlineTable(asset, ref_asset, timeframe)
+        rows = self.get_conditions_rows(table, selection=f"DISTINCT {table.open_timestamp} / {block_duration}")
+        return [row[0] * block_duration for row in rows]
+
+    def get_kline_gaps(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: Optional[int] = None,
+                       end_time: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Return the ranges [start_time, end_time) of the missing klines between the stored klines of a trading pair
+        and a timeframe, ordered by start time: two consecutive klines further apart than the timeframe surround a
+        gap. The ranges before the first kline and after the last one are not gaps.
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: only consider the klines with an open time greater or equal than start_time
+        :type start_time: Optional[int]
+        :param end_time: only consider the klines with an open time lower than end_time
+        :type end_time: Optional[int]
+        :return: list of gaps
+        :rtype: List[Tuple[int, int]]
+        """
+        table = KlineTable(asset, ref_asset, timeframe)
+        stride = timeframe.value * 60
+        column = table.open_timestamp
+        conditions_list = []
+        if start_time is not None:
+            conditions_list.append((f"kline.{column}", SQLConditionEnum.greater_equal, start_time))
+        if end_time is not None:
+            conditions_list.append((f"kline.{column}", SQLConditionEnum.lower, end_time))
+        next_cmd = f"SELECT MIN(next.{column}) FROM {table.name} AS next WHERE next.{column} > kline.{column}"
+        if end_time is not None:
+            next_cmd += f" AND next.{column} < {end_time}"
+        # a gap starts after each kline not followed by another one a timeframe later, the lookups on the primary
+        # key are much faster than a window function over the whole table
+        gaps_cmd = self._add_conditions(f"SELECT kline.{column} + {stride} AS gap_start, ({next_cmd}) AS gap_end "
+                                        f"FROM {table.name} AS kline", conditions_list)
+        gaps_cmd += f" {'AND' if len(conditions_list) else 'WHERE'} NOT EXISTS (SELECT 1 FROM {table.name} " \
+                    f"WHERE {column} = kline.{column} + {stride})"
+        return self._fetch_rows(f"SELECT gap_start, gap_end FROM ({gaps_cmd}) WHERE gap_end IS NOT NULL "
+                                f"ORDER BY gap_start")
+
     def get_closest_kline(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, timestamp: int,
                           window: int = 120) -> Optional[Kline]:
         """
@@ -104,9 +256,27 @@ class KlineDataBase(DataBase):
         if len(klines):
             return self.row_to_kline(asset, ref_asset, timeframe, klines[0])
 
+    def get_last_kline_timestamp(self, asset: str, ref_asset: str, timeframe: TIMEFRAME) -> Optional[int]:
+        """
+        Return the open time of the most recent kline stored for a trading pair and a timeframe
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :return: open time of the last kline, None if there is no kline
+        :rtype: Optional[int]
+        """
+        table = KlineTable(asset, ref_asset, timeframe)
+        rows = self.get_conditions_rows(table, selection=f"MAX({table.open_timestamp})")
+        if len(rows):
+            return rows[0][0]
+
     def drop_pair_table(self, asset: str, ref_asset: str, timeframe: TIMEFRAME):
         """
-        drop the table associated with a trading pair and a time frame
+        drop the table associated with a trading pair and a time frame, along with its coverage records
 
         :param asset: asset of the trading pair
         :type asset: str
@@ -117,8 +287,7 @@ class KlineDataBase(DataBase):
         :return: None
         :rtype: None
         """
-        table = KlineTable(asset, ref_asset, timeframe)
-        super().drop_table(table)
+        super().drop_tables([KlineTable(asset, ref_asset, timeframe), KlineCoverageTable(asset, ref_asset, timeframe)])
 
     def row_to_kline(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, row: Tuple):
         """
@@ -135,7 +304,7 @@ class KlineDataBase(DataBase):
         :return: the Kline corresponding to the args
         :rtype: Kline
         """
-        return Kline(*row, asset=asset, ref_asset=ref_asset, timeframe=timeframe, source=self.name)
+        return Kline(*row, asset=asset, ref_asset=ref_asset, timeframe=timeframe, source=self.source)
 
     def get_cache_closest(self, asset: str, ref_asset: str, timeframe: TIMEFRAME,
                           timestamp: int) -> Tuple[Optional[int], int]:
@@ -187,6 +356,34 @@ class KlineDataBase(DataBase):
         row = (timestamp, closest_timestamp, window)
         self.add_row(table, row, update_if_exists=True)
 
+    def delete_cache_closest(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int, end_time: int,
+                             auto_commit: bool = True):
+        """
+        Delete the cached results of closest price requests which selected a kline with an open time in
+        [start_time, end_time), for when these klines are removed from the database
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: start of the range (included)
+        :type start_time: int
+        :param end_time: end of the range (excluded)
+        :type end_time: int
+        :param auto_commit: if the database state should be saved after the deletion, default True
+        :type auto_commit: bool
+        :return: None
+        :rtype: None
+        """
+        table = KlineCacheTable(asset, ref_asset, timeframe)
+        conditions_list = [
+            (table.closest, SQLConditionEnum.greater_equal, start_time),
+            (table.closest, SQLConditionEnum.lower, end_time)
+        ]
+        self.delete_conditions_rows(table, conditions_list=conditions_list, auto_commit=auto_commit)
+
     def drop_cache_tables(self):
         """
         Delete all the cache tables stored in the database
@@ -198,3 +395,169 @@ class KlineDataBase(DataBase):
         tables = [table for table in tables if table.endswith('_cache')]
         self.drop_tables(tables)
 
+    def add_covered_range(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int, end_time: int,
+                          auto_commit: bool = True):
+        """
+        Record that all the existing klines with an open time in [start_time, end_time) are stored locally.
+        Overlapping or contiguous ranges are merged together
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: start of the covered range (included)
+        :type start_time: int
+        :param end_time: end of the covered range (excluded)
+        :type end_time: int
+        :param auto_commit: if the database state should be saved after the insertion, default True
+        :type auto_commit: bool
+        :return: None
+        :rtype: None
+        """
+        if end_time <= start_time:
+            return
+        table = KlineCoverageTable(asset, ref_asset, timeframe)
+        conditions_list = [
+            (table.start_time, SQLConditionEnum.lower_equal, end_time),
+            (table.end_time, SQLConditionEnum.greater_equal, start_time)
+        ]
+        for row_start_time, row_end_time in self.get_conditions_rows(table, conditions_list=conditions_list):
+            start_time = min(start_time, row_start_time)
+            end_time = max(end_time, row_end_time)
+        self.delete_conditions_rows(table, conditions_list=conditions_list, auto_commit=False)
+        self.add_row(table, (start_time, end_time), auto_commit=auto_commit)
+
+    def remove_covered_range(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int, end_time: int,
+                             auto_commit: bool = True):
+        """
+        Record that the klines with an open time in [start_time, end_time) may not be stored locally anymore. The
+        covered ranges overlapping it are cut
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: start of the range (included)
+        :type start_time: int
+        :param end_time: end of the range (excluded)
+        :type end_time: int
+        :param auto_commit: if the database state should be saved after the deletion, default True
+        :type auto_commit: bool
+        :return: None
+        :rtype: None
+        """
+        if end_time <= start_time:
+            return
+        table = KlineCoverageTable(asset, ref_asset, timeframe)
+        conditions_list = [
+            (table.start_time, SQLConditionEnum.lower, end_time),
+            (table.end_time, SQLConditionEnum.greater, start_time)
+        ]
+        rows = self.get_conditions_rows(table, conditions_list=conditions_list)
+        if not len(rows):
+            return
+        self.delete_conditions_rows(table, conditions_list=conditions_list, auto_commit=False)
+        for row_start_time, row_end_time in rows:
+            if row_start_time < start_time:
+                self.add_row(table, (row_start_time, start_time), auto_commit=False)
+            if row_end_time > end_time:
+                self.add_row(table, (end_time, row_end_time), auto_commit=False)
+        if auto_commit:
+            self.commit()
+
+    def get_covered_ranges(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: Optional[int] = None,
+                           end_time: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Return the ranges [start_time, end_time) known to be fully stored locally, ordered by start time.
+        A time window can be provided to only return the ranges intersecting it
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: return only the ranges ending after start_time
+        :type start_time: Optional[int]
+        :param end_time: return only the ranges starting before end_time
+        :type end_time: Optional[int]
+        :return: list of covered ranges
+        :rtype: List[Tuple[int, int]]
+        """
+        table = KlineCoverageTable(asset, ref_asset, timeframe)
+        conditions_list = []
+        if start_time is not None:
+            conditions_list.append((table.end_time, SQLConditionEnum.greater, start_time))
+        if end_time is not None:
+            conditions_list.append((table.start_time, SQLConditionEnum.lower, end_time))
+        return self.get_conditions_rows(table, conditions_list=conditions_list, order_list=[table.start_time])
+
+    def is_range_covered(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int,
+                         end_time: int) -> bool:
+        """
+        Tell if all the existing klines with an open time in [start_time, end_time) are stored locally
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: start of the range (included)
+        :type start_time: int
+        :param end_time: end of the range (excluded)
+        :type end_time: int
+        :return: True if the range is covered
+        :rtype: bool
+        """
+        table = KlineCoverageTable(asset, ref_asset, timeframe)
+        conditions_list = [
+            (table.start_time, SQLConditionEnum.lower_equal, start_time),
+            (table.end_time, SQLConditionEnum.greater_equal, end_time)
+        ]
+        return len(self.get_conditions_rows(table, conditions_list=conditions_list)) > 0
+
+    def get_pair_listing(self, asset: str, ref_asset: str, timeframe: TIMEFRAME) -> Optional[Tuple[int, int, int]]:
+        """
+        Return the open time of the first and last klines available on the API for a trading pair, along with the
+        time when this information was checked. A first and last open time of -1 means that no kline was available.
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :return: first_timestamp, last_timestamp, check_timestamp or None if the pair was never checked
+        :rtype: Optional[Tuple[int, int, int]]
+        """
+        row = self.get_row_by_key(PairListingTable(), f"{asset}_{ref_asset}_{timeframe.name}")
+        if row is not None:
+            return row[1:]
+
+    def add_pair_listing(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, first_timestamp: int,
+                         last_timestamp: int, check_timestamp: int):
+        """
+        Save the open time of the first and last klines available on the API for a trading pair
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param first_timestamp: open time of the first kline, -1 if there is none
+        :type first_timestamp: int
+        :param last_timestamp: open time of the last kline, -1 if there is none
+        :type last_timestamp: int
+        :param check_timestamp: time at which the API was checked
+        :type check_timestamp: int
+        :return: None
+        :rtype: None
+        """
+        row = (f"{asset}_{ref_asset}_{timeframe.name}", first_timestamp, last_timestamp, check_timestamp)
+        self.add_row(PairListingTable(), row, update_if_exists=True)
@@ -0,0 +1,606 @@
+from __future__ import annotations
+import datetime
+import os
+import zlib
+from enum import Enum
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from CryptoPrice.common.prices import Kline
+from CryptoPrice.storage.DataBase import SQLConditionEnum
+from CryptoPrice.storage.KlineDataBase import KlineDataBase
+from CryptoPrice.storage.tables import KlineTable, KlineCoverageTable, KlineCacheTable, ShardTable
+from CryptoPrice.utils.time import TIMEFRAME
+
+
+class ShardingMode(Enum):
+    """
+    Enumeration for the ways the klines of a ShardedKlineDataBase are split between its shards
+    asset: one shard per asset of the trading pairs
+    pair_hash: a fixed number of shards, a trading pair goes to the shard given by the hash of its name
+    month: one shard per month of the open time of the klines
+    """
+    asset = 'asset'
+    pair_hash = 'pair_hash'
+    month = 'month'
+
+
+class ShardedKlineDataBase(KlineDataBase):
+    """
+    KlineDataBase whose klines are split between several database files, the shards, named {name}_{shard}.db. The
+    file {name}_index.db is the index: it keeps the covered ranges, the cache of the closest price requests, the
+    listing of the pairs and the registry of the shards. The reads and the writes of klines are routed to the shards,
+    and the range queries spanning several month shards are merged.
+
+    Each shard is a distinct file: writers of different shards do not block each other, and a shard can be backed up,
+    vacuumed or dropped on its own. Once created, the sharding mode of a database can not be changed.
+
+    .. code-block:: python
+
+        retriever = BinanceRetriever()
+        retriever.db = ShardedKlineDataBase(retriever.name, ShardingMode.month)
+    """
+
+    def __init__(self, name: str, sharding: ShardingMode = ShardingMode.month, n_shards: int = 16,
+                 read_only: bool = False):
+        """
+        Instantiate a sharded kline database
+
+        :param name: name of the database, used as the prefix of the files and as the source of the klines. It should
+            be the name of the retriever using the database
+        :type name: str
+        :param sharding: how the klines are split between the shards, default by month
+        :type sharding: ShardingMode
+        :param n_shards: number of shards for the sharding by pair hash, default 16
+        :type n_shards: int
+        :param read_only: if the index and the shards are opened in read only mode, default False
+        :type read_only: bool
+        """
+        super().__init__(f"{name}_index", read_only)
+        self.source = name
+        self.sharding = sharding
+        self.n_shards = n_shards
+        self._shards: Dict[str, KlineDataBase] = {}  # opened shards
+        self._shard_names: Set[str] = set()
+        self._data_version: Optional[int] = None  # version of the index when the registry was read
+        self._incremental_vacuum = False  # if the new shards are created in incremental auto vacuum mode
+        self._load_shard_names()
+
+    def _load_shard_names(self):
+        """
+        Read the registry of the shards again if another connection modified the index since the last reading
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            data_version = self.db_conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        rows = self.get_all_rows(ShardTable())
+        for _, shard_sharding in rows:
+            if shard_sharding != self.sharding.value:
+                raise ValueError(f"the database {self.name} is sharded by {shard_sharding}, "
+                                 f"not by {self.sharding.value}")
+        self._shard_names = {shard_name for shard_name, _ in rows}
+
+    def new_connection(self, read_only: bool = False) -> ShardedKlineDataBase:
+        """
+        Open another connection to the same database, for another thread or process
+
+        :param read_only: if the new connection is read only, default False
+        :type read_only: bool
+        :return: the new database object
+        :rtype: ShardedKlineDataBase
+        """
+        return ShardedKlineDataBase(self.source, self.sharding, self.n_shards, read_only)
+
+    def get_shard_name(self, asset: str, ref_asset: str, open_timestamp: int) -> str:
+        """
+        Return the name of the shard storing a kline
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param open_timestamp: open time of the kline
+        :type open_timestamp: int
+        :return: name of the shard
+        :rtype: str
+        """
+        if self.sharding == ShardingMode.asset:
+            return asset
+        if self.sharding == ShardingMode.pair_hash:
+            return f"h{zlib.crc32(f'{asset}_{ref_asset}'.encode()) % self.n_shards}"
+        return datetime.datetime.fromtimestamp(open_timestamp, datetime.timezone.utc).strftime('%Y_%m')
+
+    def get_shard_names(self) -> List[str]:
+        """
+        Return the names of the existing shards, in chronological order for the sharding by month
+
+        :return: names of the shards
+        :rtype: List[str]
+        """
+        self._load_shard_names()
+        return sorted(self._shard_names)
+
+    @staticmethod
+    def get_month_range(shard_name: str) -> Tuple[int, int]:
+        """
+        Return the time range covered by a month shard
+
+        :param shard_name: name of the shard (ex '2021_01')
+        :type shard_name: str
+        :return: start (included) and end (excluded) of the month
+        :rtype: Tuple[int, int]
+        """
+        year, month = (int(v) for v in shard_name.split('_'))
+        start = datetime.datetime(year, month, 1, tzinfo=datetime.timezone.utc)
+        end = datetime.datetime(year + month // 12, month % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+        return int(start.timestamp()), int(end.timestamp())
+
+    def _get_shard(self, shard_name: str, create: bool = False) -> Optional[KlineDataBase]:
+        """
+        Return the database of a shard, opening it if needed
+
+        :param shard_name: name of the shard
+        :type shard_name: str
+        :param create: if the shard should be created when it does not exist yet, default False
+        :type create: bool
+        :return: the shard, None if it does not exist and create is False
+        :rtype: Optional[KlineDataBase]
+        """
+        if shard_name not in self._shard_names:
+            if not create:
+                return None
+            # another connection may have created it meanwhile
+            self.add_row(ShardTable(), (shard_name, self.sharding.value), auto_commit=False, update_if_exists=True)
+            super().commit()
+            self._shard_names.add(shard_name)
+        try:
+            return self._shards[shard_name]
+        except KeyError:
+            pass
+        shard = self._shards[shard_name] = KlineDataBase(f"{self.source}_{shard_name}", self.read_only)
+        shard.source = self.source
+        if self._incremental_vacuum:
+            shard.enable_incremental_vacuum()
+        if self.write_behind_max_pending is not None:
+            shard.enable_write_behind(self.write_behind_max_pending, self.write_behind_max_delay)
+        return shard
+
+    def _get_read_shards(self, asset: str, ref_asset: str, start_time: Optional[int] = None,
+                         end_time: Optional[int] = None) -> Iterable[KlineDataBase]:
+        """
+        Iterate over the existing shards that may store klines of a trading pair in [start_time, end_time), in
+        chronological order for the sharding by month
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param start_time: start of the time range (included), None for no limit
+        :type start_time: Optional[int]
+        :param end_time: end of the time range (excluded), None for no limit
+        :type end_time: Optional[int]
+        :return: the shards
+        :rtype: Iterable[KlineDataBase]
+        """
+        self._load_shard_names()
+        if self.sharding != ShardingMode.month:
+            shard = self._get_shard(self.get_shard_name(asset, ref_asset, 0))
+            if shard is not None:
+                yield shard
+            return
+        if start_time is None or end_time is None:
+            for shard_name in self.get_shard_names():
+                month_start, month_end = self.get_month_range(shard_name)
+                if (start_time is None or month_end > start_time) and (end_time is None or month_start < end_time):
+                    yield self._get_shard(shard_name)
+            return
+        shard_name = self.get_shard_name(asset, ref_asset, start_time)
+        last_shard_name = self.get_shard_name(asset, ref_asset, end_time - 1)
+        while True:
+            shard = self._get_shard(shard_name)
+            if shard is not None:
+                yield shard
+            if shard_name >= last_shard_name:
+                break
+            year, month = (int(v) for v in shard_name.split('_'))
+            shard_name = f"{year + month // 12}_{month % 12 + 1:02d}"
+
+    def add_klines(self, klines: List[Kline], ignore_if_exists: bool = False, auto_commit: bool = True):
+        """
+        add several klines to the database, each one in its shard
+
+        :param klines: list of klines to add to the database
+        :type klines: List[Kline]
+        :param ignore_if_exists: if integrity errors should be ignored, default False
+        :type ignore_if_exists: bool
+        :param auto_commit: if the database state should be saved after the insertion, default True
+        :type auto_commit: bool
+        :return: None
+        :rtype: None
+        """
+        shards_klines: Dict[str, List[Kline]] = {}
+        month_start, month_end, shard_name = 0, 0, None
+        for kline in klines:
+            if self.sharding != ShardingMode.month:
+                shard_name = self.get_shard_name(kline.asset, kline.ref_asset, kline.open_timestamp)
+            elif not month_start <= kline.open_timestamp < month_end:  # the klines are mostly sorted
+                shard_name = self.get_shard_name(kline.asset, kline.ref_asset, kline.open_timestamp)
+                month_start, month_end = self.get_month_range(shard_name)
+            try:
+                shards_klines[shard_name].append(kline)
+            except KeyError:
+                shards_klines[shard_name] = [kline]
+        for shard_name, shard_klines in shards_klines.items():
+            self._get_shard(shard_name, create=True).add_klines(shard_klines, ignore_if_exists, auto_commit)
+
+    def add_kline_rows(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, rows: List[Tuple],
+                       ignore_if_exists: bool = False, auto_commit: bool = True) -> int:
+        """
+        add several klines of a trading pair to the database, given as rows (open_timestamp, open, high, low, close),
+        each one in its shard
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe of the klines
+        :type timeframe: TIMEFRAME
+        :param rows: rows of the klines to add
+        :type rows: List[Tuple[int, float, float, float, float]]
+        :param ignore_if_exists: if the klines already stored should be skipped, default False
+        :type ignore_if_exists: bool
+        :param auto_commit: if the database state should be saved after the insertion, default True
+        :type auto_commit: bool
+        :return: number of klines inserted
+        :rtype: int
+        """
+        shards_rows: Dict[str, List[Tuple]] = {}
+        month_start, month_end, shard_name = 0, 0, None
+        for row in rows:
+            if self.sharding != ShardingMode.month:
+                shard_name = self.get_shard_name(asset, ref_asset, row[0])
+            elif not month_start <= row[0] < month_end:  # the rows are mostly sorted
+                shard_name = self.get_shard_name(asset, ref_asset, row[0])
+                month_start, month_end = self.get_month_range(shard_name)
+            try:
+                shards_rows[shard_name].append(row)
+            except KeyError:
+                shards_rows[shard_name] = [row]
+        return sum(self._get_shard(shard_name, create=True).add_kline_rows(asset, ref_asset, timeframe, shard_rows,
+                                                                           ignore_if_exists, auto_commit)
+                   for shard_name, shard_rows in shards_rows.items())
+
+    def get_klines(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: Optional[int] = None,
+                   end_time: Optional[int] = None) -> List[Kline]:
+        """
+        return the klines corresponding to a trading pair and a timeframe, from all the shards storing them
+        a time window can also be provided.
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: fetch only klines with an open time greater or equal than start_time
+        :type start_time: Optional[int]
+        :param end_time: fetch only klines with an open time lower than end_time
+        :type end_time: Optional[int]
+        :return: list of klines
+        :rtype: List[Klines]
+        """
+        klines = []
+        for shard in self._get_read_shards(asset, ref_asset, start_time, end_time):
+            klines.extend(shard.get_klines(asset, ref_asset, timeframe, start_time, end_time))
+        return klines
+
+    def get_closest_kline(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, timestamp: int,
+                          window: int = 120) -> Optional[Kline]:
+        """
+        Return the closest Kline in a time window for a trading pair and a timeframe, the window can span two month
+        shards. If there is no Kline, None is returned
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param timestamp: time of interest in seconds
+        :type timestamp: int
+        :param window: time window in seconds for the kline to look
+        :type window: int
+        :return: the Kline with an open time the closest to the provided timestamp
+        :rtype: Optional[Kline]
+        """
+        closest_kline = None
+        for shard in self._get_read_shards(asset, ref_asset, timestamp - window, timestamp + window):
+            kline = shard.get_closest_kline(asset, ref_asset, timeframe, timestamp, window)
+            if kline is not None and (closest_kline is None or abs(kline.open_timestamp - timestamp)
+                                      < abs(closest_kline.open_timestamp - timestamp)):
+                closest_kline = kline
+        return closest_kline
+
+    def get_last_kline_timestamp(self, asset: str, ref_asset: str, timeframe: TIMEFRAME) -> Optional[int]:
+        """
+        Return the open time of the most recent kline stored for a trading pair and a timeframe
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :return: open time of the last kline, None if there is no kline
+        :rtype: Optional[int]
+        """
+        for shard in reversed(list(self._get_read_shards(asset, ref_asset))):
+            last_timestamp = shard.get_last_kline_timestamp(asset, ref_asset, timeframe)
+            if last_timestamp is not None:
+                return last_timestamp
+
+    def delete_klines(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: Optional[int] = None,
+                      end_time: Optional[int] = None, auto_commit: bool = True) -> int:
+        """
+        delete the klines of a trading pair and a timeframe with an open time in [start_time, end_time), in all the
+        shards storing them. The covered ranges are not modified, see remove_covered_range
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: delete only klines with an open time greater or equal than start_time
+        :type start_time: Optional[int]
+        :param end_time: delete only klines with an open time lower than end_time
+        :type end_time: Optional[int]
+        :param auto_commit: if the database state should be saved after the deletion, default True
+        :type auto_commit: bool
+        :return: number of klines deleted
+        :rtype: int
+        """
+        return sum(shard.delete_klines(asset, ref_asset, timeframe, start_time, end_time, auto_commit)
+                   for shard in self._get_read_shards(asset, ref_asset, start_time, end_time))
+
+    def get_stored_pairs(self) -> List[Tuple[str, str, TIMEFRAME]]:
+        """
+        Return the trading pairs and timeframes having a kline table in at least one shard
+
+        :return: list of asset, ref_asset and timeframe
+        :rtype: List[Tuple[str, str, TIMEFRAME]]
+        """
+        stored_pairs = {}
+        for shard_name in self.get_shard_names():
+            stored_pairs.update(dict.fromkeys(self._get_shard(shard_name).get_stored_pairs()))
+        return list(stored_pairs)
+
+    def get_kline_blocks(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, block_duration: int) -> List[int]:
+        """
+        Split the time in blocks of block_duration seconds and return the start of the blocks where klines of a
+        trading pair and a timeframe are stored, in any shard
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param block_duration: duration of a block in seconds
+        :type block_duration: int
+        :return: start times of the blocks
+        :rtype: List[int]
+        """
+        blocks = set()
+        for shard in self._get_read_shards(asset, ref_asset):
+            blocks.update(shard.get_kline_blocks(asset, ref_asset, timeframe, block_duration))
+        return sorted(blocks)
+
+    def get_kline_gaps(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: Optional[int] = None,
+                       end_time: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Return the ranges [start_time, end_time) of the missing klines between the stored klines of a trading pair
+        and a timeframe, ordered by start time. The gaps spanning several month shards are joined.
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :param start_time: only consider the klines with an open time greater or equal than start_time
+        :type start_time: Optional[int]
+        :param end_time: only consider the klines with an open time lower than end_time
+        :type end_time: Optional[int]
+        :return: list of gaps
+        :rtype: List[Tuple[int, int]]
+        """
+        table = KlineTable(asset, ref_asset, timeframe)
+        conditions_list = []
+        if start_time is not None:
+            conditions_list.append((table.open_timestamp, SQLConditionEnum.greater_equal, start_time))
+        if end_time is not None:
+            conditions_list.append((table.open_timestamp, SQLConditionEnum.lower, end_time))
+        selection = [f"MIN({table.open_timestamp})", f"MAX({table.open_timestamp})"]
+        stride = timeframe.value * 60
+        gaps = []
+        previous_last_timestamp = None
+        for shard in self._get_read_shards(asset, ref_asset, start_time, end_time):
+            rows = shard.get_conditions_rows(table, selection=selection, conditions_list=conditions_list)
+            if not len(rows) or rows[0][0] is None:
+                continue
+            first_timestamp, last_timestamp = rows[0]
+            if previous_last_timestamp is not None and first_timestamp - previous_last_timestamp > stride:
+                gaps.append((previous_last_timestamp + stride, first_timestamp))
+            gaps.extend(shard.get_kline_gaps(asset, ref_asset, timeframe, start_time, end_time))
+            previous_last_timestamp = last_timestamp
+        return gaps
+
+    def get_size(self) -> int:
+        """
+        Return the space used by the data of the index and of the shards in bytes
+
+        :return: size in bytes
+        :rtype: int
+        """
+        return super().get_size() + sum(self._get_shard(shard_name).get_size()
+                                        for shard_name in self.get_shard_names())
+
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        Set the index and the shards in incremental auto vacuum mode, see DataBase.enable_incremental_vacuum. The
+        shards created later are also set in this mode
+
+        :return: True if the index and all the shards are in incremental auto vacuum mode
+        :rtype: bool
+        """
+        self._incremental_vacuum = True
+        enabled = super().enable_incremental_vacuum()
+        for shard_name in self.get_shard_names():
+            enabled = self._get_shard(shard_name).enable_incremental_vacuum() and enabled
+        return enabled
+
+    def reclaim_space(self, max_pages: Optional[int] = None):
+        """
+        Give free pages of the index and of the opened shards back to the file system, see DataBase.reclaim_space
+
+        :param max_pages: maximum number of pages to free per file, None to free all of them
+        :type max_pages: Optional[int]
+        :return: None
+        :rtype: None
+        """
+        for shard in self._shards.values():
+            shard.reclaim_space(max_pages)
+        super().reclaim_space(max_pages)
+
+    def drop_pair_table(self, asset: str, ref_asset: str, timeframe: TIMEFRAME):
+        """
+        drop the tables associated with a trading pair and a time frame in all the shards, along with its coverage
+        records
+
+        :param asset: asset of the trading pair
+        :type asset: str
+        :param ref_asset: reference asset of the trading pair
+        :type ref_asset: str
+        :param timeframe: timeframe for the kline
+        :type timeframe: TIMEFRAME
+        :return: None
+        :rtype: None
+        """
+        for shard in self._get_read_shards(asset, ref_asset):
+            shard.drop_table(KlineTable(asset, ref_asset, timeframe))
+        self.drop_table(KlineCoverageTable(asset, ref_asset, timeframe))
+
+    def drop_shard(self, shard_name: str):
+        """
+        Delete a shard and its file, to archive or free a cold part of the data. The covered ranges and the cached
+        results of its klines are removed from the index, so the klines are fetched again if needed
+
+        :param shard_name: name of the shard to delete
+        :type shard_name: str
+        :return: None
+        :rtype: None
+        """
+        shard = self._get_shard(shard_name)
+        if shard is None:
+            return
+        for asset, ref_asset, timeframe in shard.get_stored_pairs():
+            if self.sharding == ShardingMode.month:
+                start_time, end_time = self.get_month_range(shard_name)
+                self.remove_covered_range(asset, ref_asset, timeframe, start_time, end_time, auto_commit=False)
+                self.delete_cache_closest(asset, ref_asset, timeframe, start_time, end_time, auto_commit=False)
+            else:
+                self.drop_tables([KlineCoverageTable(asset, ref_asset, timeframe),
+                                  KlineCacheTable(asset, ref_asset, timeframe)])
+        shard.close()
+        del self._shards[shard_name]
+        os.remove(shard.save_path)
+        self.delete_conditions_rows(ShardTable(), [(ShardTable().shard, SQLConditionEnum.equal, shard_name)],
+                                    auto_commit=False)
+        self._shard_names.discard(shard_name)
+        self.commit()
+
+    def drop_all_tables(self):
+        """
+        drop all the tables existing in the index and in the shards
+
+        :return: None
+        :rtype: None
+        """
+        for shard_name in self.get_shard_names():
+            self._get_shard(shard_name).drop_all_tables()
+        super().drop_all_tables()
+        self._shard_names.clear()
+
+    def commit(self):
+        """
+        submit and save the state of the opened shards and of the index, see DataBase.commit
+        :return:
+        """
+        for shard in self._shards.values():
+            shard.commit()
+        super().commit()
+
+    def flush(self):
+        """
+        save the writes deferred by the write-behind in the opened shards and in the index
+
+        :return: None
+        :rtype: None
+        """
+        for shard in self._shards.values():
+            shard.flush()
+        super().flush()
+
+    def rollback(self):
+        """
+        Cancel the writes not committed yet in the opened shards and in the index
+
+        :return: None
+        :rtype: None
+        """
+        for shard in self._shards.values():
+            shard.rollback()
+        super().rollback()
+
+    def enable_write_behind(self, max_pending: int = 1000, max_delay: float = 1.):
+        """
+        Defer the commits of the index and of the shards, see DataBase.enable_write_behind
+
+        :param max_pending: maximum number of deferred commits
+        :type max_pending: int
+        :param max_delay: maximum time in seconds a deferred commit waits for the next commits
+        :type max_delay: float
+        :return: None
+        :rtype: None
+        """
+        for shard in self._shards.values():
+            shard.enable_write_behind(max_pending, max_delay)
+        super().enable_write_behind(max_pending, max_delay)
+
+    def disable_write_behind(self):
+        """
+        Flush the deferred writes of the index and of the shards and go back to executing every commit immediately
+
+        :return: None
+        :rtype: None
+        """
+        for shard in self._shards.values():
+            shard.disable_write_behind()
+        super().disable_write_behind()
+
+    def close(self):
+        """
+        Flush the deferred writes and close the connections to the shards and to the index
+
+        :return: None
+        :rtype: None
+        """
+        for shard in self._shards.values():
+            shard.close()
+        self._shards.clear()
+        super().close()
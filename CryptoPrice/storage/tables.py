@@ -65,3 +65,93 @@ class KlineCacheTable(Table):
                          primary_key="timestamp",
                          primary_key_sql_type="INTEGER"
                          )
+
+
+class KlineCoverageTable(Table):
+    """
+    Each row is a time range [start_time, end_time) for which all the existing klines of a trading pair and a
+    timeframe are known to be stored locally: no API call is needed to search a kline inside such a range
+    """
+
+    def __init__(self, asset: str, ref_asset: str, timeframe: TIMEFRAME):
+        name = f"{asset}_{ref_asset}_{timeframe.name}_coverage"
+        super().__init__(name,
+                         [
+                             "end_time"
+                         ],
+                         [
+                             "INTEGER"
+                         ],
+                         primary_key="start_time",
+                         primary_key_sql_type="INTEGER"
+                         )
+
+
+class PairListingTable(Table):
+    """
+    Store, for each trading pair and timeframe, the open time of the first and of the last kline available on the API
+    when the pair was checked
+    """
+
+    def __init__(self):
+        super().__init__("pairs_listing",
+                         [
+                             "first_timestamp",
+                             "last_timestamp",
+                             "check_timestamp"
+                         ],
+                         [
+                             "INTEGER",
+                             "INTEGER",
+                             "INTEGER"
+                         ],
+                         primary_key="pair",
+                         primary_key_sql_type="TEXT"
+                         )
+
+
+class ShardTable(Table):
+    """
+    Registry of the shards of a ShardedKlineDataBase, stored in its index database, with the sharding mode used to
+    create each shard
+    """
+
+    def __init__(self):
+        super().__init__("shards",
+                         [
+                             "sharding"
+                         ],
+                         [
+                             "TEXT"
+                         ],
+                         primary_key="shard",
+                         primary_key_sql_type="TEXT"
+                         )
+
+
+class KlineAccessTable(Table):
+    """
+    Store the last time the klines of a block of time were looked up, for each trading pair and timeframe. The key
+    is made of the asset, the reference asset, the timeframe and the start time of the block, which are also stored
+    in their own columns
+    """
+
+    def __init__(self):
+        super().__init__("kline_access",
+                         [
+                             "asset",
+                             "ref_asset",
+                             "timeframe",
+                             "block_start",
+                             "last_access"
+                         ],
+                         [
+                             "TEXT",
+                             "TEXT",
+                             "TEXT",
+                             "INTEGER",
+                             "INTEGER"
+                         ],
+                         primary_key="block",
+                         primary_key_sql_type="TEXT"
+                         )
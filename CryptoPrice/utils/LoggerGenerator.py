@@ -1,10 +1,54 @@
+import atexit
 import logging
+import logging.handlers
 import os
-from typing import Optional
+import queue
+import threading
+from typing import Optional, Dict, List, Tuple
 
 from CryptoPrice.utils.paths import get_data_path
 
 
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves the formatting of the records to the listener thread. The records never leave the
+    process, so they don't need to be made picklable
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _DispatchHandler(logging.Handler):
+    """
+    Handler used by the shared queue listener, it passes each record to the handlers of the logger that emitted it
+    """
+
+    def handle(self, record: logging.LogRecord):
+        for handler in LoggerGenerator._async_handlers.get(record.name, []):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class _SamplingFilter(logging.Filter):
+    """
+    Filter letting through only one out of n debug records for each message template
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._counts: Dict[Tuple[str, object], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = LoggerGenerator._debug_sampling_rate
+        if rate <= 1 or record.levelno > logging.DEBUG:
+            return True
+        key = (record.name, record.msg)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        return count % rate == 0
+
+
 class LoggerGenerator:
     """
     This class is a utility to facilitate the creation of loggers for the different classes / files
@@ -13,8 +57,15 @@ class LoggerGenerator:
 
     _default_log_level = logging.WARNING
     _default_write_file = False
+    _default_async = False
+    _debug_sampling_rate = 1
     _logger_count = 0
 
+    _queue: Optional[queue.SimpleQueue] = None
+    _listener: Optional[logging.handlers.QueueListener] = None
+    _async_handlers: Dict[str, List[logging.Handler]] = {}
+    _lock = threading.Lock()
+
     @staticmethod
     def set_global_log_level(log_level: int):
         """
@@ -39,9 +90,66 @@ class LoggerGenerator:
         """
         LoggerGenerator._default_write_file = write_file
 
+    @staticmethod
+    def set_default_async(async_handlers: bool):
+        """
+        set if the loggers created should write their messages from a background thread, so that the console and
+        file I/O do not slow down the caller
+
+        :param async_handlers: if the handlers of the loggers should run in a background thread
+        :type async_handlers: bool
+        :return: None
+        :rtype: None
+        """
+        LoggerGenerator._default_async = async_handlers
+
+    @staticmethod
+    def set_debug_sampling(rate: int):
+        """
+        set the sampling of the debug messages: only one out of rate debug messages with the same template will be
+        emitted by each logger. It applies to all the loggers, already created or not
+
+        :param rate: one message out of rate is emitted, 1 (default) disables the sampling
+        :type rate: int
+        :return: None
+        :rtype: None
+        """
+        LoggerGenerator._debug_sampling_rate = max(1, rate)
+
+    @staticmethod
+    def stop_async_logging():
+        """
+        write the messages waiting in the queue and stop the background logging thread. It is called automatically
+        when the interpreter exits
+
+        :return: None
+        :rtype: None
+        """
+        with LoggerGenerator._lock:
+            if LoggerGenerator._listener is not None:
+                LoggerGenerator._listener.stop()
+                LoggerGenerator._listener = None
+
+    @staticmethod
+    def _get_queue() -> queue.SimpleQueue:
+        """
+        return the queue of the background logging thread, start the thread if needed
+
+        :return: the queue of the log records
+        :rtype: queue.SimpleQueue
+        """
+        with LoggerGenerator._lock:
+            if LoggerGenerator._queue is None:
+                LoggerGenerator._queue = queue.SimpleQueue()
+            if LoggerGenerator._listener is None:
+                LoggerGenerator._listener = logging.handlers.QueueListener(LoggerGenerator._queue,
+                                                                           _DispatchHandler())
+                LoggerGenerator._listener.start()
+            return LoggerGenerator._queue
+
     @staticmethod
     def get_logger(logger_name: str, write_file: Optional[bool] = None,
-                   log_level: Optional[int] = None) -> logging.Logger:
+                   log_level: Optional[int] = None, async_handlers: Optional[bool] = None) -> logging.Logger:
         """
         create a logger that will display messages according to the log level threshold. If specified, it will
         also save the messages in a file inside the logs folder
@@ -52,6 +160,8 @@ class LoggerGenerator:
         :type write_file: bool
         :param log_level: threshold to display the message
         :type log_level: logging enum (ex: logging.WARNING)
+        :param async_handlers: if the messages should be formatted and written from a background thread
+        :type async_handlers: bool
         :return: the logger object
         :rtype: logging.Logger
         """
@@ -59,12 +169,16 @@ class LoggerGenerator:
             log_level = LoggerGenerator._default_log_level
         if write_file is None:
             write_file = LoggerGenerator._default_write_file
+        if async_handlers is None:
+            async_handlers = LoggerGenerator._default_async
 
         # create logger
         logger = logging.getLogger(f"lg_{LoggerGenerator._logger_count}_{logger_name}")
         logger.setLevel(level=log_level)
+        logger.addFilter(_SamplingFilter())
         LoggerGenerator._logger_count += 1
 
+        handlers = []
         # create formatter and add it to the handlers
         log_format = '[%(asctime)s %(name)s %(levelname)s] %(message)s [%(pathname)s:%(lineno)d in %(funcName)s]'
         formatter = logging.Formatter(log_format)
@@ -75,17 +189,28 @@ class LoggerGenerator:
             fh = logging.FileHandler(log_file_path)
             fh.setLevel(level=log_level)
             fh.setFormatter(formatter)
-            logger.addHandler(fh)
+            handlers.append(fh)
 
         # create console handler for logger.
         ch = logging.StreamHandler()
         ch.setLevel(level=log_level)
         ch.setFormatter(formatter)
-        logger.addHandler(ch)
+        handlers.append(ch)
+
+        if async_handlers:
+            LoggerGenerator._async_handlers[logger.name] = handlers
+            qh = _LazyQueueHandler(LoggerGenerator._get_queue())
+            qh.setLevel(level=log_level)
+            logger.addHandler(qh)
+        else:
+            for handler in handlers:
+                logger.addHandler(handler)
 
         return logger
 
 
+atexit.register(LoggerGenerator.stop_async_logging)
+
 try:  # create logs folder
     os.makedirs(LoggerGenerator.LOGS_FOLDER_PATH)
 except FileExistsError:
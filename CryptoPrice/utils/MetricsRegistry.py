@@ -0,0 +1,221 @@
+import bisect
+import contextlib
+import threading
+import time
+from typing import Dict, Tuple, Optional, Iterator
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class _Histogram:
+    """
+    Cumulative histogram of observed values, in the Prometheus fashion
+    """
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is the +Inf bucket
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> Iterator[Tuple[str, int]]:
+        cumulated = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulated += count
+            yield ('+Inf' if bound == float('inf') else repr(bound)), cumulated
+
+
+class MetricsRegistry:
+    """
+    This class collects counters and latency histograms about the retrievers and the databases. It is disabled by
+    default and costs a single attribute check per measure point in that case.
+
+    .. code-block:: python
+
+        MetricsRegistry.set_enabled(True)
+        ...
+        print(MetricsRegistry.to_prometheus())
+    """
+    DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 60.)
+
+    _enabled = False
+    _lock = threading.Lock()
+    _counters: Dict[Tuple[str, Tuple], float] = {}
+    _histograms: Dict[Tuple[str, Tuple], _Histogram] = {}
+
+    @staticmethod
+    def set_enabled(enabled: bool):
+        """
+        enable or disable the collection of the metrics
+
+        :param enabled: if the metrics should be collected
+        :type enabled: bool
+        :return: None
+        :rtype: None
+        """
+        MetricsRegistry._enabled = enabled
+
+    @staticmethod
+    def is_enabled() -> bool:
+        """
+        tell if the metrics are being collected
+
+        :return: True if the metrics are collected
+        :rtype: bool
+        """
+        return MetricsRegistry._enabled
+
+    @staticmethod
+    def reset():
+        """
+        delete all the collected values
+
+        :return: None
+        :rtype: None
+        """
+        with MetricsRegistry._lock:
+            MetricsRegistry._counters.clear()
+            MetricsRegistry._histograms.clear()
+
+    @staticmethod
+    def increment(name: str, value: float = 1, **labels: str):
+        """
+        increase a counter
+
+        :param name: name of the counter
+        :type name: str
+        :param value: value to add to the counter, default 1
+        :type value: float
+        :param labels: labels of the counter (ex: retriever='binance', timeframe='m1')
+        :type labels: str
+        :return: None
+        :rtype: None
+        """
+        if not MetricsRegistry._enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with MetricsRegistry._lock:
+            MetricsRegistry._counters[key] = MetricsRegistry._counters.get(key, 0) + value
+
+    @staticmethod
+    def observe(name: str, value: float, **labels: str):
+        """
+        add a value to a histogram
+
+        :param name: name of the histogram
+        :type name: str
+        :param value: value observed (ex: a duration in seconds)
+        :type value: float
+        :param labels: labels of the histogram (ex: retriever='binance', timeframe='m1')
+        :type labels: str
+        :return: None
+        :rtype: None
+        """
+        if not MetricsRegistry._enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with MetricsRegistry._lock:
+            try:
+                histogram = MetricsRegistry._histograms[key]
+            except KeyError:
+                histogram = MetricsRegistry._histograms[key] = _Histogram(MetricsRegistry.DEFAULT_BUCKETS)
+            histogram.observe(value)
+
+    @staticmethod
+    def timer(name: str, **labels: str):
+        """
+        context manager observing its execution duration in seconds in a histogram
+
+        :param name: name of the histogram
+        :type name: str
+        :param labels: labels of the histogram
+        :type labels: str
+        :return: the context manager
+        :rtype: ContextManager
+        """
+        if not MetricsRegistry._enabled:
+            return _NULL_CONTEXT
+        return MetricsRegistry._timer(name, labels)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _timer(name: str, labels: Dict[str, str]):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            MetricsRegistry.observe(name, time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def get_counter(name: str, **labels: str) -> float:
+        """
+        return the value of a counter, 0 if it was never increased
+
+        :param name: name of the counter
+        :type name: str
+        :param labels: labels of the counter
+        :type labels: str
+        :return: value of the counter
+        :rtype: float
+        """
+        return MetricsRegistry._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    @staticmethod
+    def to_dict() -> Dict:
+        """
+        export the collected metrics as a dictionary
+
+        :return: {'counters': {name: [{'labels':..., 'value':...}]},
+            'histograms': {name: [{'labels':..., 'count':..., 'sum':..., 'buckets': {bound: cumulated count}}]}}
+        :rtype: Dict
+        """
+        counters, histograms = {}, {}
+        with MetricsRegistry._lock:
+            for (name, labels), value in MetricsRegistry._counters.items():
+                counters.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+            for (name, labels), histogram in MetricsRegistry._histograms.items():
+                histograms.setdefault(name, []).append({'labels': dict(labels),
+                                                        'count': histogram.count,
+                                                        'sum': histogram.sum,
+                                                        'buckets': dict(histogram.cumulative_counts())})
+        return {'counters': counters, 'histograms': histograms}
+
+    @staticmethod
+    def to_prometheus(prefix: str = 'cryptoprice_') -> str:
+        """
+        export the collected metrics in the Prometheus text format
+
+        :param prefix: prefix added to the name of the metrics
+        :type prefix: str
+        :return: the metrics in the Prometheus text format
+        :rtype: str
+        """
+        def format_labels(labels: Tuple, extra: Optional[Tuple] = None) -> str:
+            labels = labels + (extra or ())
+            if not len(labels):
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+        lines = []
+        with MetricsRegistry._lock:
+            names = sorted({name for name, _ in MetricsRegistry._counters})
+            for name in names:
+                lines.append(f"# TYPE {prefix}{name} counter")
+                for (counter_name, labels), value in MetricsRegistry._counters.items():
+                    if counter_name == name:
+                        lines.append(f"{prefix}{name}{format_labels(labels)} {value}")
+            names = sorted({name for name, _ in MetricsRegistry._histograms})
+            for name in names:
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for (histogram_name, labels), histogram in MetricsRegistry._histograms.items():
+                    if histogram_name == name:
+                        for bound, count in histogram.cumulative_counts():
+                            lines.append(f"{prefix}{name}_bucket{format_labels(labels, (('le', bound),))} {count}")
+                        lines.append(f"{prefix}{name}_sum{format_labels(labels)} {histogram.sum}")
+                        lines.append(f"{prefix}{name}_count{format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,72 @@
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the rate of the API requests, it can be shared by several retrievers and threads.
+    Tokens are added at a constant rate, up to a maximum burst, and each request consumes one token.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Instantiate a rate limiter with a full bucket
+
+        :param rate: number of requests allowed per second
+        :type rate: float
+        :param burst: maximum number of requests allowed at once
+        :type burst: int
+        """
+        if rate <= 0:
+            raise ValueError(f"the rate must be positive, {rate} was received")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_time) * self.rate)
+        self._last_time = now
+
+    def acquire(self, tokens: float = 1., timeout: Optional[float] = None) -> bool:
+        """
+        Wait until enough tokens are available and consume them
+
+        :param tokens: number of tokens to consume
+        :type tokens: float
+        :param timeout: maximum time to wait in seconds, None to wait as long as needed. If the tokens can not be
+            available within the timeout, False is returned immediately
+        :type timeout: Optional[float]
+        :return: True if the tokens were consumed
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait_time = (tokens - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait_time > deadline:
+                return False
+            time.sleep(wait_time)
+
+    def try_acquire(self, tokens: float = 1.) -> bool:
+        """
+        Consume tokens if they are available, without waiting
+
+        :param tokens: number of tokens to consume
+        :type tokens: float
+        :return: True if the tokens were consumed
+        :rtype: bool
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesce the concurrent calls made with the same key: the first caller executes the function while the callers
+    arriving before it returns wait for its result (or its exception) instead of executing the function again.
+    Calls made after the result is returned execute the function again, nothing is cached.
+
+    .. code-block:: python
+
+        single_flight = SingleFlight()
+        klines = single_flight.do(('BTC', 'USDT', 1609459200), fetch_function)
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.n_calls = 0
+        self.n_executions = 0
+
+    @property
+    def n_coalesced(self) -> int:
+        """
+        number of calls which waited for the execution of another caller
+        """
+        return self.n_calls - self.n_executions
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'calls': self.n_calls, 'executions': self.n_executions,
+                    'coalesced': self.n_calls - self.n_executions, 'in_flight': len(self._in_flight)}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Execute the function, or wait for the execution already in flight for the same key, and return its result
+
+        :param key: identifier of the call, the calls with equal keys are coalesced
+        :type key: Hashable
+        :param func: function to execute, without arguments
+        :type func: Callable[[], Any]
+        :return: the result of the function
+        :rtype: Any
+        """
+        with self._lock:
+            self.n_calls += 1
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                self.n_executions += 1
+                future = self._in_flight[key] = Future()
+        if not is_leader:
+            return future.result()
+        try:
+            future.set_result(func())
+        except BaseException as err:
+            future.set_exception(err)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
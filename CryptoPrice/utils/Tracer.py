@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Any, Iterator
+
+
+@dataclass
+class Span:
+    """
+    A timed operation, with its attributes and its nested operations
+    """
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_time_ns: int
+    end_time_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    children: List[Span] = field(default_factory=list)
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> Optional[float]:
+        """
+        duration of the span in seconds, None if the span is not finished
+        """
+        if self.end_time_ns is not None:
+            return (self.end_time_ns - self.start_time_ns) / 1e9
+
+    def iter_spans(self) -> Iterator[Span]:
+        """
+        iterate over this span and all its descendants
+        """
+        yield self
+        for child in self.children:
+            yield from child.iter_spans()
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'start_time_ns': self.start_time_ns,
+            'end_time_ns': self.end_time_ns,
+            'duration_s': self.duration,
+            'attributes': self.attributes,
+            'children': [child.to_dict() for child in self.children]
+        }
+
+
+class _NullSpan:
+    """
+    Span returned when nothing is traced, all the operations are ignored
+    """
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+_NULL_CONTEXT = contextlib.nullcontext(_NullSpan())
+
+
+class Trace:
+    """
+    Spans recorded inside a Tracer.trace block
+    """
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.root_spans: List[Span] = []
+
+    def iter_spans(self) -> Iterator[Span]:
+        for span in self.root_spans:
+            yield from span.iter_spans()
+
+    def to_dict(self) -> Dict:
+        return {'trace_id': self.trace_id, 'spans': [span.to_dict() for span in self.root_spans]}
+
+    def to_json(self, **kwargs) -> str:
+        """
+        export the trace as nested spans in json format
+
+        :param kwargs: arguments passed to json.dumps
+        :return: the trace in json format
+        :rtype: str
+        """
+        return json.dumps(self.to_dict(), default=str, **kwargs)
+
+    def to_otlp(self, service_name: str = 'CryptoPrice') -> Dict:
+        """
+        export the trace in the OpenTelemetry OTLP/JSON format, it can be sent as is to the /v1/traces endpoint of
+        an OpenTelemetry collector
+
+        :param service_name: name of the service reported in the trace
+        :type service_name: str
+        :return: the trace in OTLP/JSON format
+        :rtype: Dict
+        """
+        spans = []
+        for span in self.iter_spans():
+            otlp_span = {
+                'traceId': span.trace_id,
+                'spanId': span.span_id,
+                'name': span.name,
+                'kind': 1,  # SPAN_KIND_INTERNAL
+                'startTimeUnixNano': str(span.start_time_ns),
+                'endTimeUnixNano': str(span.end_time_ns),
+                'attributes': [{'key': k, 'value': _to_otlp_value(v)} for k, v in span.attributes.items()]
+            }
+            if span.parent_id is not None:
+                otlp_span['parentSpanId'] = span.parent_id
+            spans.append(otlp_span)
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service_name}}]},
+                'scopeSpans': [{'scope': {'name': 'CryptoPrice'}, 'spans': spans}]
+            }]
+        }
+
+
+def _to_otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class Tracer:
+    """
+    This class records nested spans (timed operations with attributes) in the retrievers and the databases.
+    Nothing is recorded unless a trace is opened or a callback is registered:
+
+    .. code-block:: python
+
+        with Tracer.trace() as trace:
+            retriever.get_mean_price('LTC', 'XRP', timestamp)
+        print(trace.to_json(indent=2))
+    """
+    _callbacks: List[Callable[[Span], None]] = []
+    _current_trace: ContextVar[Optional[Trace]] = ContextVar('current_trace', default=None)
+    _current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def trace() -> Iterator[Trace]:
+        """
+        context manager recording all the spans created inside its block
+
+        :return: the trace recording the spans
+        :rtype: Trace
+        """
+        trace = Trace(os.urandom(16).hex())
+        trace_token = Tracer._current_trace.set(trace)
+        span_token = Tracer._current_span.set(None)
+        try:
+            yield trace
+        finally:
+            Tracer._current_span.reset(span_token)
+            Tracer._current_trace.reset(trace_token)
+
+    @staticmethod
+    def add_callback(callback: Callable[[Span], None]):
+        """
+        register a function called with each span when it ends. While a callback is registered, spans are recorded
+        even outside of a trace block
+
+        :param callback: function to call
+        :type callback: Callable[[Span], None]
+        :return: None
+        :rtype: None
+        """
+        Tracer._callbacks.append(callback)
+
+    @staticmethod
+    def remove_callback(callback: Callable[[Span], None]):
+        """
+        unregister a function previously registered with add_callback
+
+        :param callback: function to remove
+        :type callback: Callable[[Span], None]
+        :return: None
+        :rtype: None
+        """
+        Tracer._callbacks.remove(callback)
+
+    @staticmethod
+    def span(name: str, **attributes: Any):
+        """
+        context manager recording a span for its block, the span is nested in the current span if any
+
+        :param name: name of the span
+        :type name: str
+        :param attributes: attributes of the span
+        :type attributes: Any
+        :return: the context manager, yielding the span
+        :rtype: ContextManager[Span]
+        """
+        if Tracer._current_trace.get() is None and not Tracer._callbacks:
+            return _NULL_CONTEXT
+        return Tracer._span(name, attributes)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _span(name: str, attributes: Dict[str, Any]):
+        trace = Tracer._current_trace.get()
+        parent = Tracer._current_span.get()
+        if parent is not None:
+            trace_id = parent.trace_id
+        elif trace is not None:
+            trace_id = trace.trace_id
+        else:
+            trace_id = os.urandom(16).hex()
+        span = Span(name, trace_id, os.urandom(8).hex(), None if parent is None else parent.span_id,
+                    time.time_ns(), attributes=attributes)
+        if parent is not None:
+            parent.children.append(span)
+        elif trace is not None:
+            trace.root_spans.append(span)
+        token = Tracer._current_span.set(span)
+        try:
+            yield span
+        except Exception as err:
+            span.set_attribute('error', repr(err))
+            raise
+        finally:
+            span.end_time_ns = time.time_ns()
+            Tracer._current_span.reset(token)
+            for callback in Tracer._callbacks:
+                callback(span)
@@ -0,0 +1,150 @@
+import random
+import tracemalloc
+
+from benchmarks.common import BenchmarkResults, measure, remove_database
+from benchmarks.synthetic import SyntheticRetriever, generate_trading_pairs
+from CryptoPrice.common.prices import MetaPrice, ProvenanceMode
+from CryptoPrice.retrievers.MetaRetriever import MetaRetriever
+from CryptoPrice.retrievers.ValuationEngine import ValuationEngine
+
+START_TIME = 1609459200  # 2021-01-01
+END_TIME = 1640995200  # 2022-01-01
+
+
+def make_retriever(source: str, n_pairs: int) -> MetaRetriever:
+    """
+    Build the benchmark retriever
+
+    :param source: name of the synthetic exchange
+    :type source: str
+    :param n_pairs: number of trading pairs of the synthetic exchange
+    :type n_pairs: int
+    :return: the retriever
+    :rtype: MetaRetriever
+    """
+    return MetaRetriever([SyntheticRetriever(source, generate_trading_pairs(n_pairs, source=source))])
+
+
+def run(results: BenchmarkResults, n_pairs: int = 2000, n_lookups: int = 50, max_depths=(1, 2, 3),
+        n_ledger_rows: int = 500, n_snapshot_assets: int = 300):
+    """
+    Benchmark MetaRetriever.get_mean_price on a realistic pair graph, for several maximum depths, then the
+    valuation of a ledger row by row against the ValuationEngine, the valuation of many assets at the same time
+    asset by asset against get_price_matrix, and the memory retained by the valuations of the ledger for each
+    provenance mode
+
+    :param results: object collecting the results
+    :type results: BenchmarkResults
+    :param n_pairs: number of trading pairs of the synthetic exchange
+    :type n_pairs: int
+    :param n_lookups: number of lookups per repetition
+    :type n_lookups: int
+    :param max_depths: maximum depths to benchmark
+    :type max_depths: Iterable[int]
+    :param n_ledger_rows: number of rows of the ledger to value
+    :type n_ledger_rows: int
+    :param n_snapshot_assets: number of assets valued at the same time
+    :type n_snapshot_assets: int
+    :return: None
+    :rtype: None
+    """
+    retriever = make_retriever('benchmark_meta', n_pairs)
+    synthetic_retriever = retriever.retrievers['benchmark_meta']
+    pairs = synthetic_retriever.supported_pairs
+    rng = random.Random(0)
+    assets = sorted({p.asset for p in pairs})
+    lookups = [(asset, 'USDT', rng.randint(START_TIME, END_TIME)) for asset in rng.choices(assets, k=n_lookups)]
+
+    def lookup_all(max_depth):
+        for asset, ref_asset, timestamp in lookups:
+            retriever.get_mean_price(asset, ref_asset, timestamp, max_depth=max_depth)
+
+    for max_depth in max_depths:
+        synthetic_retriever.online_calls = 0
+        timings = measure(lambda: lookup_all(max_depth), repeat=1, setup=synthetic_retriever.db.drop_all_tables)
+        results.add(f"get_mean_price cold depth={max_depth}", timings, n_lookups,
+                    online_calls=synthetic_retriever.online_calls)
+
+        synthetic_retriever.online_calls = 0
+        timings = measure(lambda: lookup_all(max_depth), repeat=3)
+        results.add(f"get_mean_price warm depth={max_depth}", timings, n_lookups,
+                    online_calls=synthetic_retriever.online_calls // 3)
+
+    # a week of transactions on a few assets, with duplicated rows as in real ledgers
+    ledger_assets = rng.sample(assets, 20)
+    ledger = [(asset, 'USDT', rng.randint(START_TIME, START_TIME + 7 * 86400))
+              for asset in rng.choices(ledger_assets, k=n_ledger_rows)]
+    ledger += rng.choices(ledger, k=n_ledger_rows // 5)
+
+    def value_row_by_row():
+        for asset, ref_asset, timestamp in ledger:
+            retriever.get_mean_price(asset, ref_asset, timestamp)
+
+    synthetic_retriever.online_calls = 0
+    timings = measure(value_row_by_row, repeat=1, setup=synthetic_retriever.db.drop_all_tables)
+    results.add("ledger row by row cold", timings, len(ledger), online_calls=synthetic_retriever.online_calls)
+
+    engine = ValuationEngine(retriever)
+    synthetic_retriever.online_calls = 0
+    timings = measure(lambda: engine.value(ledger), repeat=1, setup=synthetic_retriever.db.drop_all_tables)
+    results.add("ledger valuation engine cold", timings, len(ledger), online_calls=synthetic_retriever.online_calls)
+
+    timings = measure(lambda: engine.value(ledger), repeat=3)
+    results.add("ledger valuation engine warm", timings, len(ledger))
+
+    # the prices computed by worker processes reading the database, the pool is started by the first valuation
+    process_engine = ValuationEngine(retriever, processes=4)
+    process_engine.value(ledger)
+    timings = measure(lambda: process_engine.value(ledger), repeat=3)
+    results.add("ledger valuation engine warm processes=4", timings, len(ledger))
+    process_engine.close()
+
+    # a daily precision is enough for a tax report, the engine then works on d1 klines
+    engine = ValuationEngine(retriever, tolerance=43200)
+    synthetic_retriever.online_calls = 0
+    timings = measure(lambda: engine.value(ledger), repeat=1, setup=synthetic_retriever.db.drop_all_tables)
+    results.add("ledger valuation engine cold tolerance=12h", timings, len(ledger),
+                online_calls=synthetic_retriever.online_calls)
+
+    # an end of day snapshot of a portfolio
+    snapshot_assets = rng.sample(assets, n_snapshot_assets)
+    snapshot_time = rng.randint(START_TIME, END_TIME)
+
+    def value_asset_by_asset():
+        for asset in snapshot_assets:
+            retriever.get_mean_price(asset, 'USDT', snapshot_time)
+
+    synthetic_retriever.online_calls = 0
+    timings = measure(value_asset_by_asset, repeat=1, setup=synthetic_retriever.db.drop_all_tables)
+    results.add("snapshot asset by asset cold", timings, n_snapshot_assets,
+                online_calls=synthetic_retriever.online_calls)
+
+    synthetic_retriever.online_calls = 0
+    timings = measure(lambda: retriever.get_price_matrix(snapshot_assets, 'USDT', snapshot_time), repeat=1,
+                      setup=synthetic_retriever.db.drop_all_tables)
+    results.add("snapshot price matrix cold", timings, n_snapshot_assets,
+                online_calls=synthetic_retriever.online_calls)
+
+    timings = measure(value_asset_by_asset, repeat=3)
+    results.add("snapshot asset by asset warm", timings, n_snapshot_assets)
+    timings = measure(lambda: retriever.get_price_matrix(snapshot_assets, 'USDT', snapshot_time), repeat=3)
+    results.add("snapshot price matrix warm", timings, n_snapshot_assets)
+
+    # memory kept by the results of a ledger valuation, the klines are already in the database
+    value_row_by_row()
+    for mode in ProvenanceMode:
+        MetaPrice.provenance_mode = mode
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        ledger_prices = [retriever.get_mean_price(asset, ref_asset, timestamp)
+                         for asset, ref_asset, timestamp in ledger]
+        retained = tracemalloc.get_traced_memory()[0] - start
+        tracemalloc.stop()
+        timings = measure(lambda: [retriever.get_mean_price(asset, ref_asset, timestamp)
+                                   for asset, ref_asset, timestamp in ledger], repeat=3)
+        results.add(f"ledger provenance={mode.value}", timings, len(ledger),
+                    retained_bytes_per_row=retained // len(ledger))
+        del ledger_prices
+    MetaPrice.provenance_mode = ProvenanceMode.full
+
+    remove_database(synthetic_retriever.db)
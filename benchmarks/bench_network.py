@@ -0,0 +1,59 @@
+import random
+
+from benchmarks.common import BenchmarkResults, measure, remove_database
+from benchmarks.mock_exchange import MockExchangeServer
+from CryptoPrice.retrievers.BinanceRetriever import BinanceRetriever
+from CryptoPrice.retrievers.KucoinRetriever import KucoinRetriever
+from CryptoPrice.utils.time import TIMEFRAME
+
+START_TIME = 1609459200  # 2021-01-01
+END_TIME = 1640995200  # 2022-01-01
+
+
+def run(results: BenchmarkResults, n_requests: int = 200, latency: float = 0., rate_limit_every: int = 50):
+    """
+    Benchmark the whole fetch pipeline of the Binance and Kucoin retrievers (HTTP, JSON decoding, parsing and
+    retries) against a local mock exchange
+
+    :param results: object collecting the results
+    :type results: BenchmarkResults
+    :param n_requests: number of klines requests per repetition
+    :type n_requests: int
+    :param latency: delay in seconds added by the mock exchange to each response
+    :type latency: float
+    :param rate_limit_every: every n-th Binance klines request is rejected with a rate limit error. Kucoin errors do
+        not advertise any delay, the retriever would wait for the next minute, so they are not injected
+    :type rate_limit_every: int
+    :return: None
+    :rtype: None
+    """
+    binance_server = MockExchangeServer(latency=latency, rate_limit_every=rate_limit_every, retry_after=0.01)
+    kucoin_server = MockExchangeServer(latency=latency)
+    binance_server.start_background()
+    kucoin_server.start_background()
+
+    # dedicated databases, the klines of the mock exchange must never go to the binance and kucoin databases
+    retrievers = [BinanceRetriever(api_url=binance_server.url, db_name='benchmark_network_binance'),
+                  KucoinRetriever(api_url=kucoin_server.url, db_name='benchmark_network_kucoin')]
+    for retriever, server in zip(retrievers, (binance_server, kucoin_server)):
+        rng = random.Random(0)
+        requests = []
+        for pair in rng.choices(retriever.supported_pairs, k=n_requests):
+            start_time = rng.randint(START_TIME, END_TIME)
+            requests.append((pair.asset, pair.ref_asset, start_time,
+                             start_time + retriever.max_klines_per_request * 60 - 1))
+
+        def fetch_all():
+            for asset, ref_asset, start_time, end_time in requests:
+                retriever.get_klines_online(asset, ref_asset, TIMEFRAME.m1, start_time, end_time)
+
+        server.stats['klines_served'] = server.stats['rate_limited'] = 0
+        timings = measure(fetch_all, repeat=3)
+        results.add(f"{retriever.name} get_klines_online full page", timings, n_requests,
+                    klines_per_s=int(server.stats['klines_served'] / sum(timings)),
+                    rate_limited=server.stats['rate_limited'])
+
+    binance_server.shutdown()
+    kucoin_server.shutdown()
+    for retriever in retrievers:
+        remove_database(retriever.db)
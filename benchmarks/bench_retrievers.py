@@ -0,0 +1,53 @@
+import random
+
+from benchmarks.common import BenchmarkResults, measure, remove_database
+from benchmarks.synthetic import SyntheticRetriever, generate_trading_pairs
+
+START_TIME = 1609459200  # 2021-01-01
+END_TIME = 1640995200  # 2022-01-01
+
+
+def run(results: BenchmarkResults, n_lookups: int = 2000, latency: float = 0.):
+    """
+    Benchmark KlineRetriever.get_closest_price on a cold database (every lookup goes online) and on a warm one
+
+    :param results: object collecting the results
+    :type results: BenchmarkResults
+    :param n_lookups: number of lookups per repetition
+    :type n_lookups: int
+    :param latency: simulated network latency in seconds
+    :type latency: float
+    :return: None
+    :rtype: None
+    """
+    pairs = generate_trading_pairs(50, source='benchmark_retriever')
+    rng = random.Random(0)
+    lookups = [(p.asset, p.ref_asset, rng.randint(START_TIME, END_TIME))
+               for p in rng.choices(pairs, k=n_lookups)]
+    sequential_lookups = [(pairs[0].asset, pairs[0].ref_asset, START_TIME + 97 * i) for i in range(n_lookups)]
+
+    retriever = SyntheticRetriever('benchmark_retriever', pairs, latency=latency)
+
+    def lookup_all(lookups_list):
+        for asset, ref_asset, timestamp in lookups_list:
+            retriever.get_closest_price(asset, ref_asset, timestamp)
+
+    for name, lookups_list in (('random', lookups), ('sequential', sequential_lookups)):
+        retriever.online_calls = 0
+        timings = measure(lambda: lookup_all(lookups_list), repeat=3, setup=retriever.db.drop_all_tables)
+        results.add(f"get_closest_price cold {name}", timings, n_lookups,
+                    online_calls=retriever.online_calls // 3)
+
+        retriever.online_calls = 0
+        timings = measure(lambda: lookup_all(lookups_list), repeat=3)
+        results.add(f"get_closest_price warm {name}", timings, n_lookups,
+                    online_calls=retriever.online_calls // 3)
+
+        retriever.online_calls = 0
+        retriever.db.enable_write_behind()
+        timings = measure(lambda: lookup_all(lookups_list), repeat=3, setup=retriever.db.drop_all_tables)
+        retriever.db.disable_write_behind()
+        results.add(f"get_closest_price cold {name} write-behind", timings, n_lookups,
+                    online_calls=retriever.online_calls // 3)
+
+    remove_database(retriever.db)
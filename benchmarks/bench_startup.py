@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+from benchmarks.common import BenchmarkResults, measure
+
+
+def run(results: BenchmarkResults, repeat: int = 5):
+    """
+    Benchmark the time needed to import the library in a fresh interpreter
+
+    :param results: object collecting the results
+    :type results: BenchmarkResults
+    :param repeat: number of imports to time
+    :type repeat: int
+    :return: None
+    :rtype: None
+    """
+    def run_python(code):
+        subprocess.run([sys.executable, '-c', code], check=True)
+
+    baseline = measure(lambda: run_python('pass'), repeat=repeat)
+    results.add("python startup", baseline)
+    timings = measure(lambda: run_python('import CryptoPrice'), repeat=repeat)
+    results.add("import CryptoPrice", timings)
@@ -0,0 +1,100 @@
+import os
+import random
+
+from benchmarks.common import BenchmarkResults, measure, remove_database
+from benchmarks.synthetic import generate_klines
+from CryptoPrice.storage.DataBase import SQLConditionEnum
+from CryptoPrice.storage.KlineCacheManager import KlineCacheManager
+from CryptoPrice.storage.KlineDataBase import KlineDataBase
+from CryptoPrice.storage.ShardedKlineDataBase import ShardedKlineDataBase, ShardingMode
+from CryptoPrice.storage.tables import KlineTable
+from CryptoPrice.utils.time import TIMEFRAME
+
+START_TIME = 1262304000  # 2010-01-01
+
+
+def run(results: BenchmarkResults, max_rows: int = 10 ** 6, n_queries: int = 1000):
+    """
+    Benchmark KlineDataBase.add_klines and KlineDataBase.get_closest_kline for tables of growing sizes, then the same
+    operations on the largest size with a database sharded by month, the removal of the oldest month, the search of
+    the gaps in the largest table and the eviction of half of it by a KlineCacheManager
+
+    :param results: object collecting the results
+    :type results: BenchmarkResults
+    :param max_rows: size of the largest table to benchmark, the sizes go from 10^3 to max_rows by powers of 10
+    :type max_rows: int
+    :param n_queries: number of get_closest_kline queries per repetition
+    :type n_queries: int
+    :return: None
+    :rtype: None
+    """
+    db = KlineDataBase('benchmark_storage')
+    rng = random.Random(0)
+    n_rows = 1000
+    while n_rows <= max_rows:
+        klines = generate_klines('BTC', 'USDT', TIMEFRAME.m1, START_TIME, START_TIME + (n_rows - 1) * 60)
+
+        timings = measure(lambda: db.add_klines(klines), repeat=3, setup=db.drop_all_tables)
+        results.add(f"add_klines {n_rows:.0e} rows", timings, n_rows)
+
+        end_time = START_TIME + n_rows * 60
+        timestamps = [rng.randint(START_TIME, end_time) for _ in range(n_queries)]
+
+        def query_all():
+            for timestamp in timestamps:
+                db.get_closest_kline('BTC', 'USDT', TIMEFRAME.m1, timestamp, window=310)
+
+        timings = measure(query_all, repeat=3)
+        results.add(f"get_closest_kline {n_rows:.0e} rows", timings, n_queries)
+        n_rows *= 10
+    n_rows //= 10
+
+    # the largest table again, split into month shards
+    sharded_db = ShardedKlineDataBase('benchmark_storage_sharded', ShardingMode.month)
+    timings = measure(lambda: sharded_db.add_klines(klines), repeat=3, setup=sharded_db.drop_all_tables)
+    results.add(f"add_klines {n_rows:.0e} rows sharded by month", timings, n_rows,
+                n_shards=len(sharded_db.get_shard_names()))
+
+    def query_all_sharded():
+        for timestamp in timestamps:
+            sharded_db.get_closest_kline('BTC', 'USDT', TIMEFRAME.m1, timestamp, window=310)
+
+    timings = measure(query_all_sharded, repeat=3)
+    results.add(f"get_closest_kline {n_rows:.0e} rows sharded by month", timings, n_queries)
+
+    # archiving the oldest month: a delete in a single file against dropping a shard
+    month_start, month_end = sharded_db.get_month_range(sharded_db.get_shard_names()[0])
+    table = KlineTable('BTC', 'USDT', TIMEFRAME.m1)
+    timings = measure(lambda: db.delete_conditions_rows(table, [(table.open_timestamp, SQLConditionEnum.greater_equal,
+                                                                 month_start),
+                                                                (table.open_timestamp, SQLConditionEnum.lower,
+                                                                 month_end)]), repeat=1)
+    results.add(f"delete oldest month {n_rows:.0e} rows", timings)
+    timings = measure(lambda: sharded_db.drop_shard(sharded_db.get_shard_names()[0]), repeat=1)
+    results.add(f"drop oldest month shard {n_rows:.0e} rows", timings)
+
+    # holes of 1 to 20 klines in the largest table, found by a single window query
+    for _ in range(100):
+        hole_start = rng.randrange(START_TIME, end_time, 60)
+        db.delete_klines('BTC', 'USDT', TIMEFRAME.m1, hole_start, hole_start + rng.randint(1, 20) * 60)
+    gaps = []
+    timings = measure(lambda: gaps.append(db.get_kline_gaps('BTC', 'USDT', TIMEFRAME.m1)), repeat=3)
+    results.add(f"get_kline_gaps {n_rows:.0e} rows", timings, n_rows, n_gaps=len(gaps[-1]))
+
+    for shard_name in sharded_db.get_shard_names():
+        sharded_db.drop_shard(shard_name)
+    remove_database(sharded_db)
+    remove_database(db)
+
+    # a budget of half the largest table, the blocks are evicted in least recently used order
+    cache_db = KlineDataBase('benchmark_storage_cache')
+    cache_manager = KlineCacheManager(cache_db)
+    cache_db.add_klines(klines)
+    file_size = os.path.getsize(cache_db.save_path)
+    cache_manager.max_size = cache_db.get_size() // 2
+    n_evicted = {}
+    timings = measure(lambda: n_evicted.update(cache_manager.enforce()), repeat=1)
+    results.add(f"evict to half budget {n_rows:.0e} rows", timings, max(n_evicted['size'], 1),
+                klines_evicted=n_evicted['size'],
+                file_size_ratio=round(os.path.getsize(cache_db.save_path) / file_size, 2))
+    remove_database(cache_db)
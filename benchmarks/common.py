@@ -0,0 +1,79 @@
+import os
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from CryptoPrice.storage.DataBase import DataBase
+
+
+class BenchmarkResults:
+    """
+    Collect the timings of the benchmarks and display them
+    """
+
+    def __init__(self):
+        self.results: Dict[str, Dict] = {}
+
+    def add(self, name: str, timings: List[float], unit_count: int = 1, **extra):
+        """
+        Save the timings of a benchmark
+
+        :param name: name of the benchmark
+        :type name: str
+        :param timings: durations in seconds of each repetition
+        :type timings: List[float]
+        :param unit_count: number of operations done in each repetition
+        :type unit_count: int
+        :param extra: additional values to report
+        :return: None
+        :rtype: None
+        """
+        median = statistics.median(timings)
+        self.results[name] = {
+            'median_s': median,
+            'min_s': min(timings),
+            'per_op_us': median / unit_count * 1e6,
+            'ops_per_s': unit_count / median if median else float('inf'),
+            **extra
+        }
+        print(f"{name:<55} {median:>10.4f} s  {median / unit_count * 1e6:>12.1f} us/op"
+              + ''.join(f"  {k}={v}" for k, v in extra.items()), flush=True)
+
+
+def measure(func: Callable, repeat: int = 3, setup: Callable = None) -> List[float]:
+    """
+    Time several executions of a function
+
+    :param func: function to time
+    :type func: Callable
+    :param repeat: number of executions
+    :type repeat: int
+    :param setup: function called before each execution, not timed
+    :type setup: Callable
+    :return: the durations in seconds
+    :rtype: List[float]
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def remove_database(db: DataBase):
+    """
+    Close a benchmark database and delete its file
+
+    :param db: database to delete
+    :type db: DataBase
+    :return: None
+    :rtype: None
+    """
+    db.db_conn.close()
+    try:
+        os.remove(db.save_path)
+    except FileNotFoundError:
+        pass
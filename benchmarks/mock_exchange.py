@@ -0,0 +1,234 @@
+"""
+Local HTTP server speaking the subset of the Binance and Kucoin REST APIs used by the retrievers, serving synthetic
+data. It allows to load test the whole network path of the retrievers without internet access:
+
+    python -m benchmarks.mock_exchange --port 8080 --latency 0.05 --rate-limit-every 100
+
+    retriever = BinanceRetriever(api_url='http://localhost:8080')
+    retriever = KucoinRetriever(api_url='http://localhost:8080')
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+from benchmarks.synthetic import generate_klines, generate_trading_pairs, synthetic_price
+from CryptoPrice.retrievers.BinanceRetriever import BinanceRetriever
+from CryptoPrice.retrievers.KucoinRetriever import KucoinRetriever
+
+
+class MockExchangeServer(ThreadingHTTPServer):
+    """
+    HTTP server mocking the Binance and Kucoin public endpoints: exchange info / symbol list, klines and tickers
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = 'localhost', port: int = 0, n_pairs: int = 2000, latency: float = 0.,
+                 rate_limit_every: int = 0, rate_limit_probability: float = 0., retry_after: float = 1.,
+                 seed: int = 42):
+        """
+        Instantiate the server, it is started with serve_forever or start_background
+
+        :param host: host to listen on
+        :type host: str
+        :param port: port to listen on, 0 to pick a free one
+        :type port: int
+        :param n_pairs: number of trading pairs listed
+        :type n_pairs: int
+        :param latency: delay in seconds added to each response
+        :type latency: float
+        :param rate_limit_every: if not 0, every n-th klines request is rejected with a rate limit error
+        :type rate_limit_every: int
+        :param rate_limit_probability: probability for a klines request to be rejected with a rate limit error
+        :type rate_limit_probability: float
+        :param retry_after: delay in seconds advertised in the rate limit errors
+        :type retry_after: float
+        :param seed: seed of the random generator
+        :type seed: int
+        """
+        super().__init__((host, port), MockExchangeHandler)
+        self.trading_pairs = generate_trading_pairs(n_pairs, source='mock')
+        self.binance_symbols = {p.asset + p.ref_asset: p for p in self.trading_pairs}
+        self.kucoin_symbols = {f"{p.asset}-{p.ref_asset}": p for p in self.trading_pairs}
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'klines_requests': 0, 'rate_limited': 0, 'klines_served': 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start_background(self) -> threading.Thread:
+        """
+        Start the server in a daemon thread
+
+        :return: the thread serving the requests
+        :rtype: threading.Thread
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def is_rate_limited(self) -> bool:
+        """
+        Count a new klines request and tell if it should be rejected
+
+        :return: True if the request has to be rejected with a rate limit error
+        :rtype: bool
+        """
+        with self.lock:
+            self.stats['klines_requests'] += 1
+            limited = (self.rate_limit_every and self.stats['klines_requests'] % self.rate_limit_every == 0) \
+                or self.random.random() < self.rate_limit_probability
+            if limited:
+                self.stats['rate_limited'] += 1
+            return bool(limited)
+
+
+class MockExchangeHandler(BaseHTTPRequestHandler):
+    server: MockExchangeServer
+    protocol_version = 'HTTP/1.1'
+
+    binance_intervals = {v: k for k, v in BinanceRetriever.kline_translation.items()}
+    kucoin_intervals = {v: k for k, v in KucoinRetriever.kline_translation.items()}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.stats['requests'] += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        parsed_url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(parsed_url.query).items()}
+        routes = {
+            '/api/v3/ping': self.binance_ping,
+            '/api/v3/time': self.binance_time,
+            '/api/v3/exchangeInfo': self.binance_exchange_info,
+            '/api/v3/klines': self.binance_klines,
+            '/api/v3/ticker/price': self.binance_tickers,
+            '/api/v1/symbols': self.kucoin_symbols,
+            '/api/v2/symbols': self.kucoin_symbols,
+            '/api/v1/market/candles': self.kucoin_candles,
+            '/api/v1/market/allTickers': self.kucoin_tickers,
+        }
+        try:
+            handler = routes[parsed_url.path]
+        except KeyError:
+            self.send_json(404, {'code': 404, 'msg': f"unknown endpoint {parsed_url.path}"})
+            return
+        status, content, headers = handler(params)
+        self.send_json(status, content, headers)
+
+    def send_json(self, status: int, content, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def binance_ping(self, params: Dict) -> Tuple[int, Dict, Dict]:
+        return 200, {}, {}
+
+    def binance_time(self, params: Dict) -> Tuple[int, Dict, Dict]:
+        return 200, {'serverTime': int(time.time() * 1000)}, {}
+
+    def binance_exchange_info(self, params: Dict) -> Tuple[int, Dict, Dict]:
+        symbols = [{'symbol': s, 'status': 'TRADING', 'baseAsset': p.asset, 'quoteAsset': p.ref_asset}
+                   for s, p in self.server.binance_symbols.items()]
+        return 200, {'timezone': 'UTC', 'serverTime': int(time.time() * 1000), 'symbols': symbols}, {}
+
+    def binance_klines(self, params: Dict) -> Tuple[int, object, Dict]:
+        if self.server.is_rate_limited():
+            return 429, {'code': -1003, 'msg': 'Too many requests.'}, {'Retry-After': str(self.server.retry_after)}
+        try:
+            pair = self.server.binance_symbols[params['symbol']]
+        except KeyError:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}, {}
+        timeframe = self.binance_intervals[params['interval']]
+        limit = min(int(params.get('limit', 500)), BinanceRetriever.max_klines_per_request)
+        end_time = int(params.get('endTime', time.time() * 1000)) // 1000
+        start_time = int(params.get('startTime', end_time * 1000 - limit * timeframe.value * 60000)) // 1000
+        klines = generate_klines(pair.asset, pair.ref_asset, timeframe, start_time, end_time, limit=limit)
+        self.count_klines(len(klines))
+        step = timeframe.value * 60000
+        return 200, [[k.open_timestamp * 1000, f"{k.open:.8f}", f"{k.high:.8f}", f"{k.low:.8f}", f"{k.close:.8f}",
+                      "100.0", k.open_timestamp * 1000 + step - 1, "1000.0", 10, "50.0", "500.0", "0"]
+                     for k in klines], {}
+
+    def binance_tickers(self, params: Dict) -> Tuple[int, object, Dict]:
+        timestamp = int(time.time())
+        return 200, [{'symbol': s, 'price': f"{synthetic_price(p.asset, p.ref_asset, timestamp):.8f}"}
+                     for s, p in self.server.binance_symbols.items()], {}
+
+    def kucoin_symbols(self, params: Dict) -> Tuple[int, Dict, Dict]:
+        symbols = [{'symbol': s, 'name': s, 'baseCurrency': p.asset, 'quoteCurrency': p.ref_asset,
+                    'enableTrading': True}
+                   for s, p in self.server.kucoin_symbols.items()]
+        return 200, {'code': '200000', 'data': symbols}, {}
+
+    def kucoin_candles(self, params: Dict) -> Tuple[int, Dict, Dict]:
+        if self.server.is_rate_limited():
+            return 403, {'code': '403000', 'msg': 'Too Many Requests'}, {}
+        try:
+            pair = self.server.kucoin_symbols[params['symbol']]
+        except KeyError:
+            return 200, {'code': '400100', 'msg': 'This pair is not provided at present'}, {}
+        timeframe = self.kucoin_intervals[params['type']]
+        end_time = int(params.get('endAt', 0)) or int(time.time())
+        start_time = int(params.get('startAt', 0)) or end_time - 1500 * timeframe.value * 60
+        klines = generate_klines(pair.asset, pair.ref_asset, timeframe, start_time, end_time)
+        klines = klines[-KucoinRetriever.max_klines_per_request:][::-1]  # the most recent first
+        self.count_klines(len(klines))
+        return 200, {'code': '200000',
+                     'data': [[str(k.open_timestamp), f"{k.open:.8f}", f"{k.close:.8f}", f"{k.high:.8f}",
+                               f"{k.low:.8f}", "100.0", "1000.0"] for k in klines]}, {}
+
+    def kucoin_tickers(self, params: Dict) -> Tuple[int, Dict, Dict]:
+        timestamp = int(time.time())
+        tickers = [{'symbol': s, 'symbolName': s, 'last': f"{synthetic_price(p.asset, p.ref_asset, timestamp):.8f}"}
+                   for s, p in self.server.kucoin_symbols.items()]
+        return 200, {'code': '200000', 'data': {'time': timestamp * 1000, 'ticker': tickers}}, {}
+
+    def count_klines(self, n_klines: int):
+        with self.server.lock:
+            self.server.stats['klines_served'] += n_klines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Binance and Kucoin exchange serving synthetic data")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--n-pairs', type=int, default=2000, help="number of trading pairs listed")
+    parser.add_argument('--latency', type=float, default=0., help="delay in seconds added to each response")
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help="reject every n-th klines request with a rate limit error")
+    parser.add_argument('--rate-limit-probability', type=float, default=0.,
+                        help="probability to reject a klines request with a rate limit error")
+    parser.add_argument('--retry-after', type=float, default=1., help="delay advertised in rate limit errors")
+    args = parser.parse_args()
+    server = MockExchangeServer(args.host, args.port, args.n_pairs, args.latency, args.rate_limit_every,
+                                args.rate_limit_probability, args.retry_after)
+    print(f"mock exchange listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Run the benchmarks of the library, without any network access:
+
+    python -m benchmarks.run
+    python -m benchmarks.run --suites storage --max-rows 10000000 --json results.json
+
+The network suite starts a local mock exchange (see benchmarks.mock_exchange) and is not run by default.
+"""
+import argparse
+import json
+
+from benchmarks import bench_meta, bench_network, bench_retrievers, bench_startup, bench_storage
+from benchmarks.common import BenchmarkResults
+
+SUITES = ['startup', 'storage', 'retrievers', 'meta', 'network']
+DEFAULT_SUITES = ['startup', 'storage', 'retrievers', 'meta']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CryptoPrice benchmarks")
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=DEFAULT_SUITES, help="suites to run")
+    parser.add_argument('--max-rows', type=float, default=1e6, help="size of the largest kline table to benchmark")
+    parser.add_argument('--latency', type=float, default=0., help="simulated network latency in seconds")
+    parser.add_argument('--json', help="file to save the results in")
+    args = parser.parse_args()
+
+    results = BenchmarkResults()
+    if 'startup' in args.suites:
+        bench_startup.run(results)
+    if 'storage' in args.suites:
+        bench_storage.run(results, max_rows=int(args.max_rows))
+    if 'retrievers' in args.suites:
+        bench_retrievers.run(results, latency=args.latency)
+    if 'meta' in args.suites:
+        bench_meta.run(results)
+    if 'network' in args.suites:
+        bench_network.run(results, latency=args.latency)
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results.results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import math
+import random
+import time
+import zlib
+from typing import List, Optional
+
+from CryptoPrice.common.prices import Kline, Price
+from CryptoPrice.common.trade import TradingPair
+from CryptoPrice.retrievers.KlineRetriever import KlineRetriever
+from CryptoPrice.utils.time import TIMEFRAME
+
+QUOTE_ASSETS = ['USDT', 'BTC', 'ETH', 'BNB', 'BUSD']
+
+
+def generate_trading_pairs(n_pairs: int = 2000, source: str = 'synthetic', seed: int = 42) -> List[TradingPair]:
+    """
+    Generate a deterministic trading pair graph, similar in shape to the one of a large exchange: a few quote assets
+    and a lot of base assets, each listed against one or several quote assets
+
+    :param n_pairs: number of trading pairs to generate
+    :type n_pairs: int
+    :param source: name of the exchange
+    :type source: str
+    :param seed: seed of the random generator
+    :type seed: int
+    :return: list of trading pairs
+    :rtype: List[TradingPair]
+    """
+    rng = random.Random(seed)
+    pairs = []
+    for i, asset in enumerate(QUOTE_ASSETS[1:]):  # quote assets are linked together
+        for ref_asset in QUOTE_ASSETS[:i + 1]:
+            pairs.append(TradingPair(asset + ref_asset, asset, ref_asset, source=source))
+    asset_index = 0
+    while len(pairs) < n_pairs:
+        asset = f"A{asset_index:04d}"
+        asset_index += 1
+        for ref_asset in rng.sample(QUOTE_ASSETS, rng.randint(1, 4)):
+            pairs.append(TradingPair(asset + ref_asset, asset, ref_asset, source=source))
+    return pairs[:n_pairs]
+
+
+def synthetic_price(asset: str, ref_asset: str, timestamp: int) -> float:
+    """
+    Deterministic price of a trading pair at a given time
+
+    :param asset: asset of the trading pair
+    :type asset: str
+    :param ref_asset: reference asset of the trading pair
+    :type ref_asset: str
+    :param timestamp: time in seconds
+    :type timestamp: int
+    :return: price of the asset in ref_asset
+    :rtype: float
+    """
+    pair_hash = zlib.crc32(f"{asset}{ref_asset}".encode())
+    base_price = 0.01 + (pair_hash % 100000) / 100
+    return base_price * (1 + 0.05 * math.sin(timestamp / 86400 + pair_hash % 628 / 100))
+
+
+def generate_klines(asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int, end_time: int,
+                    source: str = 'synthetic', limit: Optional[int] = None) -> List[Kline]:
+    """
+    Generate the klines of a trading pair with an open time in [start_time, end_time]
+
+    :param asset: asset of the trading pair
+    :type asset: str
+    :param ref_asset: reference asset of the trading pair
+    :type ref_asset: str
+    :param timeframe: timeframe of the klines
+    :type timeframe: TIMEFRAME
+    :param start_time: minimum open time
+    :type start_time: int
+    :param end_time: maximum open time
+    :type end_time: int
+    :param source: name of the exchange
+    :type source: str
+    :param limit: maximum number of klines to generate
+    :type limit: Optional[int]
+    :return: list of klines
+    :rtype: List[Kline]
+    """
+    step = timeframe.value * 60
+    open_timestamp = start_time + (-start_time) % step
+    klines = []
+    while open_timestamp <= end_time and (limit is None or len(klines) < limit):
+        open_price = synthetic_price(asset, ref_asset, open_timestamp)
+        close_price = synthetic_price(asset, ref_asset, open_timestamp + step)
+        klines.append(Kline(open_timestamp, open_price, max(open_price, close_price) * 1.001,
+                            min(open_price, close_price) * 0.999, close_price, asset, ref_asset, timeframe,
+                            source=source))
+        open_timestamp += step
+    return klines
+
+
+class SyntheticRetriever(KlineRetriever):
+    """
+    Offline retriever serving deterministic klines, with an optional latency to simulate the network
+    """
+
+    max_klines_per_request = 1000
+
+    def __init__(self, name: str = 'benchmark_synthetic', trading_pairs: Optional[List[TradingPair]] = None,
+                 kline_timeframe: TIMEFRAME = TIMEFRAME.m1, closest_window: int = 310, latency: float = 0.):
+        self.trading_pairs = trading_pairs if trading_pairs is not None else generate_trading_pairs(source=name)
+        self.latency = latency
+        self.online_calls = 0
+        super().__init__(name, kline_timeframe, closest_window)
+
+    def get_supported_pairs(self) -> List[TradingPair]:
+        return self.trading_pairs
+
+    def _get_klines_online(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int,
+                           end_time: int) -> List[Kline]:
+        self.online_calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return generate_klines(asset, ref_asset, timeframe, start_time, end_time, source=self.name,
+                               limit=self.max_klines_per_request)
+
+    def _get_latest_prices_online(self) -> List[Price]:
+        self.online_calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        timestamp = int(time.time())
+        return [Price(synthetic_price(p.asset, p.ref_asset, timestamp), p.asset, p.ref_asset, timestamp, self.name)
+                for p in self.trading_pairs]
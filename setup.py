@@ -17,7 +17,8 @@ setup(
               'CryptoPrice.retrievers',
               'CryptoPrice.storage',
               'CryptoPrice.utils',
-              'CryptoPrice.common'],
+              'CryptoPrice.common',
+              'CryptoPrice.server'],
     url='https://github.com/EtWnn/CryptoPrice',
     author='EtWnn',
     author_email='',
@@ -29,6 +30,9 @@ setup(
                       'appdirs',
                       'python-binance',
                       'kucoin-python'],
+    entry_points={
+        'console_scripts': ['cryptoprice-backfill=CryptoPrice.backfill:main'],
+    },
     keywords='eth bsc price ohlc candle history API Binance Kucoin',
     classifiers=[
         'Intended Audience :: Developers',
@@ -0,0 +1,54 @@
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+from CryptoPrice.storage.BinanceDumpLoader import BinanceDumpLoader
+from CryptoPrice.storage.ShardedKlineDataBase import ShardedKlineDataBase, ShardingMode
+from CryptoPrice.utils.time import TIMEFRAME
+from tests.utils import DataDirTestCase, FakeKlineRetriever
+
+JANUARY = 1609459200  # 2021-01-01
+FEBRUARY = 1612137600  # 2021-02-01
+
+
+def write_dump(file_path: Path, start_time: int, n_klines: int):
+    rows = ''.join(f"{(start_time + i * 60) * 1000},2.5,2.5,2.5,2.5,10,0,0,0,0,0,0\n" for i in range(n_klines))
+    with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(file_path.with_suffix('.csv').name, rows)
+
+
+class TestBinanceDumpLoader(DataDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        dump_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dump_dir.cleanup)
+        self.dump_dir = Path(dump_dir.name)
+        write_dump(self.dump_dir / 'BTCUSDT-1m-2021-01-31.zip', JANUARY + 30 * 86400, 1440)
+        write_dump(self.dump_dir / 'BTCUSDT-1m-2021-02-01.zip', FEBRUARY, 1440)
+        self.exchange = FakeKlineRetriever('fake', {'BTC': 30000., 'USDT': 1.}, [('BTC', 'USDT')])
+        self.exchange.db.close()
+        self.exchange.db = ShardedKlineDataBase(self.exchange.name, ShardingMode.month)
+
+    def tearDown(self):
+        self.exchange.db.close()
+
+    def test_load_in_sharded_database(self):
+        loader = BinanceDumpLoader(self.exchange.supported_pairs, db=self.exchange.db)
+        results = loader.load_directory(self.dump_dir, max_workers=1)
+
+        self.assertEqual(sum(results.values()), 2880)
+        self.assertEqual(self.exchange.db.get_shard_names(), ['2021_01', '2021_02'])
+        self.assertEqual(self.exchange.db.get_covered_ranges('BTC', 'USDT', TIMEFRAME.m1),
+                         [(JANUARY + 30 * 86400, FEBRUARY + 86400)])
+        klines = self.exchange.db.get_klines('BTC', 'USDT', TIMEFRAME.m1, FEBRUARY - 3600, FEBRUARY + 3600)
+        self.assertEqual(len(klines), 120)
+        # the retriever finds the loaded klines in its shards and does not call the API
+        price = self.exchange.get_closest_price('BTC', 'USDT', FEBRUARY + 3600)
+        self.assertAlmostEqual(price.value, 2.5)
+        self.assertEqual(self.exchange.online_calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from CryptoPrice.common.prices import Kline
+from CryptoPrice.storage.KlineCacheManager import KlineCacheManager
+from CryptoPrice.storage.KlineDataBase import KlineDataBase
+from CryptoPrice.utils.time import TIMEFRAME
+
+START_TIME = 1609440000  # 2020-12-31 18:40, the start of a block of 1000 m1 klines
+
+
+class TestKlineCacheManager(unittest.TestCase):
+    """
+    A database of 10 blocks of 1000 klines, the access times of the blocks following their order
+    """
+
+    def setUp(self):
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        patcher = mock.patch('CryptoPrice.storage.DataBase.get_data_path', return_value=Path(data_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db = KlineDataBase("test_kline_cache_manager")
+        self.cache_manager = KlineCacheManager(self.db, block_klines=1000)
+        self.block_duration = self.cache_manager.get_block_duration(TIMEFRAME.m1)
+        klines = [Kline(START_TIME + 60 * i, 1., 1., 1., 1., 'BTC', 'USDT', TIMEFRAME.m1, self.db.source)
+                  for i in range(10000)]
+        self.db.add_klines(klines)
+        for i in range(10):  # the first blocks are the least recently used
+            self.cache_manager._accesses[('BTC', 'USDT', TIMEFRAME.m1, START_TIME + i * self.block_duration)] = i
+        self.cache_manager.save_accesses()
+
+    def tearDown(self):
+        self.db.close()
+
+    def get_blocks(self, asset='BTC', ref_asset='USDT'):
+        return self.db.get_kline_blocks(asset, ref_asset, TIMEFRAME.m1, self.block_duration)
+
+    def test_evict_to_half_budget(self):
+        self.cache_manager.max_size = self.db.get_size() // 2
+        n_deleted = self.cache_manager.evict_to_budget()
+
+        # about half of the blocks are kept: the eviction stops once the database fits in its budget
+        self.assertLessEqual(self.db.get_size(), self.cache_manager.max_size)
+        self.assertIn(len(self.get_blocks()), (4, 5))
+        self.assertEqual(n_deleted, 10000 - 1000 * len(self.get_blocks()))
+        # the least recently used blocks are the evicted ones
+        self.assertEqual(self.get_blocks()[-1], START_TIME + 9 * self.block_duration)
+
+    def test_within_budget(self):
+        self.cache_manager.max_size = self.db.get_size()
+        self.assertEqual(self.cache_manager.evict_to_budget(), 0)
+        self.assertEqual(len(self.get_blocks()), 10)
+
+    def test_asset_with_underscore(self):
+        klines = [Kline(START_TIME + 60 * i, 1., 1., 1., 1., 'BTC_3L', 'USDT', TIMEFRAME.m1, self.db.source)
+                  for i in range(1000)]
+        self.db.add_klines(klines)
+        self.cache_manager._accesses[('BTC_3L', 'USDT', TIMEFRAME.m1, START_TIME)] = -1  # least recently used
+        self.cache_manager.save_accesses()
+        self.cache_manager.max_size = self.db.get_size() - 1
+        n_deleted = self.cache_manager.evict_to_budget()
+
+        # only the block of BTC_3L is evicted
+        self.assertEqual(n_deleted, 1000)
+        self.assertEqual(self.get_blocks('BTC_3L'), [])
+        self.assertEqual(len(self.get_blocks()), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+from CryptoPrice.common.prices import Kline
+from CryptoPrice.retrievers.KlineGapScanner import KlineGapScanner
+from CryptoPrice.utils.time import TIMEFRAME
+from tests.utils import DataDirTestCase, FakeKlineRetriever
+
+START_TIME = 1609459200  # 2021-01-01
+
+
+class TestSubtractRanges(unittest.TestCase):
+
+    def test_no_overlap(self):
+        self.assertEqual(KlineGapScanner._subtract_ranges([(10, 20)], [(30, 40)]), [(10, 20)])
+
+    def test_touching_ranges(self):
+        self.assertEqual(KlineGapScanner._subtract_ranges([(10, 20)], [(0, 10), (20, 30)]), [(10, 20)])
+
+    def test_straddling_both_ends(self):
+        self.assertEqual(KlineGapScanner._subtract_ranges([(10, 20)], [(5, 25)]), [])
+
+    def test_inside(self):
+        self.assertEqual(KlineGapScanner._subtract_ranges([(10, 20)], [(12, 14), (16, 18)]),
+                         [(10, 12), (14, 16), (18, 20)])
+
+    def test_partial_overlaps(self):
+        self.assertEqual(KlineGapScanner._subtract_ranges([(10, 20)], [(5, 12), (18, 25)]), [(12, 18)])
+
+    def test_shared_by_several_ranges(self):
+        self.assertEqual(KlineGapScanner._subtract_ranges([(0, 10), (20, 30), (40, 50)], [(5, 25)]),
+                         [(0, 5), (25, 30), (40, 50)])
+
+
+class TestKlineGapScanner(DataDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.exchange = FakeKlineRetriever('fake', {'BTC': 30000., 'USDT': 1.}, [('BTC', 'USDT')])
+        self.scanner = KlineGapScanner(self.exchange)
+        self.page_duration = self.exchange.max_klines_per_request * 60
+
+    def tearDown(self):
+        self.exchange.db.close()
+
+    def add_klines(self, start_time: int, end_time: int):
+        self.exchange.db.add_klines([Kline(t, 1., 1., 1., 1., 'BTC', 'USDT', TIMEFRAME.m1, 'fake')
+                                     for t in range(start_time, end_time, 60)])
+
+    def test_plan_splits_at_page_boundary(self):
+        gaps = [('fake', 'BTC', 'USDT', TIMEFRAME.m1, START_TIME, START_TIME + 600),
+                ('fake', 'BTC', 'USDT', TIMEFRAME.m1, START_TIME + 1200, START_TIME + self.page_duration + 600)]
+        requests = self.scanner.plan_repairs(gaps)
+
+        # the first page holds the first gap and the beginning of the second one, the rest goes in a second request
+        page_end = START_TIME + self.page_duration
+        self.assertEqual(requests, [
+            ('fake', 'BTC', 'USDT', TIMEFRAME.m1, START_TIME, page_end,
+             [(START_TIME, START_TIME + 600), (START_TIME + 1200, page_end)]),
+            ('fake', 'BTC', 'USDT', TIMEFRAME.m1, page_end, page_end + 600, [(page_end, page_end + 600)])])
+
+    def test_scan_and_repair(self):
+        self.add_klines(START_TIME, START_TIME + 3600)
+        self.add_klines(START_TIME + 7200, START_TIME + 10800)
+        self.add_klines(START_TIME + 14400, START_TIME + 18000)
+        self.exchange.db.add_covered_range('BTC', 'USDT', TIMEFRAME.m1, START_TIME + 10800, START_TIME + 12600)
+
+        # the covered part of the second gap is confirmed empty, only its end is missing
+        self.assertEqual(self.scanner.scan(), [
+            ('fake', 'BTC', 'USDT', TIMEFRAME.m1, START_TIME + 3600, START_TIME + 7200),
+            ('fake', 'BTC', 'USDT', TIMEFRAME.m1, START_TIME + 12600, START_TIME + 14400)])
+        report = self.scanner.run()
+
+        self.assertEqual((report.n_gaps, report.n_missing_klines, report.n_requests), (2, 90, 1))
+        self.assertEqual((report.n_repaired_klines, report.n_empty_klines, report.n_failed_requests), (90, 0, 0))
+        self.assertEqual(self.exchange.online_calls, 1)
+        self.assertEqual(self.scanner.scan(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from CryptoPrice.retrievers.MetaRetriever import MetaRetriever
+from tests.utils import DataDirTestCase, FakeKlineRetriever
+
+TIMESTAMP = 1609462800  # 2021-01-01 01:00
+
+
+class TestPriceMatrix(DataDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        asset_prices = {'USDT': 1., 'BTC': 30000., 'ETH': 1000., 'ADA': 0.3, 'DOT': 10., 'XRP': 0.5}
+        self.exchanges = [FakeKlineRetriever('fake_a', asset_prices, [('BTC', 'USDT'), ('ETH', 'USDT'),
+                                                                      ('ETH', 'BTC'), ('ADA', 'BTC'),
+                                                                      ('ADA', 'ETH'), ('DOT', 'BTC')]),
+                          FakeKlineRetriever('fake_b', asset_prices, [('BTC', 'USDT'), ('DOT', 'ETH'),
+                                                                      ('XRP', 'BTC'), ('XRP', 'ETH')])]
+        self.meta_retriever = MetaRetriever(self.exchanges)
+        self.assets = ['BTC', 'ETH', 'ADA', 'DOT', 'XRP', 'LUNA']
+
+    def tearDown(self):
+        for exchange in self.exchanges:
+            exchange.db.close()
+
+    def test_same_as_get_mean_price(self):
+        matrix = self.meta_retriever.get_price_matrix(self.assets, 'USDT', TIMESTAMP)
+
+        self.assertEqual(list(matrix), self.assets)
+        self.assertIsNone(matrix['LUNA'])
+        for asset in self.assets:
+            mean_price = self.meta_retriever.get_mean_price(asset, 'USDT', TIMESTAMP)
+            if mean_price is None:
+                self.assertIsNone(matrix[asset])
+                continue
+            self.assertAlmostEqual(matrix[asset].value, mean_price.value)
+            self.assertEqual(set(matrix[asset].source), set(mean_price.source))
+            self.assertEqual(len(matrix[asset].prices), len(mean_price.prices))
+
+    def test_pairs_looked_up_once(self):
+        matrix = self.meta_retriever.get_price_matrix(self.assets, 'USDT', TIMESTAMP)
+
+        self.assertAlmostEqual(matrix['XRP'].value, 0.5)
+        # BTC/USDT and ETH/USDT are used by the paths of every asset but are looked up only once
+        for exchange in self.exchanges:
+            self.assertTrue(exchange.lookups)
+            self.assertTrue(all(n_lookups == 1 for n_lookups in exchange.lookups.values()), exchange.lookups)
+        self.assertEqual(self.exchanges[0].lookups[('BTC', 'USDT')], 1)
+        self.assertEqual(self.exchanges[0].lookups[('ETH', 'USDT')], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from CryptoPrice.retrievers.MetaRetriever import MetaRetriever
+from CryptoPrice.retrievers.ValuationEngine import ValuationEngine, ValuationReport
+from CryptoPrice.utils.time import TIMEFRAME
+from tests.utils import DataDirTestCase, FakeKlineRetriever
+
+START_TIME = 1609459200  # 2021-01-01
+
+
+class TestValuationEngine(DataDirTestCase):
+    """
+    A single exchange where ADA and DOT only trade against BTC and ETH
+    """
+
+    def setUp(self):
+        super().setUp()
+        asset_prices = {'USDT': 1., 'BTC': 30000., 'ETH': 1000., 'ADA': 0.3, 'DOT': 10.}
+        pairs = [('BTC', 'USDT'), ('ETH', 'USDT'), ('ETH', 'BTC'), ('ADA', 'BTC'), ('ADA', 'ETH'), ('DOT', 'BTC')]
+        self.exchange = FakeKlineRetriever('fake', asset_prices, pairs)
+        self.retriever = MetaRetriever([self.exchange])
+        self.engine = ValuationEngine(self.retriever)
+        self.page_duration = self.exchange.max_klines_per_request * 60
+        self.window = self.exchange.closest_window
+
+    def tearDown(self):
+        self.exchange.db.close()
+
+    def test_plan_merges_windows(self):
+        legs = [('fake', 'BTC', 'USDT', START_TIME), ('fake', 'BTC', 'USDT', START_TIME + 1000),
+                ('fake', 'BTC', 'USDT', START_TIME + 1000),  # duplicated lookup
+                ('fake', 'BTC', 'USDT', START_TIME + self.page_duration - 2 * self.window),  # last one of the page
+                ('fake', 'BTC', 'USDT', START_TIME + self.page_duration)]
+        report = ValuationReport()
+        plan = self.engine.plan_fetches(legs, report)
+
+        # the first three timestamps fit in a single page, the last one starts a new window
+        first_start, second_start = START_TIME - self.window, START_TIME + self.page_duration - self.window
+        self.assertEqual(plan, [('fake', 'BTC', 'USDT', TIMEFRAME.m1, first_start, first_start + self.page_duration),
+                                ('fake', 'BTC', 'USDT', TIMEFRAME.m1, second_start, second_start + 2 * self.window)])
+        self.assertEqual((report.naive_api_calls, report.planned_api_calls), (5, 2))
+        for _, _, _, _, start_time, end_time in plan:
+            self.assertLessEqual(end_time - start_time, self.page_duration)
+
+    def test_plan_by_pair(self):
+        legs = [('fake', 'BTC', 'USDT', START_TIME), ('fake', 'ETH', 'USDT', START_TIME)]
+        self.assertEqual(sorted(window[1] for window in self.engine.plan_fetches(legs)), ['BTC', 'ETH'])
+
+    def test_plan_skips_local_legs(self):
+        self.exchange.db.add_covered_range('BTC', 'USDT', TIMEFRAME.m1, START_TIME - 3600, START_TIME + 3600)
+        legs = [('fake', 'BTC', 'USDT', START_TIME), ('fake', 'ETH', 'USDT', START_TIME)]
+        self.assertEqual([window[1] for window in self.engine.plan_fetches(legs)], ['ETH'])
+
+    def test_same_prices_as_get_mean_price(self):
+        requests = [('ADA', 'USDT', START_TIME), ('DOT', 'USDT', START_TIME + 600), ('ADA', 'USDT', START_TIME),
+                    ('BTC', 'BTC', START_TIME), ('XRP', 'USDT', START_TIME)]
+        report = self.engine.value(requests)
+
+        self.assertEqual(report.n_unique_requests, 4)
+        self.assertLess(report.planned_api_calls, report.naive_api_calls)
+        # the klines fetched by the plan answer all the lookups
+        self.assertEqual(self.exchange.online_calls, report.planned_api_calls)
+        for (asset, ref_asset, timestamp), meta_price in zip(requests, report.prices):
+            expected = self.retriever.get_mean_price(asset, ref_asset, timestamp)
+            if expected is None:
+                self.assertIsNone(meta_price)
+            else:
+                self.assertAlmostEqual(meta_price.value, expected.value)
+
+
+if __name__ == '__main__':
+    unittest.main()
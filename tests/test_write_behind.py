@@ -0,0 +1,69 @@
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from CryptoPrice.storage.DataBase import DataBase
+from CryptoPrice.storage.tables import Table
+
+
+class TestWriteBehind(unittest.TestCase):
+    """
+    A database with write-behind and a second connection to the same file, as a KlineRefresher would open
+    """
+
+    def setUp(self):
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        patcher = mock.patch('CryptoPrice.storage.DataBase.get_data_path', return_value=Path(data_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.table = Table("test_values", ["value"], ["INTEGER"], primary_key="key", primary_key_sql_type="INTEGER")
+        self.db = DataBase("test_write_behind")
+        self.db.create_table(self.table)
+        self.db.enable_write_behind(max_pending=1000, max_delay=0.2)
+        self.other_db = DataBase(self.db.name)
+        self.other_db.db_conn.execute("PRAGMA busy_timeout = 100")  # fail fast instead of waiting 5 seconds
+
+    def tearDown(self):
+        self.other_db.close()
+        self.db.close()
+
+    def test_idle_flush(self):
+        self.db.add_row(self.table, (1, 10))
+        self.assertEqual(self.other_db.get_all_rows(self.table), [])  # deferred
+
+        # the writer stays idle: the timer releases the lock after max_delay
+        time.sleep(0.5)
+        self.assertEqual(self.other_db.get_all_rows(self.table), [(1, 10)])
+        self.other_db.add_row(self.table, (2, 20))
+        self.assertEqual(self.db.get_all_rows(self.table), [(1, 10), (2, 20)])
+
+    def test_lock_held_until_flush(self):
+        self.db.add_row(self.table, (1, 10))
+        with self.assertRaises(sqlite3.OperationalError):
+            self.other_db.add_row(self.table, (2, 20))
+        self.db.flush()
+        self.other_db.add_row(self.table, (2, 20))
+
+    def test_no_partial_flush(self):
+        self.db.add_row(self.table, (1, 10))
+        self.db.add_row(self.table, (2, 20), auto_commit=False)  # a group of writes in progress
+
+        # the timer does not save a group of writes partially, the next commit flushes it
+        time.sleep(0.5)
+        self.assertEqual(self.other_db.get_all_rows(self.table), [])
+        self.db.add_row(self.table, (3, 30))
+        self.assertEqual(self.other_db.get_all_rows(self.table), [(1, 10), (2, 20), (3, 30)])
+
+    def test_max_pending(self):
+        self.db.enable_write_behind(max_pending=3, max_delay=60.)
+        for i in range(3):
+            self.db.add_row(self.table, (i, i))
+        self.assertEqual(len(self.other_db.get_all_rows(self.table)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Dict, List, Tuple
+from unittest import mock
+
+from CryptoPrice.common.prices import Kline
+from CryptoPrice.common.trade import TradingPair
+from CryptoPrice.retrievers.KlineRetriever import KlineRetriever
+from CryptoPrice.utils.time import TIMEFRAME
+
+
+class DataDirTestCase(unittest.TestCase):
+    """
+    Test case whose databases are created in a temporary directory instead of the user data directory
+    """
+
+    def setUp(self):
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        patcher = mock.patch('CryptoPrice.storage.DataBase.get_data_path', return_value=Path(data_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class FakeKlineRetriever(KlineRetriever):
+    """
+    Offline KlineRetriever with a kline every minute at a constant price per asset: the price of a trading pair is
+    the ratio of the prices of its assets, so all the trading paths between two assets give the same price
+    """
+
+    def __init__(self, name: str, asset_prices: Dict[str, float], pairs: List[Tuple[str, str]]):
+        self.asset_prices = asset_prices
+        self.pairs = pairs
+        self.online_calls = 0
+        self.lookups: Dict[Tuple[str, str], int] = {}  # number of get_closest_price calls per trading pair
+        super().__init__(name, TIMEFRAME.m1)
+
+    def get_supported_pairs(self) -> List[TradingPair]:
+        return [TradingPair(f"{asset}{ref_asset}", asset, ref_asset, self.name) for asset, ref_asset in self.pairs]
+
+    def get_closest_price(self, asset: str, ref_asset: str, timestamp: int, budget=None, tolerance=None):
+        self.lookups[(asset, ref_asset)] = self.lookups.get((asset, ref_asset), 0) + 1
+        return super().get_closest_price(asset, ref_asset, timestamp, budget, tolerance)
+
+    def _get_klines_online(self, asset: str, ref_asset: str, timeframe: TIMEFRAME, start_time: int,
+                           end_time: int) -> List[Kline]:
+        self.online_calls += 1
+        duration = timeframe.value * 60
+        price = self.asset_prices[asset] / self.asset_prices[ref_asset]
+        first_time = start_time + (-start_time) % duration
+        open_times = range(first_time, end_time, duration)[:self.max_klines_per_request]
+        return [Kline(t, price, price, price, price, asset, ref_asset, timeframe, self.name) for t in open_times]